@@ -0,0 +1,49 @@
+""" compare the eager, lazy and compact act parsers
+
+run with `python -m benchmarks.bench_act` from the repository root
+"""
+import io
+import os
+import timeit
+import tracemalloc
+from pygrf.act import ACT
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_act')
+
+
+def measure(data, **kwargs):
+    """ the memory used by an act file on top of its data """
+    tracemalloc.start()
+    act = ACT(io.BytesIO(data), **kwargs)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del act
+    return size
+
+
+def main():
+    for name in sorted(os.listdir(DATA_DIR)):
+        with open(os.path.join(DATA_DIR, name), 'rb') as f:
+            data = f.read()
+        eager = ACT(io.BytesIO(data)).animations
+        assert ACT(io.BytesIO(data), compact=True).animations == eager
+        assert tuple(ACT(io.BytesIO(data), lazy=True).animations) == eager
+
+        number = 200
+        fast = timeit.timeit(lambda: ACT(io.BytesIO(data)), number=number)
+        lazy = timeit.timeit(
+            lambda: ACT(io.BytesIO(data), lazy=True).animations[0],
+            number=number)
+        compact = timeit.timeit(
+            lambda: ACT(io.BytesIO(data), compact=True), number=number)
+        print('{}: eager {:.3f}ms, lazy with one animation {:.3f}ms '
+              '({:.1f}x), compact {:.3f}ms'.format(
+                  name, fast / number * 1000, lazy / number * 1000,
+                  fast / lazy, compact / number * 1000))
+        print('{}: {} bytes as tuples, {} bytes compact'.format(
+            name, measure(data), measure(data, compact=True)))
+
+
+if __name__ == '__main__':
+    main()
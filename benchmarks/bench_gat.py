@@ -0,0 +1,84 @@
+""" compare the gat parser with the original tile-by-tile parser
+
+run with `python -m benchmarks.bench_gat` from the repository root
+"""
+import io
+import random
+import struct
+import timeit
+import tracemalloc
+from pygrf.gat import GAT, parse_header, parse_tile, split_tiles
+
+
+class LegacyGAT(io.BytesIO):
+    """ the original gat parser, which keeps every tile as 20 bytes """
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.header = parse_header(self)
+        self.tile_data = split_tiles(self)
+        self.tiles = {}
+
+    def __getitem__(self, coordinates):
+        x, y = coordinates
+        if not (x, y) in self.tiles:
+            tile_data = self.tile_data[x + y * self.header.width]
+            self.tiles[(x, y)] = parse_tile(tile_data)
+        return self.tiles[(x, y)]
+
+
+def make_gat(width, height, seed=0):
+    """ a gat file with random heights and mostly walkable tiles """
+    rng = random.Random(seed)
+    tiles = b''.join(
+        struct.pack('<ffffI', *(rng.uniform(-50, 0) for _ in range(4)),
+                    rng.choice((0, 0, 0, 1, 5)))
+        for _ in range(width * height))
+    return b'GRAT\x01\x02' + struct.pack('<II', width, height) + tiles
+
+
+def measure(cls, data):
+    """ the memory used by a gat file with every tile read once """
+    tracemalloc.start()
+    gat = cls(data)
+    for y in range(gat.header.height):
+        for x in range(gat.header.width):
+            gat[x, y]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del gat
+    return size
+
+
+def main():
+    data = make_gat(400, 400)
+    number = 5
+    legacy = timeit.timeit(lambda: LegacyGAT(data), number=number)
+    fast = timeit.timeit(lambda: GAT(io.BytesIO(data)), number=number)
+    print('400x400 load: legacy {:.1f}ms, new {:.1f}ms ({:.1f}x)'.format(
+        legacy / number * 1000, fast / number * 1000, legacy / fast))
+    print('400x400 memory with every tile read: legacy {:.1f}MB, '
+          'new {:.1f}MB'.format(measure(LegacyGAT, data) / 1e6,
+                                measure(lambda d: GAT(io.BytesIO(d)), data)
+                                / 1e6))
+
+
+    gat = GAT(io.BytesIO(data))
+    per_tile = timeit.timeit(lambda: [
+        gat[x, y].type in (0, 3)
+        for y in range(gat.height) for x in range(gat.width)], number=1)
+    bitmap = timeit.timeit(gat.walkable, number=number) / number
+    print('400x400 walkability: per tile {:.1f}ms, bitmap {:.1f}ms '
+          '({:.0f}x)'.format(per_tile * 1000, bitmap * 1000,
+                             per_tile / bitmap))
+    per_tile = timeit.timeit(lambda: [
+        gat[x, y] for y in range(100, 200) for x in range(100, 200)],
+        number=1)
+    region = timeit.timeit(lambda: gat[100:200, 100:200],
+                           number=number) / number
+    print('100x100 region: per tile {:.1f}ms, slice {:.2f}ms ({:.0f}x)'
+          .format(per_tile * 1000, region * 1000, per_tile / region))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+""" compare the pathfinder with a tuple keyed A* over GAT tiles
+
+run with `python -m benchmarks.bench_path` from the repository root
+"""
+import heapq
+import io
+import random
+import timeit
+from pygrf.gat import GAT
+from pygrf.path import LineOfSight, Pathfinder, Regions
+from benchmarks.bench_gat import make_gat
+
+
+def naive_find_path(gat, start, goal):
+    """ A* the way it is usually written, with tuple keys and tile lookups """
+    def walkable(x, y):
+        return 0 <= x < gat.width and 0 <= y < gat.height and \
+            gat[x, y].type in (0, 3)
+
+    def estimate(x, y):
+        dx, dy = abs(x - goal[0]), abs(y - goal[1])
+        return 10 * max(dx, dy) + 4 * min(dx, dy)
+
+    costs = {start: 0}
+    parents = {start: None}
+    heap = [(estimate(*start), start)]
+    while heap:
+        _, (x, y) = heapq.heappop(heap)
+        if (x, y) == goal:
+            path = []
+            node = goal
+            while node is not None:
+                path.append(node)
+                node = parents[node]
+            return path[::-1]
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if (dx, dy) == (0, 0) or not walkable(x + dx, y + dy):
+                    continue
+                if dx and dy and not (walkable(x + dx, y)
+                                      and walkable(x, y + dy)):
+                    continue
+                cost = costs[x, y] + (14 if dx and dy else 10)
+                neighbour = (x + dx, y + dy)
+                if cost < costs.get(neighbour, cost + 1):
+                    costs[neighbour] = cost
+                    parents[neighbour] = (x, y)
+                    heapq.heappush(
+                        heap, (cost + estimate(*neighbour), neighbour))
+    return None
+
+
+def main():
+    gat = GAT(io.BytesIO(make_gat(400, 400)))
+    pathfinder = Pathfinder.from_gat(gat, cache_size=0)
+    walkable = gat.walkable()
+    rng = random.Random(0)
+    tiles = [(x, y) for y in range(gat.height) for x in range(gat.width)
+             if walkable[x, y]]
+    pairs = [(rng.choice(tiles), rng.choice(tiles)) for _ in range(10)]
+
+    naive = timeit.timeit(
+        lambda: [naive_find_path(gat, *pair) for pair in pairs], number=1)
+    fast = timeit.timeit(lambda: pathfinder.find_paths(pairs), number=1)
+    print('400x400, {} paths: naive {:.1f}ms, pathfinder {:.1f}ms ({:.1f}x)'
+          .format(len(pairs), naive * 1000, fast * 1000, naive / fast))
+
+    cached = Pathfinder.from_gat(gat)
+    cached.find_paths(pairs)
+    hits = timeit.timeit(lambda: cached.find_paths(pairs), number=100) / 100
+    print('400x400, {} cached paths: {:.3f}ms'.format(
+        len(pairs), hits * 1000))
+
+    sight = LineOfSight.from_gat(gat)
+    shots = []
+    for _ in range(20000):
+        # skills reach up to 14 tiles away
+        x, y = rng.randrange(14, 386), rng.randrange(14, 386)
+        shots.append(((x, y), (x + rng.randrange(-14, 15),
+                               y + rng.randrange(-14, 15))))
+    seconds = timeit.timeit(lambda: sight.visible_many(shots), number=1)
+    print('400x400, {} line of sight checks: {:.1f}ms ({:.0f}/s)'.format(
+        len(shots), seconds * 1000, len(shots) / seconds))
+
+    seconds = timeit.timeit(lambda: Regions.from_gat(gat), number=1)
+    regions = Regions.from_gat(gat)
+    print('400x400, labelling {} regions: {:.1f}ms'.format(
+        regions.count, seconds * 1000))
+    pairs = [(rng.choice(tiles), rng.choice(tiles)) for _ in range(100000)]
+    reachable = regions.reachable
+    seconds = timeit.timeit(
+        lambda: [reachable(start, goal) for start, goal in pairs], number=1)
+    print('400x400, {} reachability checks: {:.1f}ms'.format(
+        len(pairs), seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+""" compare the spr rle decoder with the original per-byte decoder
+
+run with `python -m benchmarks.bench_rle` from the repository root
+"""
+import random
+import timeit
+from pygrf.spr import pack_rle, unpack_rle
+
+
+def legacy_unpack_rle(data):
+    """ the original decoder, which walks the data one byte at a time """
+    out = []
+    index = 0
+    while index < len(data):
+        if data[index] == 0:
+            index += 1
+            out += [0] * data[index]
+        else:
+            out.append(data[index])
+        index += 1
+    return out
+
+
+def make_frame(width, height, seed=0):
+    """ a palette frame with a transparent background around a shape """
+    rng = random.Random(seed)
+    rows = []
+    for y in range(height):
+        left = rng.randrange(width // 4)
+        right = width - rng.randrange(width // 4)
+        row = bytes(left) + bytes(rng.choices(range(1, 256), k=right - left))
+        rows.append(row + bytes(width - right))
+    return b''.join(rows)
+
+
+def main():
+    for width, height in ((32, 32), (128, 128), (400, 400)):
+        frame = make_frame(width, height)
+        packed = pack_rle(frame)
+        assert bytes(legacy_unpack_rle(packed)) == frame
+        assert unpack_rle(packed, len(frame)) == frame
+
+        number = max(1, 200000 // (width * height))
+        legacy = timeit.timeit(lambda: legacy_unpack_rle(packed), number=number)
+        fast = timeit.timeit(lambda: unpack_rle(packed, len(frame)),
+                             number=number)
+        encode = timeit.timeit(lambda: pack_rle(frame), number=number)
+        print('{}x{}: legacy {:.3f}ms, unpack {:.3f}ms ({:.0f}x), '
+              'pack {:.3f}ms'.format(
+                  width, height, legacy / number * 1000,
+                  fast / number * 1000, legacy / fast,
+                  encode / number * 1000))
+
+
+if __name__ == '__main__':
+    main()
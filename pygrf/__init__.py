@@ -1,2 +1,3 @@
-from .api import open_grf, open_act, open_gat, open_spr
+from .api import open_grf, open_act, open_gat, open_spr, open_pal
+from .grf import diff
 from .exceptions import PyGRFError, GRFParseError, FileParseError
\ No newline at end of file
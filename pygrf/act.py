@@ -1,25 +1,61 @@
+import array
 import contextlib
 import io
 import struct
+import sys
+from collections import abc
+from operator import eq
 from collections import namedtuple
-from typing import NamedTuple, Tuple
-#from .exceptions import FileParseError 
-from .util import get_version
+from typing import List, NamedTuple, Tuple
+from .exceptions import FileParseError
+from .util import ENCODINGS, decode_name, get_version
 from .graphics import Point, Color, Vector2
 
 
+header_struct = struct.Struct('<H10x')
+frame_struct = struct.Struct('<32xi')
+ranges_struct = struct.Struct('<32si')
+int_struct = struct.Struct('<i')
+float_struct = struct.Struct('<f')
+trigger_struct = struct.Struct('<40s')
+anchor_struct = struct.Struct('<iiii')
+
+# layer structures for each version: see unpack_layers
+layer_100_struct = struct.Struct('<iiII')
+layer_200_struct = struct.Struct('<iiII4Bffi')
+layer_204_struct = struct.Struct('<iiII4Bfffi')
+layer_205_struct = struct.Struct('<iiII4Bfffiii')
+
+# the types of spr image a layer can refer to
+PAL_IMAGE = 0
+RGB_IMAGE = 1
+
+
 class Layer(NamedTuple):
     offset: Point
     index: int
-    flipped: bool
+    # the flags as they are stored, the image is flipped when they are set
+    flipped: int
     color: Color = Color(255, 255, 255, 255)
     zoom: Vector2 = Vector2(1.0, 1.0)
     angle: float = 0.0
+    image_type: int = PAL_IMAGE
+    width: int = 0
+    height: int = 0
+
+
+class Anchor(NamedTuple):
+    x: int
+    y: int
+    attribute: int = 0
+    unused: int = 0
 
 
 class Frame(NamedTuple):
     layers: Tuple[Layer]
     trigger: int = -1
+    anchors: Tuple[Anchor, ...] = ()
+    ranges: bytes = bytes(32)
 
 
 class Animation(NamedTuple):
@@ -27,10 +63,32 @@ class Animation(NamedTuple):
     interval: float = 4.0
 
 
-def parse_layer(stream):
-    """ Parse a layer of a frame of an animation in an ACT file.
+class Trailer(NamedTuple):
+    """ the triggers and intervals stored after the animations """
+    triggers: Tuple[str, ...]
+    # the trigger names as they are stored, without their null padding
+    raw_triggers: Tuple[bytes, ...]
+    intervals: List[float]
+    # how many of the intervals are stored, the rest are the default
+    interval_count: int
 
-    :param stream: the act file to parse from
+
+def get_layer_struct(version):
+    """ get the precompiled structure of a layer for an act version """
+    if version >= 0x205:
+        return layer_205_struct
+    if version >= 0x204:
+        return layer_204_struct
+    if version >= 0x200:
+        return layer_200_struct
+    return layer_100_struct
+
+
+def unpack_layers(data, version):
+    """ Unpack a list of layers in a single pass.
+
+    :param data: a buffer holding only the layers
+    :param version: the act version
 
     Each layer consists of the following information:
 
@@ -44,116 +102,462 @@ def parse_layer(stream):
     zoom    4     float   0x200    image scale
     zoom y  4     float   0x204    image scale for y axis
     angle   4     float   0x200    rotation of the image
-    unused  4     int32   0x200
-    unused  8     int32   0x205
+    type    4     int32   0x200    0 for pal images, 1 for rgb images
+    width   4     int32   0x205    width of the image
+    height  4     int32   0x205    height of the image
     ======  ====  ======  =======  ============================
-    """ 
-    x, y, index, flags = struct.unpack('<iiII', stream.read(16))
-    offset = Point(x, y)
-    layer = Layer(offset, index, flags != 0)
-
-    if stream.version >= 0x200:
-        color = Color(*struct.unpack('<4B', stream.read(4)))
-        layer = layer._replace(color=color)
-
-    if stream.version >= 0x204:
-        zoom = Vector2(*struct.unpack('<ff', stream.read(8)))
-        layer = layer._replace(zoom=zoom)
-    elif stream.version >= 0x200:
-        zoom, = struct.unpack('<f', stream.read(4))
-        layer = layer._replace(zoom=Vector2(zoom, zoom))
 
-    if stream.version >= 0x200:
-        angle, = struct.unpack('<f', stream.read(4))
-        layer = layer._replace(angle=angle)
-
-    if stream.version >= 0x205:
-        stream.read(12)
-    elif stream.version >= 0x200:
-        stream.read(4)
-
-    return layer
+    Every layer is built exactly once, straight from the unpacked values.
+    """
+    values = get_layer_struct(version).iter_unpack(data)
+    # skip the generated namedtuple constructors, which are slow python
+    # functions, and build the tuples directly
+    new = tuple.__new__
+    if version >= 0x205:
+        return tuple(
+            new(Layer, (new(Point, (x, y)), index, flags,
+                        new(Color, (r, g, b, a)),
+                        new(Vector2, (zoom_x, zoom_y)), angle, image_type,
+                        width, height))
+            for (x, y, index, flags, r, g, b, a, zoom_x, zoom_y, angle,
+                 image_type, width, height) in values
+        )
+    if version >= 0x204:
+        return tuple(
+            new(Layer, (new(Point, (x, y)), index, flags,
+                        new(Color, (r, g, b, a)),
+                        new(Vector2, (zoom_x, zoom_y)), angle, image_type,
+                        0, 0))
+            for (x, y, index, flags, r, g, b, a, zoom_x, zoom_y, angle,
+                 image_type) in values
+        )
+    if version >= 0x200:
+        return tuple(
+            new(Layer, (new(Point, (x, y)), index, flags,
+                        new(Color, (r, g, b, a)),
+                        new(Vector2, (zoom, zoom)), angle, image_type,
+                        0, 0))
+            for x, y, index, flags, r, g, b, a, zoom, angle, image_type
+            in values
+        )
+    return tuple(
+        Layer(new(Point, (x, y)), index, flags)
+        for x, y, index, flags in values
+    )
 
 
-def parse_frame(stream):
-    """ Parse a frame from an ACT file.
+def unpack_frame(view, offset, version):
+    """ Unpack a frame from a buffer.
 
-    :param stream: the act file to parse from
+    :param view: a memoryview of the act file
+    :param offset: the offset of the frame
+    :param version: the act version
+    :returns: (frame, offset of the next frame)
 
     A frame is structured as follows:
 
     =============  =====  =======  ===================================
-    field          type   version  type   purpose
+    field          type   version  purpose
     =============  =====  =======  ===================================
-    unused                         32 bytes of "range rects"
+    ranges                0x100    32 bytes of "range rects"
     layer count    int32  0x100    the number of layers in the frame
     layers         list   0x100    the layers of the frame
     trigger        int32  0x200    a trigger id, or -1 for none
     anchor count   int32  0x203    the number of anchors for the frame
     anchors        list   0x203    the anchors for the frame
     =============  =====  =======  ===================================
+
+    The range rects are unused, but kept as bytes so that the frame can be
+    written back unchanged. Each anchor is 4 unused bytes followed by an
+    int32 x, y and attribute.
+    """
+    ranges, layer_count = ranges_struct.unpack_from(view, offset)
+    offset += ranges_struct.size
+    end = offset + layer_count * get_layer_struct(version).size
+    layers = unpack_layers(view[offset:end], version)
+    offset = end
+    trigger = -1
+    if version >= 0x200:
+        trigger, = int_struct.unpack_from(view, offset)
+        offset += int_struct.size
+    anchors = ()
+    if version >= 0x203:
+        count, = int_struct.unpack_from(view, offset)
+        offset += int_struct.size
+        end = offset + anchor_struct.size * count
+        anchors = unpack_anchors(view[offset:end])
+        offset = end
+    return Frame(layers, trigger, anchors, ranges), offset
+
+
+def unpack_anchors(data):
+    """ Unpack the anchors of a frame, see unpack_frame. """
+    return tuple(
+        Anchor(x, y, attribute, unused)
+        for unused, x, y, attribute in anchor_struct.iter_unpack(data))
+
+
+def unpack_trailer(view, offset, count, version):
+    """ Unpack the triggers and intervals after the animations.
+
+    :param view: a memoryview of the whole act file
+    :param offset: the offset just after the last animation
+    :param count: the number of animations
+    :param version: the act version
+
+    Triggers are stored from version 0x201, as an int32 count followed by
+    a null-terminated string in a 40-byte buffer for each trigger. The
+    names are decoded like filenames, trying each of the known encodings.
+    Intervals are stored from version 0x202, as a float for each animation.
+    Animations without a stored interval keep the default of 4.0.
     """
-    layer_count, = struct.unpack('<32xi', stream.read(36))
-    layers = tuple(parse_layer(stream) for _ in range(layer_count))
-    if stream.version >= 0x200:
-        trigger, = struct.unpack('<i', stream.read(4))
-    else:
-        trigger = -1
-    # don't know how to use anchor data, so skip it
-    if stream.version >= 0x203:
-        count, = struct.unpack('<i', stream.read(4))
-        stream.read(16 * count)
-    return Frame(layers, trigger)
-
-
-def parse_animation(stream):
-    """ Parse an animation from an ACT file.
-
-    :param stream: the act file to parse from
-
-    An animation is made up of a single int32 containing the number of frames
-    followed by a list of frames. An animation starts with a default interval
-    of 4.0, which will be modified later by the list of animation intervals
-    at the end of the act file.
+    raw_triggers = ()
+    if version >= 0x201:
+        trigger_count, = int_struct.unpack_from(view, offset)
+        offset += int_struct.size
+        raw_triggers = tuple(
+            name.strip(b'\x00')
+            for name, in trigger_struct.iter_unpack(
+                view[offset:offset + trigger_count * trigger_struct.size])
+        )
+        offset += trigger_count * trigger_struct.size
+    triggers = tuple(decode_name(name) for name in raw_triggers)
+
+    intervals = [4.0] * count
+    available = 0
+    if version >= 0x202:
+        available = min(count, (len(view) - offset) // 4)
+        intervals[:available] = struct.unpack_from(
+            '<{}f'.format(available), view, offset)
+    return Trailer(triggers, raw_triggers, intervals, available)
+
+
+def unpack_act(view, version):
+    """ Unpack the animations and triggers of an act file.
+
+    :param view: a memoryview of the whole act file
+    :param version: the act version
+    :returns: (animations, trailer)
+
+    Each animation is an int32 frame count followed by its frames, see
+    unpack_frame. The animations are followed by the triggers and
+    intervals, see unpack_trailer. The buffer is read directly with
+    precompiled structures rather than as a stream.
     """
-    frame_count, = struct.unpack('<i', stream.read(4))
-    frames = (parse_frame(stream) for _ in range(frame_count))
-    return Animation(tuple(frames), 4.0)
+    count, = header_struct.unpack_from(view, 4)
+    offset = 4 + header_struct.size
+
+    frame_lists = []
+    for _ in range(count):
+        frame_count, = int_struct.unpack_from(view, offset)
+        offset += int_struct.size
+        frames = []
+        for _ in range(frame_count):
+            frame, offset = unpack_frame(view, offset, version)
+            frames.append(frame)
+        frame_lists.append(tuple(frames))
+
+    trailer = unpack_trailer(view, offset, count, version)
+    animations = tuple(
+        Animation(frames, interval)
+        for frames, interval in zip(frame_lists, trailer.intervals)
+    )
+    return animations, trailer
+
+
+def scan_act(view, version):
+    """ Find where every frame of an act file starts.
 
-def parse_triggers(stream):
-    """ Parse the triggers defined in an act file.
+    :param view: a memoryview of the whole act file
+    :param version: the act version
+    :returns: (frame offsets, frame starts, offset after the animations)
 
-    :param stream: the act file to parse from
+    Only the counts are read, so the layers are skipped over without being
+    unpacked. The frames of animation i are found at
+    offsets[starts[i]:starts[i + 1]].
+    """
+    count, = header_struct.unpack_from(view, 4)
+    offset = 4 + header_struct.size
+    layer_size = get_layer_struct(version).size
+
+    offsets = array.array('L')
+    starts = array.array('L', (0,))
+    for _ in range(count):
+        frame_count, = int_struct.unpack_from(view, offset)
+        offset += int_struct.size
+        for _ in range(frame_count):
+            offsets.append(offset)
+            layer_count, = frame_struct.unpack_from(view, offset)
+            offset += frame_struct.size + layer_count * layer_size
+            if version >= 0x200:
+                offset += int_struct.size
+            if version >= 0x203:
+                anchor_count, = int_struct.unpack_from(view, offset)
+                offset += int_struct.size + 16 * anchor_count
+        starts.append(len(offsets))
+
+    if offset > len(view):
+        raise struct.error('animations extend past the end of the data')
+    return offsets, starts, offset
+
+
+class LazyAnimations(abc.Sequence):
+    """ the animations of an act file, unpacked when they are first used
+
+    Each animation is unpacked at most once. Single frames can be unpacked
+    without the rest of their animation with frame(). The triggers and
+    intervals are read as soon as the file has been scanned.
+    """
 
-    The triggers are stored in a list in the act file after the animations.
-    It starts with an int32 holding the trigger count. After that is a list
-    of trigger strings. Each string is held in a 40-byte buffer and
-    null-terminated.
+    def __init__(self, view, version):
+        self.view = view
+        self.version = version
+        self.offsets, self.starts, end = scan_act(view, version)
+        self.trailer = unpack_trailer(view, end, len(self), version)
+        self.triggers = self.trailer.triggers
+        self.intervals = self.trailer.intervals
+        self.cache = {}
+
+    def __len__(self) -> int:
+        return len(self.starts) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self[i] for i in range(*index.indices(len(self))))
+        index = self.check_index(index)
+        animation = self.cache.get(index)
+        if animation is None:
+            frames = tuple(self.unpack_frame(offset) for offset in
+                           self.frame_offsets(index))
+            animation = Animation(frames, self.intervals[index])
+            self.cache[index] = animation
+        return animation
+
+    def check_index(self, index: int) -> int:
+        """ validate an animation index, allowing negative indices """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('animation index out of range')
+        return index
+
+    def frame_offsets(self, index: int):
+        """ the offsets of the frames of an animation """
+        return self.offsets[self.starts[index]:self.starts[index + 1]]
+
+    def frame_count(self, index: int) -> int:
+        """ the number of frames in an animation, without unpacking it """
+        index = self.check_index(index)
+        return self.starts[index + 1] - self.starts[index]
+
+    def frame(self, index: int, frame: int) -> Frame:
+        """ get a single frame of an animation """
+        index = self.check_index(index)
+        animation = self.cache.get(index)
+        if animation is not None:
+            return animation.frames[frame]
+        return self.unpack_frame(self.frame_offsets(index)[frame])
+
+    def unpack_frame(self, offset: int) -> Frame:
+        try:
+            frame, _ = unpack_frame(self.view, offset, self.version)
+        except struct.error:
+            raise FileParseError('invalid act data')
+        return frame
+
+
+class Span(abc.Sequence):
+    """ a range of the items in a CompactAnimations
+
+    The items are created from the columns as they are accessed. A span
+    compares equal to any sequence with equal items, such as the tuples of
+    an eagerly parsed act file.
     """
-    count, = struct.unpack('<i', stream.read(4))
-    return tuple(stream.read(40).strip(b'\x00').decode() for _ in range(count))
+    __slots__ = ('start', 'stop', 'item')
+
+    def __init__(self, start: int, stop: int, item):
+        self.start = start
+        self.stop = stop
+        self.item = item
 
+    def __len__(self) -> int:
+        return self.stop - self.start
 
-def parse_intervals(stream):
-    """ Parse animation intervals for a stream
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self[i] for i in range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('index out of range')
+        return self.item(self.start + index)
 
-    :param stream: the act file to read from
+    def __eq__(self, other):
+        if not isinstance(other, abc.Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(map(eq, self, other))
 
-    The animation delays are stored at the end of the file in a simple list.
+    def __repr__(self) -> str:
+        return repr(tuple(self))
+
+
+class CompactAnimations(Span):
+    """ the animations of an act file, stored in typed array columns
+
+    Every layer of the file is stored as one row across the layer columns,
+    so a layer takes 41 bytes instead of five python objects. Frames are
+    stored as the offset of their first layer and anchor, their trigger and
+    their range rects, and animations as the offset of their first frame
+    and their interval.
+
+    Indexing returns Animation and Frame tuples whose frames and layers are
+    Spans, and Layers are only created when they are accessed.
     """
-    intervals = struct.iter_unpack('<f', stream.read())
-    stream.animations = tuple(
-        animation._replace(interval=interval[0])
-        for animation, interval in zip(stream.animations, intervals)
-    )
+
+    def __init__(self, view, version):
+        self.x = array.array('i')
+        self.y = array.array('i')
+        self.index = array.array('I')
+        self.flags = array.array('I')
+        self.red = array.array('B')
+        self.green = array.array('B')
+        self.blue = array.array('B')
+        self.alpha = array.array('B')
+        self.zoom_x = array.array('f')
+        self.zoom_y = array.array('f')
+        self.angle = array.array('f')
+        self.image_type = array.array('i')
+        self.width = array.array('i')
+        self.height = array.array('i')
+        self.layer_starts = array.array('L', (0,))
+        self.frame_triggers = array.array('i')
+        self.frame_ranges = bytearray()
+        # four values for each anchor, as they are stored in the file
+        self.anchors = array.array('i')
+        self.anchor_starts = array.array('L', (0,))
+        self.frame_starts = array.array('L', (0,))
+
+        count, = header_struct.unpack_from(view, 4)
+        offset = 4 + header_struct.size
+        layer_size = get_layer_struct(version).size
+        for _ in range(count):
+            frame_count, = int_struct.unpack_from(view, offset)
+            offset += int_struct.size
+            for _ in range(frame_count):
+                ranges, layer_count = ranges_struct.unpack_from(view, offset)
+                offset += ranges_struct.size
+                end = offset + layer_count * layer_size
+                if end > len(view):
+                    raise struct.error('layers extend past the end')
+                self.frame_ranges += ranges
+                self.add_layers(view[offset:end], version)
+                offset = end
+                trigger = -1
+                if version >= 0x200:
+                    trigger, = int_struct.unpack_from(view, offset)
+                    offset += int_struct.size
+                if version >= 0x203:
+                    anchor_count, = int_struct.unpack_from(view, offset)
+                    offset += int_struct.size
+                    end = offset + anchor_struct.size * anchor_count
+                    if end > len(view):
+                        raise struct.error('anchors extend past the end')
+                    self.anchors.frombytes(view[offset:end])
+                    if sys.byteorder == 'big':
+                        self.anchors.byteswap()
+                    offset = end
+                self.frame_triggers.append(trigger)
+                self.layer_starts.append(len(self.x))
+                self.anchor_starts.append(len(self.anchors) // 4)
+            self.frame_starts.append(len(self.frame_triggers))
+
+        self.trailer = unpack_trailer(view, offset, count, version)
+        self.triggers = self.trailer.triggers
+        self.intervals = array.array('f', self.trailer.intervals)
+        super().__init__(0, count, self.animation)
+
+    def add_layers(self, data, version):
+        """ append the layers of a frame to the columns """
+        columns = tuple(zip(*get_layer_struct(version).iter_unpack(data)))
+        if not columns:
+            return
+        count = len(columns[0])
+        self.x.extend(columns[0])
+        self.y.extend(columns[1])
+        self.index.extend(columns[2])
+        self.flags.extend(columns[3])
+        if version >= 0x200:
+            self.red.extend(columns[4])
+            self.green.extend(columns[5])
+            self.blue.extend(columns[6])
+            self.alpha.extend(columns[7])
+            self.zoom_x.extend(columns[8])
+            if version >= 0x204:
+                self.zoom_y.extend(columns[9])
+                angle = 10
+            else:
+                self.zoom_y.extend(columns[8])
+                angle = 9
+            self.angle.extend(columns[angle])
+            self.image_type.extend(columns[angle + 1])
+        else:
+            opaque = b'\xff' * count
+            for column in (self.red, self.green, self.blue, self.alpha):
+                column.frombytes(opaque)
+            for column in (self.zoom_x, self.zoom_y):
+                column.extend([1.0] * count)
+            self.angle.extend([0.0] * count)
+            self.image_type.extend([PAL_IMAGE] * count)
+        if version >= 0x205:
+            self.width.extend(columns[12])
+            self.height.extend(columns[13])
+        else:
+            self.width.extend([0] * count)
+            self.height.extend([0] * count)
+
+    def animation(self, index: int) -> Animation:
+        """ build the animation with an index from the columns """
+        frames = Span(self.frame_starts[index], self.frame_starts[index + 1],
+                      self.frame)
+        return Animation(frames, self.intervals[index])
+
+    def frame(self, index: int) -> Frame:
+        """ build the frame with an index in the whole file """
+        layers = Span(self.layer_starts[index], self.layer_starts[index + 1],
+                      self.layer)
+        anchors = self.anchors[self.anchor_starts[index] * 4:
+                               self.anchor_starts[index + 1] * 4]
+        anchors = tuple(
+            Anchor(anchors[i + 1], anchors[i + 2], anchors[i + 3], anchors[i])
+            for i in range(0, len(anchors), 4))
+        ranges = bytes(self.frame_ranges[index * 32:(index + 1) * 32])
+        return Frame(layers, self.frame_triggers[index], anchors, ranges)
+
+    def layer(self, index: int) -> Layer:
+        """ build the layer with an index in the whole file """
+        new = tuple.__new__
+        return new(Layer, (
+            new(Point, (self.x[index], self.y[index])),
+            self.index[index],
+            self.flags[index],
+            new(Color, (self.red[index], self.green[index],
+                        self.blue[index], self.alpha[index])),
+            new(Vector2, (self.zoom_x[index], self.zoom_y[index])),
+            self.angle[index],
+            self.image_type[index],
+            self.width[index],
+            self.height[index],
+        ))
 
 
 class ACT(io.BytesIO):
 
-    def __init__(self, stream):
+    def __init__(self, stream, lazy: bool = False, compact: bool = False):
         """ Parse an ACT file.
 
         :param stream: the source binary stream
+        :param lazy: only unpack animations when they are accessed
+        :param compact: store the layers in array columns
 
         An act file begins with a simple header arranged in the following
         manner:
@@ -173,12 +577,229 @@ class ACT(io.BytesIO):
         - list of animations
         - list of sound files/events
         - list of intervals for each animation
+
+        When lazy is set, the file is scanned once to find where each
+        animation and frame starts and the animations are a LazyAnimations
+        sequence. The triggers and intervals are always read immediately.
+        The unused header bytes are kept as reserved, the trigger names as
+        they are stored as raw_triggers and the number of stored intervals
+        as interval_count, so that the file can be written back unchanged
+        with build_act.
+
+        When compact is set, the animations are a CompactAnimations
+        sequence, which uses far less memory. The two can't be combined.
         """
+        if lazy and compact:
+            raise ValueError('an act file can not be both lazy and compact')
         stream.seek(0)
-        super().__init__(stream.read())
+        data = stream.read()
+        super().__init__(data)
 
         self.version = get_version(self, b'AC')
-        count, = struct.unpack('<H10x', self.read(12))
-        self.animations = tuple(parse_animation(self) for _ in range(count))
-        self.triggers = parse_triggers(self)
-        parse_intervals(self)
\ No newline at end of file
+        self.reserved = data[6:16]
+        view = memoryview(data)
+        try:
+            if lazy:
+                self.animations = LazyAnimations(view, self.version)
+                trailer = self.animations.trailer
+            elif compact:
+                self.animations = CompactAnimations(view, self.version)
+                trailer = self.animations.trailer
+            else:
+                self.animations, trailer = unpack_act(view, self.version)
+        except struct.error:
+            raise FileParseError('invalid act data')
+        self.triggers = trailer.triggers
+        self.raw_triggers = trailer.raw_triggers
+        self.interval_count = trailer.interval_count
+
+
+# the number of milliseconds in each unit of an animation interval. the
+# interval stored for an animation is a count of the game client's
+# animation ticks, and the client advances act animations every 24ms, so an
+# interval of 4.0 shows each frame for 96ms.
+FRAME_DELAY = 24
+
+
+class TimedTrigger(NamedTuple):
+    """ a trigger and when it happens in an animation """
+    time: float
+    frame: int
+    name: str
+
+
+class Timeline:
+    """ the timing of every animation of an act file
+
+    Every frame of an animation is shown for the interval of the animation
+    multiplied by the frame delay, so the frame at any time is found with a
+    single division. The triggers of an animation are only collected when
+    they are first asked for, and frame counts and intervals are read
+    without unpacking the animation where the act file allows it, so a lazy
+    act file is not unpacked up front.
+    """
+
+    def __init__(self, act, frame_delay: float = FRAME_DELAY):
+        """
+        :param act: the act file, which may be lazy or compact
+        :param frame_delay: the milliseconds in each unit of an interval
+        """
+        self.animations = act.animations
+        self.triggers = act.triggers
+        self.frame_delay = frame_delay
+        # the timed triggers of each animation, by animation index
+        self.cache = {}
+
+    def __len__(self) -> int:
+        return len(self.animations)
+
+    def frame_time(self, animation: int) -> float:
+        """ the time in milliseconds each frame of an animation is shown """
+        intervals = getattr(self.animations, 'intervals', None)
+        if intervals is None:
+            interval = self.animations[animation].interval
+        else:
+            interval = intervals[animation]
+        return interval * self.frame_delay
+
+    def frame_count(self, animation: int) -> int:
+        """ the number of frames in an animation """
+        if isinstance(self.animations, LazyAnimations):
+            return self.animations.frame_count(animation)
+        return len(self.animations[animation].frames)
+
+    def events(self, animation: int) -> Tuple[TimedTrigger, ...]:
+        """ the triggers of an animation, with the time they happen """
+        events = self.cache.get(animation)
+        if events is None:
+            frame_time = self.frame_time(animation)
+            triggers = self.triggers
+            events = tuple(
+                TimedTrigger(index * frame_time, index,
+                             triggers[frame.trigger]
+                             if frame.trigger < len(triggers) else '')
+                for index, frame in enumerate(
+                    self.animations[animation].frames)
+                if frame.trigger >= 0
+            )
+            self.cache[animation] = events
+        return events
+
+    def duration(self, animation: int) -> float:
+        """ the time in milliseconds to play every frame of an animation """
+        return self.frame_time(animation) * self.frame_count(animation)
+
+    def frame_at(self, animation: int, time: float,
+                 loop: bool = True) -> int:
+        """ get the index of the frame shown at a time
+
+        :param animation: the index of the animation
+        :param time: the milliseconds since the animation started
+        :param loop: whether the animation repeats, otherwise it stays on
+                     its last frame
+        """
+        count = self.frame_count(animation)
+        frame_time = self.frame_time(animation)
+        if count == 0 or frame_time <= 0:
+            return 0
+        frame = int(max(time, 0) // frame_time)
+        if loop:
+            return frame % count
+        return min(frame, count - 1)
+
+    def triggers_between(self, animation: int, start: float,
+                         end: float) -> Tuple[TimedTrigger, ...]:
+        """ get the triggers of an animation from start up to end
+
+        the times are within a single play of the animation.
+        """
+        return tuple(event for event in self.events(animation)
+                     if start <= event.time < end)
+
+
+# the image index of a layer that shows nothing
+NO_IMAGE = 0xFFFFFFFF
+
+
+def build_act(animations, triggers=(), version: int = 0x205,
+              reserved: bytes = bytes(10), interval_count: int = None
+              ) -> bytes:
+    """ build the data of an act file, the reverse of parsing it
+
+    Everything that is parsed is written back, including the range rects,
+    anchors, layer flags and the unused header bytes, so an act file that is
+    parsed and built again is unchanged.
+
+    :param animations: the animations, which may be lazy or compact
+    :param triggers: the trigger names, from version 0x201. names given as
+                     bytes are written as they are, and strings are encoded
+                     with the first of the known encodings.
+    :param version: the version of the file, from 0x200 to 0x205
+    :param reserved: the 10 unused bytes of the header
+    :param interval_count: how many intervals to write, from version 0x202.
+                           by default there is one for every animation.
+    """
+    if not 0x200 <= version <= 0x205:
+        raise ValueError('unsupported version')
+    if len(reserved) != 10:
+        raise ValueError('reserved must be 10 bytes')
+    if interval_count is None:
+        interval_count = len(animations)
+    if not 0 <= interval_count <= len(animations):
+        raise ValueError('there is at most one interval for each animation')
+    layer_struct = get_layer_struct(version)
+
+    parts = [b'AC', struct.pack('<HH', version, len(animations)), reserved]
+    for animation in animations:
+        parts.append(int_struct.pack(len(animation.frames)))
+        for frame in animation.frames:
+            parts.append(ranges_struct.pack(frame.ranges, len(frame.layers)))
+            for layer in frame.layers:
+                values = [*layer.offset, layer.index, int(layer.flipped),
+                          *layer.color, layer.zoom.x]
+                if version >= 0x204:
+                    values.append(layer.zoom.y)
+                values += [layer.angle, layer.image_type]
+                if version >= 0x205:
+                    values += [layer.width, layer.height]
+                parts.append(layer_struct.pack(*values))
+            parts.append(int_struct.pack(frame.trigger))
+            if version >= 0x203:
+                parts.append(int_struct.pack(len(frame.anchors)))
+                parts.extend(
+                    anchor_struct.pack(anchor.unused, anchor.x, anchor.y,
+                                       anchor.attribute)
+                    for anchor in frame.anchors)
+
+    if version >= 0x201:
+        parts.append(int_struct.pack(len(triggers)))
+        for name in triggers:
+            encoded = name if isinstance(name, bytes) else \
+                name.encode(ENCODINGS[0])
+            if len(encoded) > trigger_struct.size:
+                raise ValueError('trigger names must fit in 40 bytes')
+            parts.append(trigger_struct.pack(encoded))
+    if version >= 0x202:
+        parts.extend(float_struct.pack(animations[index].interval)
+                     for index in range(interval_count))
+    return b''.join(parts)
+
+
+def is_visible(layer: Layer) -> bool:
+    """ whether a layer shows an image that isn't fully transparent """
+    return layer.index != NO_IMAGE and layer.color.a != 0
+
+
+def strip_layers(animations) -> Tuple[Animation, ...]:
+    """ remove the layers that can't be seen from animations
+
+    Frames are kept even when they have no layers left, since they still
+    take up time in their animation.
+    """
+    return tuple(
+        animation._replace(frames=tuple(
+            frame._replace(layers=tuple(filter(is_visible, frame.layers)))
+            for frame in animation.frames
+        ))
+        for animation in animations
+    )
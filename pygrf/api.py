@@ -1,4 +1,6 @@
+import mmap
 from . import grf, gat, spr, act
+from .graphics import Palette
 
 
 def open_grf(filename: str) -> grf.GRF:
@@ -16,23 +18,45 @@ def open_gat(filename: str) -> gat.GAT:
 
     :param filename: the path to the gat file
     """
-    return gat.GAT(open(filename, 'rb'))
+    with open(filename, 'rb') as f:
+        return gat.GAT(f)
 
 
 def open_spr(filename: str) -> spr.SPR:
     """
     Open a SPR file
 
+    The file is memory mapped rather than read, so only the parts of it that
+    are used are loaded.
+
     :param filename: the path to the spr file
     """
     with open(filename, 'rb') as f:
-        return spr.SPR(f.read())
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            data = f.read()
+        return spr.SPR(data)
+
+
+def open_pal(filename: str) -> Palette:
+    """
+    Open a PAL file
+
+    :param filename: the path to the pal file
+    """
+    with open(filename, 'rb') as f:
+        return Palette.from_pal(f.read())
 
 
-def open_act(filename: str) -> act.ACT:
+def open_act(filename: str, lazy: bool = False,
+             compact: bool = False) -> act.ACT:
     """
     Open a ACT file
 
     :param filename: the path to the act file
+    :param lazy: only unpack animations when they are accessed
+    :param compact: store the layers in array columns
     """
-    return act.ACT(open(filename, 'rb'))
+    return act.ACT(open(filename, 'rb'), lazy, compact)
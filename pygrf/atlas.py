@@ -0,0 +1,185 @@
+""" texture atlases for spr files """
+import struct
+import zlib
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+from .exceptions import FileParseError
+from .graphics import Palette, RGBAImage
+
+
+SIGNATURE = b'ATLS'
+VERSION = 1
+
+header_struct = struct.Struct('<4sHHHHI')
+region_struct = struct.Struct('<IhHHHHhhHH')
+page_struct = struct.Struct('<I')
+
+
+class Region(NamedTuple):
+    """ where an image of a spr file is stored in an atlas
+
+    when the image is trimmed, left and top are the position of the stored
+    pixels within the original image.
+    """
+    page: int
+    x: int
+    y: int
+    width: int
+    height: int
+    left: int = 0
+    top: int = 0
+    original_width: int = 0
+    original_height: int = 0
+
+
+class Atlas:
+    """ images of a spr file packed into one or more RGBA pages """
+
+    def __init__(self, page_width: int, page_height: int,
+                 pages: Sequence[RGBAImage], regions: Dict[int, Region]):
+        self.page_width = page_width
+        self.page_height = page_height
+        self.pages = list(pages)
+        self.regions = regions
+
+    def __len__(self) -> int:
+        return len(self.regions)
+
+    def __getitem__(self, index: int) -> Region:
+        return self.regions[index]
+
+    def uv(self, index: int) -> Tuple[float, float, float, float]:
+        """ the (u0, v0, u1, v1) texture coordinates of an image """
+        region = self.regions[index]
+        return (region.x / self.page_width,
+                region.y / self.page_height,
+                (region.x + region.width) / self.page_width,
+                (region.y + region.height) / self.page_height)
+
+    def save(self, stream):
+        """ write the atlas to a binary stream so it can be cached
+
+        the pages are stored zlib compressed.
+        """
+        stream.write(header_struct.pack(
+            SIGNATURE, VERSION, self.page_width, self.page_height,
+            len(self.pages), len(self.regions)))
+        for index, region in sorted(self.regions.items()):
+            stream.write(region_struct.pack(index, *region))
+        for page in self.pages:
+            compressed = zlib.compress(page)
+            stream.write(page_struct.pack(len(compressed)))
+            stream.write(compressed)
+
+    @classmethod
+    def load(cls, stream) -> 'Atlas':
+        """ read an atlas written by save """
+        try:
+            signature, version, page_width, page_height, page_count, count = \
+                header_struct.unpack(stream.read(header_struct.size))
+        except struct.error:
+            raise FileParseError('invalid atlas header')
+        if signature != SIGNATURE:
+            raise FileParseError('invalid signature')
+        if version != VERSION:
+            raise FileParseError('unsupported version')
+
+        regions = {}
+        for _ in range(count):
+            index, *region = region_struct.unpack(
+                stream.read(region_struct.size))
+            regions[index] = Region(*region)
+        pages = []
+        for _ in range(page_count):
+            size, = page_struct.unpack(stream.read(page_struct.size))
+            data = zlib.decompress(stream.read(size))
+            pages.append(RGBAImage(page_width, page_height, data))
+        return cls(page_width, page_height, pages, regions)
+
+
+def pack(sizes: Sequence[Tuple[int, int]], page_width: int, page_height: int,
+         padding: int = 1) -> List[Tuple[int, int, int]]:
+    """ pack rectangles into pages using shelves
+
+    the rectangles are placed from tallest to shortest, left to right, in
+    rows as tall as their first rectangle. a new page is started when a row
+    does not fit.
+
+    :param sizes: the (width, height) of each rectangle
+    :param page_width: the width of each page
+    :param page_height: the height of each page
+    :param padding: the space to leave between rectangles
+    :returns: the (page, x, y) of each rectangle
+    """
+    positions = [(0, 0, 0)] * len(sizes)
+    order = sorted(range(len(sizes)),
+                   key=lambda i: (-sizes[i][1], -sizes[i][0]))
+    page, x, y, shelf = 0, 0, 0, 0
+    for index in order:
+        width, height = sizes[index]
+        if width == 0 or height == 0:
+            continue
+        if width > page_width or height > page_height:
+            raise ValueError('image is larger than the atlas page')
+        if x + width > page_width:
+            # start a new shelf
+            x, y, shelf = 0, y + shelf + padding, 0
+        if y + height > page_height:
+            # start a new page
+            page, x, y, shelf = page + 1, 0, 0, 0
+        positions[index] = (page, x, y)
+        x += width + padding
+        shelf = max(shelf, height)
+    return positions
+
+
+def build_atlas(spr, page_size: int = 1024, trim_images: bool = True,
+                merge: bool = True, padding: int = 1,
+                palette: Palette = None) -> Atlas:
+    """ pack every image of a spr file into an atlas
+
+    :param spr: the spr file
+    :param page_size: the width and height of each page
+    :param trim_images: whether to remove transparent borders from images
+    :param merge: whether identical images share a region
+    :param padding: the space to leave between images
+    :param palette: the palette to render pal images with
+    """
+    images = []
+    bounds = []
+    unique = {}
+    sources = []
+    for index in range(len(spr)):
+        image = spr.render(index, palette)
+        if trim_images:
+            left, top, right, bottom = image.visible_bounds()
+        else:
+            left, top, right, bottom = 0, 0, image.width, image.height
+        cropped = image.crop(left, top, right, bottom)
+        key = (cropped.width, cropped.height, bytes(cropped))
+        if merge and key in unique:
+            sources.append(unique[key])
+        else:
+            unique[key] = len(images)
+            sources.append(len(images))
+            images.append(cropped)
+        bounds.append((left, top, image.width, image.height))
+
+    sizes = [(image.width, image.height) for image in images]
+    positions = pack(sizes, page_size, page_size, padding)
+    page_count = max((page + 1 for page, _, _ in positions), default=0)
+
+    pages = [bytearray(page_size * page_size * 4) for _ in range(page_count)]
+    stride = page_size * 4
+    for image, (page, x, y) in zip(images, positions):
+        row_size = image.width * 4
+        for row in range(image.height):
+            start = (y + row) * stride + x * 4
+            pages[page][start:start + row_size] = image.row(row)
+
+    regions = {}
+    for index, source in enumerate(sources):
+        page, x, y = positions[source]
+        width, height = sizes[source]
+        regions[index] = Region(page, x, y, width, height, *bounds[index])
+    pages = [RGBAImage(page_size, page_size, page) for page in pages]
+    return Atlas(page_size, page_size, pages, regions)
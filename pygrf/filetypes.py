@@ -1,4 +1,5 @@
 """ This module handles file headers and determining file types """
+import io
 import struct
 from collections import namedtuple
 from .exceptions import FileParseError as ParseError
@@ -14,13 +15,14 @@ def parse_header(data: bytes, signature: bytes) -> Header:
     Parse the header of a file.
 
     data
-        The raw bytes data for the file.
+        The raw data for the file, as any object supporting the buffer
+        protocol.
     signature
         The file type signature expected to be found at the beginning of the
         file. If the signature is missing or incorrect, an error will be
         raised.
     """
-    if not data.startswith(signature):
+    if bytes(data[:len(signature)]) != signature:
         raise ParseError('invalid signature')
     if len(signature) == 2:
         return Header(*_short.unpack_from(data), _short.size)
@@ -37,14 +39,19 @@ def parse(stream):
     parser.
     """
     stream.seek(0)
-    data = stream.read()
-    if data.startswith(b'AC'):
+    signature = stream.read(4)
+    if signature.startswith(b'AC'):
         from .act import ACT
         return ACT(stream)
-    elif data.startswith(b'SP'):
+    elif signature.startswith(b'SP'):
         from .spr import SPR
-        return SPR(data)
-    elif data.startswith(b'GRAT'):
+        # share the data of in-memory streams instead of copying it. unlike
+        # getbuffer, getvalue returns the bytes the stream was created with
+        if isinstance(stream, io.BytesIO):
+            return SPR(stream.getvalue())
+        stream.seek(0)
+        return SPR(stream.read())
+    elif signature.startswith(b'GRAT'):
         from .gat import GAT
         return GAT(stream)
     return stream
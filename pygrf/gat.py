@@ -1,7 +1,8 @@
+import array
 import collections
 import functools
-import io
 import struct
+import sys
 from .exceptions import FileParseError
 
 
@@ -13,6 +14,22 @@ Header = collections.namedtuple('GATHeader', ('width', 'height'))
 Tile = collections.namedtuple('Tile', (
     'bottom_left', 'bottom_right', 'top_left', 'top_right', 'type', 'altitude'
 ))
+Tiles = collections.namedtuple('GATTiles', (
+    'bottom_left', 'bottom_right', 'top_left', 'top_right', 'types'
+))
+
+# flips the sign bit in the last byte of a little-endian float
+NEGATE = bytes(byte ^ 0x80 for byte in range(256))
+
+# the tile types that can be walked on and shot over: see parse_tile
+WALKABLE_TYPES = frozenset((0, 3))
+SNIPABLE_TYPES = frozenset((0, 3, 4, 5))
+
+# for each bit, maps a byte of 0 or 1 to that bit being set, and back
+SET_BIT = tuple(bytes((value & 1) << bit for value in range(256))
+                for bit in range(8))
+GET_BIT = tuple(bytes((value >> bit) & 1 for value in range(256))
+                for bit in range(8))
 
 
 def parse_header(stream):
@@ -115,37 +132,231 @@ def parse_tile(data):
     return Tile(*heights, type_flag, altitude)
 
 
-class GAT(io.BytesIO):
+def unpack_tiles(data):
+    """unpack every tile into typed array columns in one pass
+
+    :param data: the tile data of a gat file, a multiple of 20 bytes
+    :returns: Tiles with a float array for each height and an array of
+              type flags, ordered like the tiles in the file
+
+    The tiles are structured as described in parse_tile, and the heights are
+    inverted in the same way. Rather than parsing each tile, the data is
+    split into columns with strided slices. The type flags are stored in the
+    smallest unsigned type that holds them, which is a single byte for the
+    types of every known map.
+    """
+    data = bytearray(data)
+    # invert every height by flipping its sign bit
+    for offset in (3, 7, 11, 15):
+        signs = data[offset::TILE_LENGTH]
+        data[offset::TILE_LENGTH] = signs.translate(NEGATE)
+
+    # every value of a tile is 4 bytes long
+    view = memoryview(data).cast('I')
+    stride = TILE_LENGTH // 4
+    columns = []
+    for index in range(4):
+        column = array.array('f')
+        column.frombytes(view[index::stride].tobytes())
+        if sys.byteorder == 'big':
+            column.byteswap()
+        columns.append(column)
+    view.release()
+
+    # the types are little-endian, so when the high bytes of every type are
+    # zero the low bytes alone hold the values
+    count = len(data) // TILE_LENGTH
+    zeros = [data[offset::TILE_LENGTH].count(0) == count
+             for offset in (17, 18, 19)]
+    for typecode, size in (('B', 1), ('H', 2), ('I', 4)):
+        if all(zeros[size - 1:]):
+            break
+    packed = bytearray(count * size)
+    for byte in range(size):
+        packed[byte::size] = data[16 + byte::TILE_LENGTH]
+    types = array.array(typecode)
+    types.frombytes(packed)
+    if sys.byteorder == 'big':
+        types.byteswap()
+    columns.append(types)
+    return Tiles(*columns)
+
+
+def type_flags(types, allowed):
+    """flag the tiles that have one of the allowed types
+
+    :param types: an array of tile types
+    :param allowed: the set of types to flag
+    :returns: bytes with 1 for each tile with an allowed type, 0 otherwise
+    """
+    if types and max(types) > 255:
+        return bytes(value in allowed for value in types)
+    # the types are small, so only the lowest byte of each one matters
+    low = 0 if sys.byteorder == 'little' else types.itemsize - 1
+    table = bytes(value in allowed for value in range(256))
+    return types.tobytes()[low::types.itemsize].translate(table)
+
+
+class Bitmap:
+    """a packed grid holding one bit for every tile of a map
+
+    Bits are stored row by row from the first tile, 8 tiles to a byte with
+    the first tile in the lowest bit.
+    """
+
+    def __init__(self, width, height, data):
+        self.width = width
+        self.height = height
+        self.data = bytes(data)
+
+    @classmethod
+    def from_flags(cls, width, height, flags):
+        """pack a bitmap from one byte of 0 or 1 for every tile"""
+        flags = bytes(flags) + bytes(-len(flags) % 8)
+        packed = 0
+        for bit in range(8):
+            # the bits of each group never overlap, so they can be added
+            packed += int.from_bytes(
+                flags[bit::8].translate(SET_BIT[bit]), 'little')
+        return cls(width, height, packed.to_bytes(len(flags) // 8, 'little'))
+
+    def __getitem__(self, coordinates):
+        x, y = coordinates
+        if x >= self.width or y >= self.height or x < 0 or y < 0:
+            raise IndexError
+        index = x + y * self.width
+        return bool(self.data[index >> 3] >> (index & 7) & 1)
+
+    def __len__(self):
+        return self.width * self.height
+
+    def count(self):
+        """the number of bits that are set"""
+        return bin(int.from_bytes(self.data, 'little')).count('1')
+
+    def unpack(self):
+        """unpack the bitmap into one byte of 0 or 1 for every tile"""
+        flags = bytearray(len(self.data) * 8)
+        for bit in range(8):
+            flags[bit::8] = self.data.translate(GET_BIT[bit])
+        return bytes(flags[:len(self)])
+
+
+class TileGrid:
+    """a grid of tiles kept in the typed array columns of self.columns"""
+
+    def tile(self, x, y):
+        """build the Tile at (x, y) from the columns"""
+        # make sure the coordinates are within bounds
+        if x >= self.width or y >= self.height or x < 0 or y < 0:
+            raise IndexError
+        index = x + y * self.width
+        columns = self.columns
+        heights = (columns.bottom_left[index], columns.bottom_right[index],
+                   columns.top_left[index], columns.top_right[index])
+        # the altitude is the average of all the heights
+        return Tile(*heights, columns.types[index], sum(heights) / 4)
+
+    def walkable(self):
+        """a bitmap of the tiles that can be walked on"""
+        return Bitmap.from_flags(self.width, self.height, type_flags(
+            self.columns.types, WALKABLE_TYPES))
+
+    def snipable(self):
+        """a bitmap of the tiles that can be shot over"""
+        return Bitmap.from_flags(self.width, self.height, type_flags(
+            self.columns.types, SNIPABLE_TYPES))
+
+
+class Region(TileGrid):
+    """a rectangle of tiles copied out of a gat file
+
+    Coordinates are relative to the top left tile of the region, which is
+    at (x, y) in the map.
+    """
+
+    def __init__(self, x, y, width, height, columns):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.columns = columns
+
+    def __getitem__(self, coordinates):
+        return self.tile(*coordinates)
+
+
+class GAT(TileGrid):
 
     def __init__(self, stream):
-        """parse a gat file from the given stream"""
-        # read the entire data stream and use its data as our own
-        stream.seek(0)
-        super().__init__(stream.read())
+        """parse a gat file from the given stream
 
-        self.header = parse_header(self)
-        self.tile_data = split_tiles(self)
+        The tiles are unpacked into the typed array columns of self.columns
+        and Tiles are only built when accessed. The data of the file is not
+        kept, so a gat takes 17 bytes per tile: 16 for the heights and 1 for
+        the type.
+        """
+        self.header = parse_header(stream)
+        data = stream.read()
 
         # make sure the number of tiles is correct
-        if len(self.tile_data) != (self.width * self.height):
+        size = len(data)
+        if -(-size // TILE_LENGTH) != (self.width * self.height):
             raise FileParseError('invalid tile count')
         # make sure the last tile has a correct length
-        if len(self.tile_data[-1]) != TILE_LENGTH:
+        if size % TILE_LENGTH:
             raise FileParseError('invalid tile length')
-        self.tiles = {}
-
-        # reset the stream to 0, as if the stream was just opened
-        self.seek(0)
+        self.columns = unpack_tiles(data)
 
     def __getitem__(self, coordinates):
         x, y = coordinates
-        # make sure the coordinates are within bounds
-        if x >= self.width or y >= self.height or x < 0 or y < 0:
+        if isinstance(x, slice) or isinstance(y, slice):
+            # single coordinates must be within bounds, as they are for tiles
+            if not isinstance(x, slice):
+                if not 0 <= x < self.width:
+                    raise IndexError
+                x = slice(x, x + 1)
+            if not isinstance(y, slice):
+                if not 0 <= y < self.height:
+                    raise IndexError
+                y = slice(y, y + 1)
+            return self.region(x, y)
+        return self.tile(x, y)
+
+    def region(self, columns, rows):
+        """copy a rectangle of tiles, as with gat[x0:x1, y0:y1]
+
+        :param columns: a slice of the x coordinates to copy
+        :param rows: a slice of the y coordinates to copy
+        :returns: a Region holding its own copy of the columns
+        """
+        if columns.step not in (None, 1) or rows.step not in (None, 1):
+            raise ValueError('regions can not have a step')
+        left, right, _ = columns.indices(self.width)
+        top, bottom, _ = rows.indices(self.height)
+        right, bottom = max(left, right), max(top, bottom)
+        copied = []
+        for column in self.columns:
+            copy = array.array(column.typecode)
+            for y in range(top, bottom):
+                start = y * self.width
+                copy += column[start + left:start + right]
+            copied.append(copy)
+        return Region(left, top, right - left, bottom - top, Tiles(*copied))
+
+    def row(self, y):
+        """the columns of a single row of tiles, left to right"""
+        if not 0 <= y < self.height:
+            raise IndexError
+        start = y * self.width
+        return Tiles(*(column[start:start + self.width]
+                       for column in self.columns))
+
+    def column(self, x):
+        """the columns of a single column of tiles, top to bottom"""
+        if not 0 <= x < self.width:
             raise IndexError
-        if not (x, y) in self.tiles:
-            tile_data = self.tile_data[x + y * self.width]
-            self.tiles[(x, y)] = parse_tile(tile_data)
-        return self.tiles[(x, y)]
+        return Tiles(*(column[x::self.width] for column in self.columns))
 
     @property
     def width(self):
@@ -1,5 +1,8 @@
 """ types used in computer graphics """
-from typing import NamedTuple, Sequence
+import struct
+from collections import abc
+from itertools import starmap
+from typing import NamedTuple, Sequence, Tuple
 
 
 class Point(NamedTuple):
@@ -56,3 +59,305 @@ class Image(NamedTuple):
     width: int
     height: int
     pixels: Sequence[Color]
+
+
+class Pixels(abc.Sequence):
+    """ a read-only sequence of colors over a packed RGBA buffer
+
+    colors are only created as they are accessed
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.data) // 4
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError
+        return Color(*self.data[index * 4:index * 4 + 4])
+
+    def __iter__(self):
+        return starmap(Color, struct.iter_unpack('4B', self.data))
+
+
+class PackedImage(bytes):
+    """ a 2D image that is itself a bytes object holding its pixel data
+
+    two images are only equal when they are of the same type and have the
+    same dimensions and data, so an 8x2 image never equals a 2x8 image of
+    the same data. an image still equals the plain bytes of its data.
+    """
+
+    width: int
+    height: int
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, PackedImage) and (
+                type(other) is not type(self) or
+                other.width != self.width or other.height != self.height):
+            return False
+        return bytes.__eq__(self, other)
+
+    def __ne__(self, other) -> bool:
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self) -> int:
+        # equal to the hash of the data, as images equal their plain bytes
+        return bytes.__hash__(self)
+
+    def __repr__(self) -> str:
+        return '{}(width={}, height={})'.format(
+            type(self).__name__, self.width, self.height)
+
+
+class RGBAImage(PackedImage):
+    """ a 2D image stored as packed RGBA data, 4 bytes per pixel
+
+    the image is itself a bytes object holding the pixel data, row by row
+    from the top, so it supports the buffer protocol and can be handed to
+    other libraries without any conversion.
+
+    unlike the Image tuple, it does not unpack into (width, height,
+    pixels). use the width, height and pixels attributes instead.
+    """
+
+    def __new__(cls, width: int, height: int, data=None):
+        if data is None:
+            data = bytes(width * height * 4)
+        image = super().__new__(cls, data)
+        if len(image) != width * height * 4:
+            raise ValueError('pixel data does not match image dimensions')
+        image.width = width
+        image.height = height
+        return image
+
+    def __getnewargs__(self):
+        return (self.width, self.height, bytes(self))
+
+    @property
+    def pixels(self) -> Sequence[Color]:
+        """ the pixels of the image as colors """
+        return Pixels(self)
+
+    def row(self, y: int) -> memoryview:
+        """ a view of the pixel data of a single row """
+        stride = self.width * 4
+        return memoryview(self)[y * stride:(y + 1) * stride]
+
+    def flipped(self) -> 'RGBAImage':
+        """ a copy of the image, flipped vertically """
+        data = flip_rows(self, self.width * 4, self.height)
+        return type(self)(self.width, self.height, data)
+
+    def visible_bounds(self) -> Tuple[int, int, int, int]:
+        """ the bounds of the pixels that are not fully transparent """
+        return visible_bounds(self[3::4], self.width, self.height)
+
+    def crop(self, left: int, top: int, right: int,
+             bottom: int) -> 'RGBAImage':
+        """ copy a rectangle of the image """
+        data = crop_rows(self, self.width * 4, left * 4, top, right * 4,
+                         bottom)
+        return type(self)(right - left, bottom - top, data)
+
+
+def flip_rows(data, stride: int, height: int) -> bytes:
+    """ reverse the order of the rows in packed pixel data
+
+    :param data: the pixel data
+    :param stride: the number of bytes in each row
+    :param height: the number of rows
+    """
+    view = memoryview(data)
+    rows = [view[y * stride:(y + 1) * stride] for y in range(height)]
+    return b''.join(reversed(rows))
+
+
+class Palette(bytes):
+    """ a palette of 256 colors stored as packed RGBA data
+
+    palettes are bytes objects, so they are hashable and can be used to key
+    caches of images rendered with them. like the lists of colors palettes
+    used to be, their length is the number of colors, and indexing or
+    iterating over a palette gives Colors. slices give the packed bytes, and
+    bytes(palette) gives all of them.
+    """
+
+    size = 256
+
+    def __new__(cls, data=None):
+        if data is None:
+            data = bytes(cls.size * 4)
+        palette = super().__new__(cls, data)
+        if bytes.__len__(palette) != cls.size * 4:
+            raise ValueError('a palette must have {} colors'.format(cls.size))
+        return palette
+
+    def __repr__(self) -> str:
+        return '{}()'.format(type(self).__name__)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self):
+        return iter(self.colors)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return bytes.__getitem__(self, index)
+        if index < 0:
+            index += self.size
+        if index < 0 or index >= self.size:
+            raise IndexError('palette index out of range')
+        return Color(*bytes.__getitem__(self, slice(index * 4, index * 4 + 4)))
+
+    @classmethod
+    def from_colors(cls, colors: Sequence[Color]) -> 'Palette':
+        """ create a palette from up to 256 colors """
+        colors = list(colors)
+        colors += [Color(0, 0, 0, 0)] * (cls.size - len(colors))
+        return cls(b''.join(bytes(color) for color in colors))
+
+    @classmethod
+    def from_pal(cls, data) -> 'Palette':
+        """ create a palette from the data of a .pal file
+
+        a .pal file holds 256 colors of 4 bytes each: red, green, blue and an
+        unused byte. sprites use the same format for their embedded palettes.
+        every color is opaque except for the background, at index 0, which is
+        transparent.
+        """
+        data = bytearray(data)
+        if len(data) != cls.size * 4:
+            raise ValueError('a palette must have {} colors'.format(cls.size))
+        data[3::4] = b'\xff' * cls.size
+        data[3] = 0
+        return cls(data)
+
+    def to_pal(self) -> bytes:
+        """ the data of the palette in the .pal file format """
+        data = bytearray(self)
+        data[3::4] = bytes(self.size)
+        return bytes(data)
+
+    @property
+    def colors(self) -> Sequence[Color]:
+        """ the colors of the palette """
+        return Pixels(memoryview(self))
+
+
+class IndexedImage(PackedImage):
+    """ a 2D image stored as one palette index per pixel
+
+    the image is a bytes object holding the indices, row by row from the top.
+    the same indices can be rendered with any palette.
+    """
+
+    def __new__(cls, width: int, height: int, data=None,
+                palette: Palette = None):
+        if data is None:
+            data = bytes(width * height)
+        image = super().__new__(cls, data)
+        if len(image) != width * height:
+            raise ValueError('pixel data does not match image dimensions')
+        image.width = width
+        image.height = height
+        image.palette = palette
+        return image
+
+    def __getnewargs__(self):
+        return (self.width, self.height, bytes(self), self.palette)
+
+    @property
+    def pixels(self) -> Sequence[Color]:
+        """ the pixels of the image as colors from its own palette """
+        return self.apply().pixels
+
+    def apply(self, palette: Palette = None) -> RGBAImage:
+        """ render the image with a palette
+
+        :param palette: the palette to use instead of the image's own
+        """
+        if palette is None:
+            palette = self.palette
+        if palette is None:
+            raise ValueError('no palette to apply')
+        data = expand_palette(self, palette)
+        return RGBAImage(self.width, self.height, data)
+
+    def visible_bounds(self) -> Tuple[int, int, int, int]:
+        """ the bounds of the pixels that are not the background, index 0 """
+        return visible_bounds(self, self.width, self.height)
+
+    def crop(self, left: int, top: int, right: int,
+             bottom: int) -> 'IndexedImage':
+        """ copy a rectangle of the image """
+        data = crop_rows(self, self.width, left, top, right, bottom)
+        return type(self)(right - left, bottom - top, data, self.palette)
+
+
+def visible_bounds(plane, width: int,
+                   height: int) -> Tuple[int, int, int, int]:
+    """ find the bounds of the non-zero bytes of a plane of pixels
+
+    :param plane: one byte per pixel, such as indices or alpha values
+    :param width: the width of the plane
+    :param height: the height of the plane
+    :returns: (left, top, right, bottom), all 0 when every byte is zero
+    """
+    plane = bytes(plane)
+    left, top, right, bottom = width, height, 0, 0
+    for y in range(height):
+        row = plane[y * width:(y + 1) * width]
+        stripped = row.rstrip(b'\x00')
+        if not stripped:
+            continue
+        top = min(top, y)
+        bottom = y + 1
+        left = min(left, width - len(row.lstrip(b'\x00')))
+        right = max(right, len(stripped))
+    if bottom == 0:
+        return (0, 0, 0, 0)
+    return (left, top, right, bottom)
+
+
+def crop_rows(data, stride: int, left: int, top: int, right: int,
+              bottom: int) -> bytes:
+    """ copy a rectangle out of packed pixel data
+
+    :param data: the pixel data
+    :param stride: the number of bytes in each row
+    :param left: the first byte of each row to copy
+    :param top: the first row to copy
+    :param right: the byte after the last byte of each row to copy
+    :param bottom: the row after the last row to copy
+    """
+    view = memoryview(data)
+    return b''.join(
+        view[y * stride + left:y * stride + right] for y in range(top, bottom)
+    )
+
+
+def expand_palette(indices, palette: Sequence[Color]) -> bytearray:
+    """ expand palette indices into packed RGBA data
+
+    each channel is looked up for every pixel at once with bytes.translate,
+    and written into every 4th byte of the output with a slice assignment.
+
+    :param indices: one palette index per pixel
+    :param palette: a Palette, or up to 256 colors
+    """
+    indices = bytes(indices)
+    if not isinstance(palette, Palette):
+        palette = Palette.from_colors(palette)
+    data = bytearray(len(indices) * 4)
+    for channel in range(4):
+        data[channel::4] = indices.translate(palette[channel::4])
+    return data
@@ -1,13 +1,21 @@
+import bisect
 import collections
+import concurrent.futures
 import contextlib
+import fnmatch
 import functools
+import hashlib
 import io
 import itertools
 import os
+import re
 import struct
+import threading
+import weakref
 import zlib
 from . import filetypes
-from .exceptions import GRFParseError
+from .exceptions import FileParseError, GRFParseError
+from .util import ENCODINGS, decode_name
 
 
 # the grf versions that are supported
@@ -17,14 +25,17 @@ SUPPORTED_VERSIONS = [0x200]
 HEADER_OFFSET = 0
 HEADER_LENGTH = 46
 
-# which encodings to try before giving up on a filename
-ENCODINGS = ['euc_kr', 'johab', 'uhc', 'mskanji']
-
 FILE_HEADER_LENGTH = 17
 
 # file flags
 FILE_IS_FILE = 1
 
+# how much decompressed data lies between checkpoints in a stream
+CHECKPOINT_INTERVAL = 256 * 1024
+
+# how much compressed data is read from the archive at a time
+READ_CHUNK_SIZE = 64 * 1024
+
 
 Header = collections.namedtuple('GRFHeader', (
     'allow_encryption', 'index_offset', 'file_count', 'version'
@@ -36,16 +47,22 @@ FileHeader = collections.namedtuple('GRFFileHeader', (
 ))
 
 
-def decode_name(name):
-    """decode a name using multiple encodings"""
-    # try with each known encoding
-    for encoding in ENCODINGS:
-        with contextlib.suppress(UnicodeDecodeError):
-            return name.decode(encoding)
-    # upon failure, replace failed characters with their hex representation
-    name = name.decode(errors='backslashreplace')
-    name = name.replace('\\x', '')
-    return name
+Changes = collections.namedtuple('GRFChanges', (
+    'added', 'removed', 'modified'
+))
+
+
+# the status of a file in a diff between two archives
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+
+Change = collections.namedtuple('GRFChange', ('status', 'filename'))
+
+
+Duplicates = collections.namedtuple('GRFDuplicates', (
+    'digest', 'size', 'files', 'wasted'
+))
 
 
 def parse_name(name):
@@ -61,6 +78,15 @@ def parse_name(name):
     return os.path.join(*path)
 
 
+def encode_name(filename):
+    """encode a filename into the raw filename data stored in the index"""
+    path = '\\'.join(['data'] + filename.split(os.path.sep))
+    for encoding in ENCODINGS:
+        with contextlib.suppress(UnicodeEncodeError):
+            return path.encode(encoding)
+    raise ValueError('unable to encode filename: {}'.format(filename))
+
+
 def parse_header(stream):
     """parse the grf header
 
@@ -223,6 +249,140 @@ def parse_file_header(data):
     return FileHeader(compressed, archived, real, flag, position)
 
 
+def read_archived(stream, header):
+    """read the data of a file as it is stored in the archive
+
+    :param stream: the grf data stream
+    :param header: the parsed header of the file
+    """
+    if header.real_size == 0:
+        return b''
+    stream.seek(header.position)
+    return stream.read(header.archived_size)
+
+
+def inflate(archived):
+    """decompress the archived data of a file"""
+    if not archived:
+        return b''
+    return zlib.decompress(archived)
+
+
+def find_all(pattern, data):
+    """find the offsets of every match of the pattern in the data
+
+    :param pattern: the bytes to find, or a compiled bytes regular expression
+    :param data: the data to search
+
+    Matches do not overlap, like those of re.finditer, so both kinds of
+    pattern find the same offsets.
+    """
+    if isinstance(pattern, bytes):
+        step = max(len(pattern), 1)
+        offsets = []
+        offset = data.find(pattern)
+        while offset != -1:
+            offsets.append(offset)
+            offset = data.find(pattern, offset + step)
+        return offsets
+    return [match.start() for match in pattern.finditer(data)]
+
+
+def digest(archived):
+    """hash the decompressed contents of the archived data of a file"""
+    return hashlib.sha1(inflate(archived)).digest()
+
+
+def differs(old_archived, new_archived):
+    """compare the decompressed contents of two archived files"""
+    return digest(old_archived) != digest(new_archived)
+
+
+def search_archived(pattern, archived):
+    """decompress the archived data of a file and search it"""
+    return find_all(pattern, inflate(archived))
+
+
+def build_header(allow_encryption, index_offset, file_count):
+    """build the raw data of a grf header, the reverse of parse_header"""
+    encryption = bytes(range(15)) if allow_encryption else bytes(15)
+    return b'Master of Magic' + encryption + struct.pack(
+        '<IIII', index_offset - HEADER_LENGTH, 0, file_count + 7,
+        SUPPORTED_VERSIONS[-1])
+
+
+def build_file_header(header):
+    """build the raw data of a file header, the reverse of parse_file_header
+    """
+    return struct.pack(
+        '<IIIBI', header.compressed_size, header.archived_size,
+        header.real_size, header.flag, header.position - HEADER_LENGTH)
+
+
+def fingerprint(stream):
+    """identify the current state of a grf archive
+
+    :param stream: a byte stream of the grf file
+    :returns: (size, modification time, file identity, raw header data)
+
+    The modification time and the (device, inode) identity of the file are
+    None when the stream is not backed by a file. Seeking to the end first
+    makes a buffered stream discard what it has read ahead, which is stale
+    if the file was rewritten in place.
+    """
+    end = stream.seek(0, io.SEEK_END)
+    try:
+        stat = os.fstat(stream.fileno())
+        size, mtime = stat.st_size, stat.st_mtime_ns
+        identity = (stat.st_dev, stat.st_ino)
+    except (AttributeError, OSError):
+        size, mtime, identity = end, None, None
+    stream.seek(HEADER_OFFSET)
+    return size, mtime, identity, stream.read(HEADER_LENGTH)
+
+
+def stream_path(stream):
+    """the path of the file a stream was opened from, or None"""
+    name = getattr(stream, 'name', None)
+    if isinstance(name, (str, bytes, os.PathLike)):
+        return name
+    return None
+
+
+def is_replaced(stream, path):
+    """whether the file at the path is no longer the file the stream reads
+
+    This is the case after a new file is renamed over the old one, which is
+    how archives are usually updated atomically.
+    """
+    try:
+        opened = os.fstat(stream.fileno())
+        current = os.stat(path)
+    except (AttributeError, OSError):
+        return False
+    return (opened.st_dev, opened.st_ino) != (current.st_dev, current.st_ino)
+
+
+def compare_indexes(old, new):
+    """find the filenames that differ between two indexes
+
+    :param old: the previous index
+    :param new: the current index
+    :returns: the added, removed and modified filenames
+
+    A file is modified when any part of its file header differs, including
+    its position in the archive.
+    """
+    old, new = dict(old.items()), dict(new.items())
+    added = frozenset(new.keys() - old.keys())
+    removed = frozenset(old.keys() - new.keys())
+    modified = frozenset(
+        filename for filename in old.keys() & new.keys()
+        if old[filename] != new[filename]
+    )
+    return Changes(added, removed, modified)
+
+
 class GRFFile(io.BytesIO):
 
     def __init__(self, filename, header_data, stream):
@@ -236,17 +396,140 @@ class GRFFile(io.BytesIO):
         self.header = parse_file_header(header_data)
 
         # seek to, read and decompress file data
-        stream.seek(self.header.position)
-        if self.header.real_size == 0:
-            self.data = b''
-        else:
-            self.data = zlib.decompress(stream.read(self.header.archived_size))
+        self.data = inflate(read_archived(stream, self.header))
         super().__init__(self.data)
 
     def __eq__(self, other):
         return other.filename == self.filename and other.data == self.data
 
 
+class GRFStream(io.RawIOBase):
+    """
+    Seekable File Stream
+    ====================
+
+    A GRFStream reads a file from the archive without decompressing all of it
+    up front. While the file is inflated, a copy of the decompressor state is
+    recorded every `interval` bytes of output. Seeking backwards, or reading
+    the same region again, only inflates from the nearest checkpoint instead
+    of the start of the file.
+
+    The checkpoints are stored in a list that may be shared between streams
+    of the same file, so a later stream can reuse the work done by an earlier
+    one.
+    """
+    def __init__(self, filename, header_data, stream, checkpoints=None,
+                 interval=CHECKPOINT_INTERVAL):
+        """open a file in the archive as a seekable stream
+
+        :param filename: the filename of the file
+        :param header_data: the header data for this file
+        :param stream: the grf data stream
+        :param checkpoints: a list of checkpoints to use and extend
+        :param interval: how many bytes of output between checkpoints
+        """
+        super().__init__()
+        self.filename = filename
+        self.header = parse_file_header(header_data)
+        self.stream = stream
+        self.interval = interval
+
+        # checkpoints are (output position, input position, decompressor)
+        if checkpoints is None:
+            checkpoints = []
+        if not checkpoints:
+            checkpoints.append((0, 0, zlib.decompressobj()))
+        self.checkpoints = checkpoints
+
+        self.position = 0
+        self.restore(0)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.header.real_size
+        elif whence != io.SEEK_SET:
+            raise ValueError('invalid whence')
+        if offset < 0:
+            raise ValueError('negative seek position')
+        self.position = offset
+        return self.position
+
+    def readinto(self, buffer):
+        """read decompressed data at the current position into the buffer"""
+        self._checkClosed()
+        if self.position >= self.header.real_size or len(buffer) == 0:
+            return 0
+
+        # move the decompressor to the current position
+        if self.output > self.position:
+            self.restore(self.position)
+        while self.output < self.position:
+            if not self.inflate(self.position - self.output):
+                return 0
+
+        data = self.inflate(len(buffer))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def restore(self, position):
+        """restore the nearest checkpoint at or before the position"""
+        outputs = [checkpoint[0] for checkpoint in self.checkpoints]
+        index = bisect.bisect_right(outputs, position) - 1
+        output, compressed, decompressor = self.checkpoints[index]
+        self.output = output
+        self.compressed = compressed
+        self.decompressor = decompressor.copy()
+        self.pending = b''
+
+    def inflate(self, size):
+        """inflate up to size bytes from the current decompressor state
+
+        Past the last checkpoint, no more than the distance to the next one
+        is inflated at a time, so checkpoints are exactly `interval` bytes
+        of output apart.
+        """
+        archived = self.header.archived_size
+        last = self.checkpoints[-1][0]
+        if self.output >= last:
+            size = min(size, last + self.interval - self.output)
+        data = b''
+        while not data:
+            # feed more compressed data when the last chunk is used up
+            if not self.pending:
+                if self.compressed >= archived:
+                    return b''
+                self.stream.seek(self.header.position + self.compressed)
+                self.pending = self.stream.read(
+                    min(READ_CHUNK_SIZE, archived - self.compressed))
+                if not self.pending:
+                    return b''
+                self.compressed += len(self.pending)
+            data = self.decompressor.decompress(self.pending, size)
+            self.pending = self.decompressor.unconsumed_tail
+            if self.decompressor.eof and not data:
+                return b''
+        self.output += len(data)
+
+        # record a checkpoint once enough new data has been inflated
+        if self.output >= self.checkpoints[-1][0] + self.interval:
+            consumed = self.compressed - len(self.pending)
+            checkpoint = (self.output, consumed, self.decompressor.copy())
+            self.checkpoints.append(checkpoint)
+        return data
+
+
 class Index:
     """
     GRF Index
@@ -283,6 +566,8 @@ class Index:
 
         # cache the filenames and headers as they are indexed
         self.indexed = {}
+        # the raw name data of each filename, as it is stored in the index
+        self.names = {}
 
     def __getitem__(self, filename):
         """get the header for the given filename"""
@@ -311,6 +596,11 @@ class Index:
             except EOFError:
                 break
 
+    def items(self):
+        """all the filenames in the index with their raw file headers"""
+        for filename in self:
+            yield filename, self.indexed[filename]
+
     def parse_next(self):
         """parse the next filename and store its header"""
         # read bytes until a null terminator or EOF is found
@@ -322,11 +612,12 @@ class Index:
         if filename == b'': # is this the best way to determine EOF?
             raise EOFError
 
-        filename = parse_name(filename)
+        name, filename = filename, parse_name(filename)
         header = self.data.read(FILE_HEADER_LENGTH)
 
         # index the file header and return the filename
         self.indexed[filename] = header
+        self.names[filename] = name
         return filename
 
 
@@ -334,8 +625,18 @@ class GRF:
 
     def __init__(self, stream):
         self.stream = stream
+        # the path the archive is reopened from when it is replaced
+        self.path = stream_path(stream)
+        self.fingerprint = fingerprint(self.stream)
         self.header = parse_header(self.stream)
         self.index = Index(self.stream, self.header)
+        # inflate checkpoints for files opened as streams, by filename
+        self.checkpoints = {}
+        # the streams opened with open_stream, closed when the index changes
+        self.streams = weakref.WeakSet()
+        # callbacks notified with the changes found by refresh
+        self.listeners = []
+        self.refresh_lock = threading.Lock()
 
     def __enter__(self):
         return self
@@ -366,6 +667,117 @@ class GRF:
         """all the names of the files contained in the archive"""
         yield from self.index
 
+    def file_headers(self, include='*'):
+        """the parsed headers of the files in the archive
+
+        Directories are skipped. Filenames are matched against the include
+        pattern without regard to case.
+
+        :param include: a glob pattern the filenames must match
+        :returns: (filename, header) for every matching file
+        """
+        include = include.lower()
+        for filename, header_data in self.index.items():
+            header = parse_file_header(header_data)
+            if not header.flag & FILE_IS_FILE:
+                continue
+            if fnmatch.fnmatchcase(filename.lower(), include):
+                yield filename, header
+
+    def search(self, pattern, include='*', workers=None):
+        """search the contents of files in the archive
+
+        Files are read from the archive in order, then decompressed and
+        searched in a pool of worker threads. Matches are yielded as soon as
+        the file they were found in has been searched, in archive order. Only
+        a few files per worker are held in memory at a time.
+
+        :param pattern: the bytes to find, or a regular expression of bytes
+        :param include: a glob pattern the filenames must match
+        :param workers: the number of worker threads to use
+        :returns: (filename, offset) for every match
+        """
+        if isinstance(pattern, str):
+            raise TypeError('pattern must be bytes or a bytes regex')
+        if not isinstance(pattern, bytes):
+            pattern = re.compile(pattern)
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            limit = workers * 2
+            pending = collections.deque()
+            for filename, header in self.file_headers(include):
+                archived = read_archived(self.stream, header)
+                future = executor.submit(search_archived, pattern, archived)
+                pending.append((filename, future))
+                # yield finished searches before reading more files
+                while pending and (len(pending) >= limit or
+                                   pending[0][1].done()):
+                    filename, future = pending.popleft()
+                    for offset in future.result():
+                        yield filename, offset
+            for filename, future in pending:
+                for offset in future.result():
+                    yield filename, offset
+
+    def watch(self, listener):
+        """notify the listener when a refresh finds changes
+
+        :param listener: a callable that accepts a `Changes`
+        """
+        self.listeners.append(listener)
+
+    def unwatch(self, listener):
+        """stop notifying a listener added with `watch`"""
+        self.listeners.remove(listener)
+
+    def refresh(self):
+        """reload the index if the archive has changed
+
+        The archive is considered changed when its size, modification time or
+        header is different from when it was last read. When the archive was
+        opened from a path and another file has been renamed over it, the
+        path is opened again and the old file is closed. The new header and
+        index are fully read before they replace the current ones, so a
+        failed refresh leaves the archive as it was.
+
+        Streams opened with open_stream before a reload are closed, since
+        the headers they read from no longer match the archive.
+
+        :returns: True if the archive was reloaded
+        """
+        with self.refresh_lock:
+            stream = self.stream
+            if self.path is not None and is_replaced(stream, self.path):
+                stream = open(self.path, 'rb')
+            try:
+                current = fingerprint(stream)
+                if current == self.fingerprint:
+                    return False
+                header = parse_header(stream)
+                index = Index(stream, header)
+            except BaseException:
+                if stream is not self.stream:
+                    stream.close()
+                raise
+            if stream is not self.stream:
+                self.stream.close()
+                self.stream = stream
+            for opened in list(self.streams):
+                opened.close()
+            old_index = self.index
+            self.header, self.index = header, index
+            self.fingerprint = current
+            self.checkpoints = {}
+
+        if self.listeners:
+            changes = compare_indexes(old_index, index)
+            for listener in self.listeners:
+                listener(changes)
+        return True
+
     def open(self, filename):
         """open a file in the archive"""
         try:
@@ -375,6 +787,26 @@ class GRF:
         opened_file = GRFFile(filename, header, self.stream)
         return filetypes.parse(opened_file)
 
+    def open_stream(self, filename, interval=CHECKPOINT_INTERVAL):
+        """open a file in the archive as a seekable stream
+
+        Unlike `open`, the file is not decompressed or parsed. Checkpoints
+        recorded while reading are kept by the archive, so seeking within the
+        same file again later only inflates from the nearest checkpoint.
+
+        :param filename: the name of the file to open
+        :param interval: how many bytes of output between checkpoints
+        """
+        try:
+            header = self.index[filename]
+        except KeyError:
+            raise FileNotFoundError(filename)
+        checkpoints = self.checkpoints.setdefault(filename, [])
+        opened = GRFStream(filename, header, self.stream, checkpoints,
+                           interval)
+        self.streams.add(opened)
+        return opened
+
     def extract(self, filename, parent_dir=None):
         """extract a file from the archive to the filesystem
 
@@ -401,3 +833,292 @@ class GRF:
     def close(self):
         """close the archive"""
         self.stream.close()
+
+
+def diff(old, new, workers=None):
+    """find the differences between two grf archives
+
+    :param old: the original archive
+    :param new: the updated archive
+    :param workers: the number of worker threads to use
+    :returns: a `Change` for every added, removed or modified file
+
+    Files are compared by their file headers first. Files with different
+    sizes are modified, and files whose archived data is identical are
+    unchanged. Only files with the same sizes but different archived data are
+    decompressed and hashed, in a pool of worker threads. Changes are yielded
+    in the order of the old archive, followed by the added files.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # keep only the raw headers of the new archive in memory
+    remaining = dict(new.index.items())
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        limit = workers * 2
+        pending = collections.deque()
+
+        def finished():
+            while pending:
+                filename, result = pending[0]
+                if isinstance(result, concurrent.futures.Future):
+                    if len(pending) < limit and not result.done():
+                        return
+                    result = MODIFIED if result.result() else None
+                pending.popleft()
+                if result is not None:
+                    yield Change(result, filename)
+
+        for filename, header in old.file_headers():
+            new_header = remaining.pop(filename, None)
+            if new_header is not None:
+                new_header = parse_file_header(new_header)
+            if new_header is None or not new_header.flag & FILE_IS_FILE:
+                pending.append((filename, REMOVED))
+            elif (header.real_size != new_header.real_size or
+                  header.compressed_size != new_header.compressed_size):
+                pending.append((filename, MODIFIED))
+            else:
+                old_archived = read_archived(old.stream, header)
+                new_archived = read_archived(new.stream, new_header)
+                if old_archived != new_archived:
+                    future = executor.submit(
+                        differs, old_archived, new_archived)
+                    pending.append((filename, future))
+            yield from finished()
+
+        limit = 0
+        yield from finished()
+
+    for filename, header_data in remaining.items():
+        if parse_file_header(header_data).flag & FILE_IS_FILE:
+            yield Change(ADDED, filename)
+
+
+def find_duplicates(*archives, workers=None):
+    """find files with identical contents in one or more archives
+
+    :param archives: the archives to search for duplicates
+    :param workers: the number of worker threads to use
+    :returns: a list of `Duplicates`, the most wasteful first
+
+    Every file is decompressed and hashed in a pool of worker threads. Each
+    group of duplicates holds the size of the contents, the (archive,
+    filename) pairs with those contents in archive order, and the number of
+    archived bytes that would be saved by storing the contents only once.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    groups = collections.defaultdict(list)
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        limit = workers * 2
+        pending = collections.deque()
+
+        def finished(limit):
+            while pending and (len(pending) >= limit or pending[0][2].done()):
+                archive, filename, future, header = pending.popleft()
+                key = (future.result(), header.real_size)
+                groups[key].append((archive, filename, header.archived_size))
+
+        for archive in archives:
+            for filename, header in archive.file_headers():
+                archived = read_archived(archive.stream, header)
+                future = executor.submit(digest, archived)
+                pending.append((archive, filename, future, header))
+                finished(limit)
+        finished(0)
+
+    duplicates = []
+    for (file_digest, size), files in groups.items():
+        if len(files) < 2:
+            continue
+        archived_sizes = [archived_size for _, _, archived_size in files]
+        wasted = sum(archived_sizes) - min(archived_sizes)
+        files = tuple((archive, filename) for archive, filename, _ in files)
+        duplicates.append(Duplicates(file_digest, size, files, wasted))
+    duplicates.sort(key=lambda group: group.wasted, reverse=True)
+    return duplicates
+
+
+class GRFWriter:
+    """
+    GRF Writer
+    ==========
+
+    Writes a new grf archive to a stream. Files are written as they are
+    added, and the index and header are written when the writer is closed.
+    Several filenames may share the same stored data by linking them to a
+    file that was already added.
+
+    Filenames are encoded into the index with encode_name, unless the raw
+    name data is given, as it is when copying files from another archive.
+    Decoding a name is not always reversible, so copied names should keep
+    their raw data.
+    """
+    def __init__(self, stream, allow_encryption=False):
+        """create a new archive
+
+        :param stream: the writable byte stream to write the archive to
+        :param allow_encryption: whether the archive allows encrypted files
+        """
+        self.stream = stream
+        self.allow_encryption = allow_encryption
+        self.headers = {}
+        self.names = {}
+
+        # leave space for the header, which is written last
+        self.stream.seek(HEADER_OFFSET)
+        self.stream.write(bytes(HEADER_LENGTH))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+
+    def add(self, filename, data, name=None):
+        """compress and add a file to the archive
+
+        :param filename: the filename of the file
+        :param data: the contents of the file
+        :param name: the raw name data of the file, if it has one
+        """
+        compressed = zlib.compress(data) if data else b''
+        header = FileHeader(
+            len(compressed), len(compressed), len(data), FILE_IS_FILE, 0)
+        self.add_archived(filename, header, compressed, name)
+
+    def add_archived(self, filename, header, archived, name=None):
+        """add a file to the archive as it is stored in another archive
+
+        :param filename: the filename of the file
+        :param header: the header of the file in the other archive
+        :param archived: the stored data of the file
+        :param name: the raw name data of the file in the other archive
+        """
+        self.add_name(filename, name)
+        position = self.stream.tell()
+        self.stream.write(archived)
+        self.headers[filename] = header._replace(position=position)
+
+    def link(self, filename, target, name=None):
+        """add a file that shares the stored data of another file
+
+        :param filename: the filename of the new file
+        :param target: the filename of a file already in the archive
+        :param name: the raw name data of the new file, if it has one
+        """
+        header = self.headers[target]
+        self.add_name(filename, name)
+        self.headers[filename] = header
+
+    def add_name(self, filename, name=None):
+        """store the raw name data of a file, encoding it if not given"""
+        self.names[filename] = encode_name(filename) if name is None else name
+
+    def close(self):
+        """write the index and the header of the archive"""
+        index = b''.join(
+            self.names[filename] + b'\x00' + build_file_header(header)
+            for filename, header in self.headers.items()
+        )
+        compressed = zlib.compress(index)
+
+        index_offset = self.stream.tell()
+        self.stream.write(struct.pack('<II', len(compressed), len(index)))
+        self.stream.write(compressed)
+
+        self.stream.seek(HEADER_OFFSET)
+        self.stream.write(build_header(
+            self.allow_encryption, index_offset, len(self.headers)))
+        self.stream.seek(0, io.SEEK_END)
+
+
+def repack(grf, stream, dedup=True, workers=None):
+    """write a copy of an archive to a stream
+
+    The stored data of each file is copied without being recompressed. When
+    dedup is set, files with identical contents are stored only once, and
+    every index entry for them points at the same data.
+
+    :param grf: the archive to copy
+    :param stream: the writable byte stream to write the copy to
+    :param dedup: whether to store duplicate files only once
+    :param workers: the number of worker threads used to find duplicates
+
+    Every filename keeps the raw name data of the original index.
+    """
+    links = {}
+    if dedup:
+        for duplicates in find_duplicates(grf, workers=workers):
+            (_, target), *others = duplicates.files
+            links.update((filename, target) for _, filename in others)
+
+    with GRFWriter(stream, grf.allow_encryption) as writer:
+        for filename, header_data in grf.index.items():
+            header = parse_file_header(header_data)
+            name = grf.index.names[filename]
+            if filename in links:
+                writer.link(filename, links[filename], name)
+            elif header.flag & FILE_IS_FILE:
+                writer.add_archived(filename, header,
+                                    read_archived(grf.stream, header), name)
+            else:
+                writer.add_archived(filename, header, b'', name)
+
+
+def rewrite_acts(grf, stream, include='*.act'):
+    """write a copy of an archive with the act files stripped
+
+    The invisible layers of each act file are removed with strip_layers.
+    act files that are unchanged, that fail to parse or that have a version
+    before 0x200 are copied as they are stored, as are all other files.
+    Every filename keeps the raw name data of the original index.
+
+    :param grf: the archive to copy
+    :param stream: the writable byte stream to write the copy to
+    :param include: a glob pattern the act filenames must match
+    :returns: the number of act files that were rewritten
+    """
+    acts = {filename for filename, _ in grf.file_headers(include)}
+    count = 0
+    with GRFWriter(stream, grf.allow_encryption) as writer:
+        for filename, header_data in grf.index.items():
+            header = parse_file_header(header_data)
+            name = grf.index.names[filename]
+            data = strip_act(grf, filename) if filename in acts else None
+            if data is not None:
+                writer.add(filename, data, name)
+                count += 1
+            elif header.flag & FILE_IS_FILE:
+                writer.add_archived(filename, header,
+                                    read_archived(grf.stream, header), name)
+            else:
+                writer.add_archived(filename, header, b'', name)
+    return count
+
+
+def strip_act(grf, filename):
+    """remove the invisible layers of an act file in an archive
+
+    The trigger names and intervals are written back exactly as they are
+    stored, so nothing but the layers changes.
+
+    :returns: the data of the stripped act file, or None if it can't be
+              parsed or rewritten, or has no invisible layers
+    """
+    from .act import ACT, build_act, strip_layers
+    try:
+        act = grf.open(filename)
+        if not isinstance(act, ACT) or not 0x200 <= act.version <= 0x205:
+            return None
+        animations = strip_layers(act.animations)
+        if animations == act.animations:
+            return None
+        return build_act(animations, act.raw_triggers, act.version,
+                         act.reserved, act.interval_count)
+    except (FileParseError, ValueError, zlib.error):
+        return None
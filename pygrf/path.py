@@ -0,0 +1,533 @@
+""" pathfinding and line of sight over the tiles of gat files """
+import array
+import heapq
+import re
+import struct
+import sys
+import zlib
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+from .exceptions import FileParseError
+
+
+PATH_CACHE_SIZE = 1024
+
+SIGNATURE = b'RGNS'
+VERSION = 1
+
+regions_header_struct = struct.Struct('<4sHIIII')
+
+# a run of walkable tiles in the unpacked flags of a bitmap
+RUN = re.compile(b'\x01+')
+
+# the cost of moving to a neighbouring tile, roughly 10 * sqrt(2) diagonally
+STRAIGHT_COST = 10
+DIAGONAL_COST = 14
+
+Coordinates = Tuple[int, int]
+Path = Tuple[Coordinates, ...]
+
+
+def octile(dx: int, dy: int) -> int:
+    """ the cost of the cheapest path across an open grid """
+    if dx < dy:
+        dx, dy = dy, dx
+    return STRAIGHT_COST * dx + (DIAGONAL_COST - STRAIGHT_COST) * dy
+
+
+def pad_grid(bitmap) -> Tuple[bytes, int]:
+    """ unpack a bitmap into a grid with a border of unset tiles
+
+    :returns: (grid, stride), where the grid has one byte of 0 or 1 for
+              every tile and (x, y) is at (y + 1) * stride + x + 1
+    """
+    stride = bitmap.width + 2
+    flags = bitmap.unpack()
+    grid = bytearray(stride * (bitmap.height + 2))
+    for y in range(bitmap.height):
+        start = (y + 1) * stride + 1
+        grid[start:start + bitmap.width] = \
+            flags[y * bitmap.width:(y + 1) * bitmap.width]
+    return bytes(grid), stride
+
+
+class Grid:
+    """ the tiles of a map as single integers in a padded grid """
+
+    def __init__(self, bitmap):
+        self.width = bitmap.width
+        self.height = bitmap.height
+        self.grid, self.stride = pad_grid(bitmap)
+
+    def node(self, x: int, y: int) -> int:
+        """ the index of a tile in the grid """
+        if x >= self.width or y >= self.height or x < 0 or y < 0:
+            raise IndexError
+        return (y + 1) * self.stride + x + 1
+
+    def coordinates(self, node: int) -> Coordinates:
+        """ the (x, y) of a tile from its index in the grid """
+        y, x = divmod(node, self.stride)
+        return x - 1, y - 1
+
+
+class Pathfinder(Grid):
+    """ finds the shortest paths between the tiles of a map with A*
+
+    Tiles can be walked to in 8 directions. A diagonal step is only allowed
+    when both of the tiles it cuts past are walkable, like in the client.
+
+    The walkable tiles are unpacked into a grid with one byte per tile and
+    a border of unwalkable tiles, so that every tile is a single integer and
+    its neighbours never need a bounds check. The most recently found paths
+    are cached by their start and goal.
+
+    When the Regions of the map are given, goals in another region are
+    turned down without a search, which would otherwise visit every tile
+    that can be reached from the start.
+    """
+
+    def __init__(self, bitmap, cache_size: int = PATH_CACHE_SIZE,
+                 regions: Optional['Regions'] = None):
+        """
+        :param bitmap: a Bitmap of the walkable tiles, see GAT.walkable
+        :param cache_size: how many paths to keep
+        :param regions: the Regions of the same bitmap, if any
+        """
+        super().__init__(bitmap)
+        stride = self.stride
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.regions = regions
+
+        # each move is (offset, cost, the offsets of the tiles it cuts past)
+        self.moves = (
+            (1, STRAIGHT_COST, None),
+            (-1, STRAIGHT_COST, None),
+            (stride, STRAIGHT_COST, None),
+            (-stride, STRAIGHT_COST, None),
+            (stride + 1, DIAGONAL_COST, (1, stride)),
+            (stride - 1, DIAGONAL_COST, (-1, stride)),
+            (-stride + 1, DIAGONAL_COST, (1, -stride)),
+            (-stride - 1, DIAGONAL_COST, (-1, -stride)),
+        )
+
+    @classmethod
+    def from_gat(cls, gat, cache_size: int = PATH_CACHE_SIZE,
+                 regions: Optional['Regions'] = None):
+        """ create a pathfinder for the walkable tiles of a gat file """
+        return cls(gat.walkable(), cache_size, regions)
+
+    def is_walkable(self, x: int, y: int) -> bool:
+        """ whether a tile can be walked on """
+        return bool(self.grid[self.node(x, y)])
+
+    def find_path(self, start: Coordinates,
+                  goal: Coordinates) -> Optional[Path]:
+        """ find the shortest path between two tiles
+
+        :param start: the (x, y) to start from
+        :param goal: the (x, y) to walk to
+        :returns: the (x, y) of every tile on the path, including start and
+                  goal, or None if the goal can't be reached
+        """
+        key = (start, goal)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        start_node, goal_node = self.node(*start), self.node(*goal)
+        if self.regions is not None and \
+                not self.regions.reachable(start, goal):
+            nodes = None
+        else:
+            nodes = self.search(start_node, goal_node)
+        path = None
+        if nodes is not None:
+            path = tuple(map(self.coordinates, nodes))
+        self.cache[key] = path
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return path
+
+    def find_paths(self, pairs: Iterable[Tuple[Coordinates, Coordinates]]
+                   ) -> List[Optional[Path]]:
+        """ find the shortest paths between many (start, goal) pairs
+
+        pairs that were searched before are answered from the cache.
+        """
+        return [self.find_path(start, goal) for start, goal in pairs]
+
+    def search(self, start: int, goal: int) -> Optional[List[int]]:
+        """ run A* between two grid indices
+
+        :returns: the grid indices of the path, or None if there is none
+        """
+        grid = self.grid
+        if not grid[start] or not grid[goal]:
+            return None
+        if start == goal:
+            return [start]
+
+        stride = self.stride
+        goal_y, goal_x = divmod(goal, stride)
+        moves = self.moves
+        push = heapq.heappush
+        pop = heapq.heappop
+
+        start_y, start_x = divmod(start, stride)
+        estimate = octile(abs(start_x - goal_x), abs(start_y - goal_y))
+        # ties are broken by the estimate, so nodes nearer the goal go first
+        heap = [(estimate, estimate, start)]
+        costs = {start: 0}
+        parents = {start: -1}
+        closed = set()
+        while heap:
+            _, _, node = pop(heap)
+            if node == goal:
+                path = []
+                while node != -1:
+                    path.append(node)
+                    node = parents[node]
+                path.reverse()
+                return path
+            if node in closed:
+                continue
+            closed.add(node)
+
+            cost = costs[node]
+            for offset, step, corners in moves:
+                neighbour = node + offset
+                if not grid[neighbour] or neighbour in closed:
+                    continue
+                if corners and not (grid[node + corners[0]]
+                                    and grid[node + corners[1]]):
+                    continue
+                new_cost = cost + step
+                if new_cost < costs.get(neighbour, new_cost + 1):
+                    costs[neighbour] = new_cost
+                    parents[neighbour] = node
+                    y, x = divmod(neighbour, stride)
+                    dx, dy = abs(x - goal_x), abs(y - goal_y)
+                    if dx < dy:
+                        dx, dy = dy, dx
+                    estimate = STRAIGHT_COST * dx + \
+                        (DIAGONAL_COST - STRAIGHT_COST) * dy
+                    push(heap, (new_cost + estimate, estimate, neighbour))
+        return None
+
+
+class LineOfSight(Grid):
+    """ checks whether tiles can be shot at from other tiles
+
+    A shot is blocked when any tile on the line between the two tiles,
+    including both ends, can't be shot over. The line is traced with
+    Bresenham's algorithm from the source to the target, so the result can
+    differ when the two are swapped.
+
+    Visibility from fixed points, such as towers or spawn points, can be
+    computed once with add_viewpoint, after which checks from those points
+    are single lookups.
+    """
+
+    def __init__(self, bitmap):
+        """
+        :param bitmap: a Bitmap of the snipable tiles, see GAT.snipable
+        """
+        super().__init__(bitmap)
+        self.viewpoints = {}
+
+    @classmethod
+    def from_gat(cls, gat):
+        """ create line of sight checks for the snipable tiles of a map """
+        return cls(gat.snipable())
+
+    def visible(self, source: Coordinates, target: Coordinates) -> bool:
+        """ whether target can be shot at from source """
+        viewpoint = self.viewpoints.get(source)
+        if viewpoint is not None:
+            # targets off the map are rejected even when they are in range
+            self.node(*target)
+            radius, visible = viewpoint
+            dx, dy = target[0] - source[0], target[1] - source[1]
+            if abs(dx) <= radius and abs(dy) <= radius:
+                return bool(visible[(dy + radius) * (2 * radius + 1)
+                                    + dx + radius])
+        return self.trace(self.node(*source), self.node(*target))
+
+    def visible_many(self, pairs: Iterable[Tuple[Coordinates, Coordinates]]
+                     ) -> List[bool]:
+        """ check the line of sight of many (source, target) pairs """
+        visible = self.visible
+        return [visible(source, target) for source, target in pairs]
+
+    def trace(self, start: int, end: int) -> bool:
+        """ trace a line between two grid indices
+
+        :returns: whether every tile on the line is set
+        """
+        grid = self.grid
+        stride = self.stride
+        y0, x0 = divmod(start, stride)
+        y1, x1 = divmod(end, stride)
+        dx = abs(x1 - x0)
+        dy = -abs(y1 - y0)
+        step_x = 1 if x0 < x1 else -1
+        step_y = stride if y0 < y1 else -stride
+        error = dx + dy
+        node = start
+        while grid[node]:
+            if node == end:
+                return True
+            double = 2 * error
+            if double >= dy:
+                error += dy
+                node += step_x
+            if double <= dx:
+                error += dx
+                node += step_y
+        return False
+
+    def add_viewpoint(self, source: Coordinates, radius: int) -> bytes:
+        """ work out which tiles near a point can be shot at from it
+
+        :param source: the (x, y) of the point
+        :param radius: how far to look in each direction
+        :returns: one byte of 0 or 1 for each tile of the square around the
+                  source, row by row
+        """
+        start = self.node(*source)
+        x, y = source
+        visible = bytearray((2 * radius + 1) ** 2)
+        index = 0
+        for target_y in range(y - radius, y + radius + 1):
+            for target_x in range(x - radius, x + radius + 1):
+                if 0 <= target_x < self.width and \
+                        0 <= target_y < self.height:
+                    visible[index] = self.trace(
+                        start, self.node(target_x, target_y))
+                index += 1
+        visible = bytes(visible)
+        self.viewpoints[source] = (radius, visible)
+        return visible
+
+
+class Regions:
+    """ the connected regions of the walkable tiles of a map
+
+    Every walkable tile is labelled with the number of its region, counting
+    from 1 in the order the regions are first met row by row, and every
+    other tile with 0. Two tiles are in the same region when one can be
+    walked to from the other. Only the 4 straight neighbours of a tile are
+    joined, since a diagonal step needs both of the tiles it cuts past to be
+    walkable and so never joins two regions on its own.
+
+    The labels are found once, by joining the runs of walkable tiles of each
+    row to the runs they touch in the row above, after which every check is
+    a lookup. They can be saved with the map so they don't need to be found
+    again.
+    """
+
+    def __init__(self, width: int, height: int, labels: array.array,
+                 sizes: array.array):
+        """
+        :param labels: the label of every tile, row by row
+        :param sizes: the number of tiles of each region by its label
+        """
+        self.width = width
+        self.height = height
+        self.labels = labels
+        self.sizes = sizes
+
+    @classmethod
+    def from_bitmap(cls, bitmap) -> 'Regions':
+        """ label the regions of the set tiles of a bitmap """
+        width, height = bitmap.width, bitmap.height
+        flags = bitmap.unpack()
+        runs = []
+        parents = []
+
+        def find(run):
+            while parents[run] != run:
+                parents[run] = parents[parents[run]]
+                run = parents[run]
+            return run
+
+        previous = []
+        for y in range(height):
+            offset = y * width
+            current = []
+            above = 0
+            for match in RUN.finditer(flags, offset, offset + width):
+                start, end = match.span()
+                run = len(runs)
+                runs.append((start, end))
+                parents.append(run)
+                left, right = start - offset, end - offset
+                # skip the runs above that end before this one starts, the
+                # rest may still touch the next run of this row
+                while above < len(previous) and previous[above][1] <= left:
+                    above += 1
+                index = above
+                while index < len(previous) and previous[index][0] < right:
+                    root, other = find(previous[index][2]), find(run)
+                    # the first run of a region stays its root
+                    if root < other:
+                        parents[other] = root
+                    elif other < root:
+                        parents[root] = other
+                    index += 1
+                current.append((left, right, run))
+            previous = current
+
+        # roots come before the other runs of their region
+        run_labels = []
+        count = 0
+        for run in range(len(runs)):
+            root = find(run)
+            if root == run:
+                count += 1
+                run_labels.append(count)
+            else:
+                run_labels.append(run_labels[root])
+
+        typecode = label_typecode(count)
+        labels = array.array(typecode, bytes(
+            width * height * array.array(typecode).itemsize))
+        sizes = array.array('I', bytes(4 * (count + 1)))
+        for (start, end), label in zip(runs, run_labels):
+            labels[start:end] = array.array(typecode, (label,)) * (end - start)
+            sizes[label] += end - start
+        return cls(width, height, labels, sizes)
+
+    @classmethod
+    def from_gat(cls, gat) -> 'Regions':
+        """ label the regions of the walkable tiles of a gat file """
+        return cls.from_bitmap(gat.walkable())
+
+    @property
+    def count(self) -> int:
+        """ the number of regions """
+        return len(self.sizes) - 1
+
+    def label(self, x: int, y: int) -> int:
+        """ the region of a tile, or 0 if it can't be walked on """
+        if x >= self.width or y >= self.height or x < 0 or y < 0:
+            raise IndexError
+        return self.labels[x + y * self.width]
+
+    def reachable(self, start: Coordinates, goal: Coordinates) -> bool:
+        """ whether there is a path between two tiles """
+        label = self.label(*start)
+        return label != 0 and label == self.label(*goal)
+
+    def size(self, tile: Coordinates) -> int:
+        """ the number of tiles in the region of a tile, 0 if unwalkable """
+        return self.sizes[self.label(*tile)]
+
+    def nearest(self, tile: Coordinates,
+                label: Optional[int] = None) -> Optional[Coordinates]:
+        """ find the nearest walkable tile to a tile
+
+        tiles are searched in growing squares around the tile, until no
+        tile further out can be nearer in a straight line.
+
+        :param tile: the (x, y) to search around, which can be unwalkable
+        :param label: the region to search in, or None for any region
+        :returns: the (x, y) of the nearest tile, or None if there is none
+        """
+        x, y = tile
+        self.label(x, y)
+        if label is not None and not 0 < label < len(self.sizes):
+            return None
+        labels = self.labels
+        width, height = self.width, self.height
+        best = None
+        best_distance = 0
+        for radius in range(max(width, height)):
+            if best is not None and radius * radius >= best_distance:
+                break
+            top, bottom = y - radius, y + radius
+            for target_y in range(max(top, 0), min(bottom, height - 1) + 1):
+                if target_y in (top, bottom):
+                    columns = range(max(x - radius, 0),
+                                    min(x + radius, width - 1) + 1)
+                else:
+                    columns = [column for column in (x - radius, x + radius)
+                               if 0 <= column < width]
+                row = target_y * width
+                for target_x in columns:
+                    found = labels[row + target_x]
+                    if found and (label is None or found == label):
+                        distance = (target_x - x) ** 2 + (target_y - y) ** 2
+                        if best is None or distance < best_distance:
+                            best = (target_x, target_y)
+                            best_distance = distance
+        return best
+
+    def save(self, stream):
+        """ write the labels to a binary stream so they can be cached
+
+        the labels and sizes are stored zlib compressed.
+        """
+        labels, sizes = self.labels, self.sizes
+        if sys.byteorder == 'big':
+            labels, sizes = array.array(labels.typecode, labels), \
+                array.array(sizes.typecode, sizes)
+            labels.byteswap()
+            sizes.byteswap()
+        compressed = zlib.compress(labels.tobytes() + sizes.tobytes())
+        stream.write(regions_header_struct.pack(
+            SIGNATURE, VERSION, self.width, self.height, self.count,
+            len(compressed)))
+        stream.write(compressed)
+
+    @classmethod
+    def load(cls, stream) -> 'Regions':
+        """ read labels written by save """
+        try:
+            signature, version, width, height, count, size = \
+                regions_header_struct.unpack(
+                    stream.read(regions_header_struct.size))
+        except struct.error:
+            raise FileParseError('invalid regions header')
+        if signature != SIGNATURE:
+            raise FileParseError('invalid signature')
+        if version != VERSION:
+            raise FileParseError('unsupported version')
+
+        try:
+            data = zlib.decompress(stream.read(size))
+        except zlib.error:
+            raise FileParseError('invalid regions data')
+        labels = array.array(label_typecode(count))
+        sizes = array.array('I')
+        length = width * height * labels.itemsize
+        if len(data) != length + (count + 1) * sizes.itemsize:
+            raise FileParseError('invalid regions length')
+        labels.frombytes(data[:length])
+        sizes.frombytes(data[length:])
+        if sys.byteorder == 'big':
+            labels.byteswap()
+            sizes.byteswap()
+        return cls(width, height, labels, sizes)
+
+
+def label_typecode(count: int) -> str:
+    """ the smallest array typecode that holds the labels of count regions """
+    return 'H' if count < 0x10000 else 'I'
+
+
+def find_path(gat, start: Coordinates, goal: Coordinates) -> Optional[Path]:
+    """ find the shortest path between two tiles of a gat file
+
+    to search the same map many times, create a Pathfinder once instead.
+    """
+    return Pathfinder.from_gat(gat).find_path(start, goal)
+
+
+def path_cost(path: Path) -> int:
+    """ the total cost of walking a path """
+    cost = 0
+    for (x0, y0), (x1, y1) in zip(path, path[1:]):
+        cost += DIAGONAL_COST if x0 != x1 and y0 != y1 else STRAIGHT_COST
+    return cost
@@ -0,0 +1,242 @@
+""" png encoding for images and bulk sprite conversion """
+import argparse
+import concurrent.futures
+import os
+import re
+import struct
+import zlib
+from typing import NamedTuple, Optional
+from .api import open_grf
+from .exceptions import FileParseError
+from .graphics import IndexedImage, RGBAImage
+from .grf import FileHeader, inflate, read_archived
+from .spr import SPR
+
+
+SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# png color types
+COLOR_INDEXED = 3
+COLOR_RGBA = 6
+
+# how much compressed data is collected before an IDAT chunk is written
+CHUNK_SIZE = 64 * 1024
+
+# how many sprites each worker converts at a time
+BATCH_SIZE = 32
+
+# the errors a corrupt sprite can raise while it is parsed and converted
+SPRITE_ERRORS = (FileParseError, ValueError, zlib.error, struct.error)
+
+ihdr_struct = struct.Struct('>IIBBBBB')
+length_struct = struct.Struct('>I')
+
+# the archive each worker process of convert_sprites reads from
+worker_stream = None
+
+
+class Converted(NamedTuple):
+    """ the result of converting sprites to png files """
+    #: the number of png files written
+    written: int
+    #: the number of sprites that could not be converted
+    failed: int
+
+
+def write_chunk(stream, chunk_type: bytes, data: bytes = b''):
+    """ write a single png chunk with its length and checksum """
+    stream.write(length_struct.pack(len(data)))
+    stream.write(chunk_type)
+    stream.write(data)
+    stream.write(length_struct.pack(zlib.crc32(data, zlib.crc32(chunk_type))))
+
+
+def write_png(stream, image, level: int = 6):
+    """ write an image to a stream as a png file
+
+    RGBAImages are written as 8-bit RGBA. IndexedImages are written with
+    their palette as PLTE and tRNS chunks, which keeps them small. rows are
+    compressed one at a time straight from the image data.
+
+    :param stream: the writable byte stream
+    :param image: an RGBAImage, or an IndexedImage with a palette
+    :param level: the zlib compression level
+    """
+    if isinstance(image, IndexedImage):
+        if image.palette is None:
+            raise ValueError('indexed images need a palette')
+        color_type, stride = COLOR_INDEXED, image.width
+    elif isinstance(image, RGBAImage):
+        color_type, stride = COLOR_RGBA, image.width * 4
+    else:
+        raise TypeError('unsupported image type')
+
+    stream.write(SIGNATURE)
+    write_chunk(stream, b'IHDR', ihdr_struct.pack(
+        image.width, image.height, 8, color_type, 0, 0, 0))
+
+    if color_type == COLOR_INDEXED:
+        palette = image.palette
+        rgb = bytearray(768)
+        for channel in range(3):
+            rgb[channel::3] = palette[channel::4]
+        write_chunk(stream, b'PLTE', bytes(rgb))
+        # opaque entries at the end of the palette can be left out
+        alpha = palette[3::4].rstrip(b'\xff')
+        if alpha:
+            write_chunk(stream, b'tRNS', alpha)
+
+    compressor = zlib.compressobj(level)
+    pending = []
+    pending_size = 0
+    view = memoryview(image)
+    for y in range(image.height):
+        # each row starts with its filter type, which is always none
+        row = view[y * stride:(y + 1) * stride]
+        data = compressor.compress(b'\x00' + row)
+        if data:
+            pending.append(data)
+            pending_size += len(data)
+        if pending_size >= CHUNK_SIZE:
+            write_chunk(stream, b'IDAT', b''.join(pending))
+            pending, pending_size = [], 0
+    pending.append(compressor.flush())
+    write_chunk(stream, b'IDAT', b''.join(pending))
+    write_chunk(stream, b'IEND')
+
+
+def save_png(filename: str, image, level: int = 6):
+    """ write an image to a png file
+
+    :param filename: the path of the png file
+    :param image: an RGBAImage, or an IndexedImage with a palette
+    :param level: the zlib compression level
+    """
+    with open(filename, 'wb') as f:
+        write_png(f, image, level)
+
+
+def save_sprite(spr, path: str, level: int = 6) -> int:
+    """ write every image of a sprite to png files
+
+    pal images are written as indexed pngs when the sprite has a palette.
+    the images are named after the path, followed by their index.
+
+    :param spr: the sprite to convert
+    :param path: the path of the png files, without an extension
+    :param level: the zlib compression level
+    :returns: the number of png files written
+    """
+    count = 0
+    for index in range(len(spr)):
+        if index < spr.parser.pal_count:
+            if spr.palette is None:
+                continue
+            image = spr.get_indexed(index)
+        else:
+            image = spr.image(index)
+        save_png('{}_{:03}.png'.format(path, index), image, level)
+        count += 1
+    return count
+
+
+def init_worker(grf_filename: str):
+    """ open the archive once in each worker process of convert_sprites """
+    global worker_stream
+    worker_stream = open(grf_filename, 'rb')
+
+
+def sprite_path(output_dir: str, filename: str) -> Optional[str]:
+    """ the path of the png files of a sprite, without an extension
+
+    empty, '.' and '..' segments are dropped from the filename, so names
+    taken from an archive can't point outside of the output directory.
+
+    :returns: the path, or None if nothing is left of the filename
+    """
+    parts = re.split(r'[\\/]', os.path.splitext(filename)[0])
+    parts = [part for part in parts if part not in ('', '.', '..')]
+    if not parts:
+        return None
+    return os.path.join(output_dir, *parts)
+
+
+def convert_batch(headers, output_dir: str, level: int = 6) -> Converted:
+    """ convert a batch of sprites in a grf archive to png files
+
+    this runs in a worker process, which reads the archive opened by
+    init_worker. sprites that fail to parse or convert are counted and
+    skipped.
+
+    :param headers: the filename and FileHeader fields of every sprite
+    :returns: the number of png files written and of sprites that failed
+    """
+    written = failed = 0
+    for filename, header in headers:
+        path = sprite_path(output_dir, filename)
+        if path is None:
+            failed += 1
+            continue
+        try:
+            archived = read_archived(worker_stream, FileHeader(*header))
+            spr = SPR(inflate(archived))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            written += save_sprite(spr, path, level)
+        except SPRITE_ERRORS:
+            failed += 1
+    return Converted(written, failed)
+
+
+def convert_sprites(grf_filename: str, output_dir: str, include='*.spr',
+                    workers: int = None, level: int = 6) -> Converted:
+    """ convert every sprite in a grf archive to png files
+
+    the headers of the sprites are read once and split into batches that
+    are converted by a pool of worker processes, each of which opens the
+    archive once. sprites that fail to parse or convert are skipped.
+
+    :param grf_filename: the path to the grf archive
+    :param output_dir: the directory to write the png files to
+    :param include: a glob pattern the sprite filenames must match
+    :param workers: the number of worker processes to use
+    :param level: the zlib compression level
+    :returns: the number of png files written and of sprites that failed
+    """
+    with open_grf(grf_filename) as grf:
+        # plain tuples, as the GRFFileHeader name can't be pickled
+        headers = [(filename, tuple(header))
+                   for filename, header in grf.file_headers(include)]
+    batches = [headers[i:i + BATCH_SIZE]
+               for i in range(0, len(headers), BATCH_SIZE)]
+
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=init_worker,
+            initargs=(grf_filename,)) as executor:
+        futures = [
+            executor.submit(convert_batch, batch, output_dir, level)
+            for batch in batches
+        ]
+        written = failed = 0
+        for future in futures:
+            result = future.result()
+            written += result.written
+            failed += result.failed
+    return Converted(written, failed)
+
+
+def main(args=None) -> Converted:
+    """ convert every sprite in a grf archive to png files """
+    parser = argparse.ArgumentParser(
+        prog='python -m pygrf.png', description=main.__doc__)
+    parser.add_argument('grf', help='the grf archive to convert')
+    parser.add_argument('output', help='the directory to write to')
+    parser.add_argument('--include', default='*.spr',
+                        help='a glob pattern the sprites must match')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='the number of worker processes')
+    args = parser.parse_args(args)
+    return convert_sprites(args.grf, args.output, args.include, args.workers)
+
+
+if __name__ == '__main__':
+    print('wrote {} png files, {} sprites failed'.format(*main()))
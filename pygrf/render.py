@@ -0,0 +1,404 @@
+""" compositing of act frames from the images of a spr file """
+import math
+import re
+import struct
+from array import array
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+from .act import NO_IMAGE, RGB_IMAGE, Frame, Layer
+from .graphics import Color, Palette, Point, RGBAImage
+
+
+TRANSFORM_CACHE_SIZE = 512
+
+WHITE = Color(255, 255, 255, 255)
+
+# runs of alpha values in the alpha plane of an image
+_visible = re.compile(b'[^\x00]+')
+_opaque = re.compile(b'\xff+')
+_partial = re.compile(b'[\x01-\xfe]+')
+
+float_struct = struct.Struct('<f')
+int_struct = struct.Struct('<i')
+
+
+class Transform(NamedTuple):
+    """ how a layer draws an image: mirrored, scaled, rotated and tinted
+
+    the angle is in degrees, clockwise.
+    """
+    flipped: bool = False
+    zoom_x: float = 1.0
+    zoom_y: float = 1.0
+    angle: int = 0
+    color: Color = WHITE
+
+
+class RenderedFrame(NamedTuple):
+    """ a composited frame and where the frame origin is in its image """
+    image: RGBAImage
+    origin: Point
+
+
+def angle_degrees(angle: float) -> int:
+    """ get the rotation of a layer in degrees
+
+    act files store the rotation as an int32 number of degrees, but
+    Layer.angle holds those bits read as a float.
+    """
+    degrees, = int_struct.unpack(float_struct.pack(angle))
+    return degrees
+
+
+def layer_transform(layer: Layer) -> Transform:
+    """ get the transform that a layer applies to its image """
+    return Transform(layer.flipped != 0, layer.zoom.x, layer.zoom.y,
+                     angle_degrees(layer.angle) % 360, layer.color)
+
+
+def layer_image_index(spr, layer: Layer) -> Optional[int]:
+    """ get the index of the spr image shown by a layer
+
+    rgb images are counted after the pal images. None is returned when the
+    layer shows no image, or an image that the spr file doesn't have.
+    """
+    if layer.index == NO_IMAGE:
+        return None
+    index = layer.index
+    if layer.image_type == RGB_IMAGE:
+        index += spr.parser.pal_count
+    if index >= len(spr):
+        return None
+    return index
+
+
+def scaled_size(width: int, height: int,
+                transform: Transform) -> Tuple[int, int]:
+    """ the size of an image once it has been scaled """
+    return (int(round(width * abs(transform.zoom_x))),
+            int(round(height * abs(transform.zoom_y))))
+
+
+def transformed_bounds(width: int, height: int,
+                       transform: Transform) -> Tuple[int, int, int, int]:
+    """ find where a transformed image is drawn
+
+    the image is centered on the position of its layer, then rotated about
+    that position.
+
+    :returns: (left, top, right, bottom) relative to the layer position
+    """
+    scaled_width, scaled_height = scaled_size(width, height, transform)
+    left, top = -(scaled_width // 2), -(scaled_height // 2)
+    right, bottom = left + scaled_width, top + scaled_height
+    if transform.angle % 360 == 0:
+        return left, top, right, bottom
+
+    radians = math.radians(transform.angle)
+    cos, sin = math.cos(radians), math.sin(radians)
+    xs = []
+    ys = []
+    for x, y in ((left, top), (right, top), (left, bottom), (right, bottom)):
+        xs.append(x * cos - y * sin)
+        ys.append(x * sin + y * cos)
+    # allow for float error so that right angles don't grow a pixel
+    return (math.floor(min(xs) + 1e-6), math.floor(min(ys) + 1e-6),
+            math.ceil(max(xs) - 1e-6), math.ceil(max(ys) - 1e-6))
+
+
+def tint(data: bytearray, color: Color):
+    """ multiply each channel of RGBA data by a color, in place """
+    for channel, value in enumerate(color):
+        if value != 255:
+            table = bytes((v * value + 127) // 255 for v in range(256))
+            data[channel::4] = data[channel::4].translate(table)
+
+
+def transform_image(image: RGBAImage,
+                    transform: Transform) -> Tuple[RGBAImage, int, int]:
+    """ apply a transform to an image
+
+    pixels are sampled from the nearest source pixel. negative zoom mirrors
+    the image along that axis.
+
+    :returns: (image, left, top), where left and top are the position of
+              the image relative to the layer position
+    """
+    left, top, right, bottom = transformed_bounds(
+        image.width, image.height, transform)
+    width, height = right - left, bottom - top
+    scaled_width, scaled_height = scaled_size(
+        image.width, image.height, transform)
+    if scaled_width == 0 or scaled_height == 0:
+        return RGBAImage(0, 0), 0, 0
+
+    # source pixels are moved around as whole 32-bit words
+    source = array('I', bytes(image))
+    flip_x = transform.flipped != (transform.zoom_x < 0)
+    flip_y = transform.zoom_y < 0
+    columns = [x * image.width // scaled_width for x in range(scaled_width)]
+    rows = [y * image.height // scaled_height for y in range(scaled_height)]
+    if flip_x:
+        columns = [image.width - 1 - x for x in columns]
+    if flip_y:
+        rows = [image.height - 1 - y for y in rows]
+
+    if transform.angle % 360 == 0:
+        pixels = array('I')
+        identity = columns == list(range(image.width))
+        for y in rows:
+            row = source[y * image.width:(y + 1) * image.width]
+            pixels.extend(row if identity else [row[x] for x in columns])
+    else:
+        pixels = array('I', bytes(width * height * 4))
+        radians = math.radians(transform.angle)
+        cos, sin = math.cos(radians), math.sin(radians)
+        # the unrotated top left corner of the scaled image
+        origin_x, origin_y = scaled_width // 2, scaled_height // 2
+        for out_y in range(height):
+            # rotate the center of each pixel back onto the scaled image
+            y = top + out_y + 0.5
+            x = left + 0.5
+            u = x * cos + y * sin + origin_x
+            v = -x * sin + y * cos + origin_y
+            offset = out_y * width
+            for out_x in range(width):
+                if 0 <= u < scaled_width and 0 <= v < scaled_height:
+                    pixels[offset + out_x] = source[
+                        rows[int(v)] * image.width + columns[int(u)]]
+                u += cos
+                v -= sin
+
+    data = bytearray(pixels.tobytes())
+    if transform.color != WHITE:
+        tint(data, transform.color)
+    return RGBAImage(width, height, data), left, top
+
+
+def blend(canvas: bytearray, canvas_width: int, image: RGBAImage,
+          x: int, y: int):
+    """ draw an image over RGBA data with alpha blending, in place
+
+    runs of opaque pixels are copied as whole slices, as are all visible
+    pixels of rows drawn over an empty part of the canvas. only pixels with
+    partial alpha over pixels that are not empty are blended one at a time.
+
+    the image must fit within the canvas.
+    """
+    words = memoryview(canvas).cast('I')
+    source = memoryview(image).cast('I')
+    alphas = image[3::4]
+    width = image.width
+    for row in range(image.height):
+        start = row * width
+        target = (y + row) * canvas_width + x
+        row_alphas = alphas[start:start + width]
+        under = canvas[target * 4 + 3:(target + width) * 4:4]
+        if not under.strip(b'\x00'):
+            # nothing is below, so every visible pixel is copied as it is
+            for run in _visible.finditer(row_alphas):
+                left, right = run.span()
+                words[target + left:target + right] = \
+                    source[start + left:start + right]
+            continue
+        for run in _opaque.finditer(row_alphas):
+            left, right = run.span()
+            words[target + left:target + right] = \
+                source[start + left:start + right]
+        for run in _partial.finditer(row_alphas):
+            for index in range(*run.span()):
+                alpha = row_alphas[index]
+                base = (target + index) * 4
+                below = canvas[base + 3]
+                if below == 0:
+                    words[target + index] = source[start + index]
+                    continue
+                # straight alpha "over" compositing
+                remaining = below * (255 - alpha) // 255
+                total = alpha + remaining
+                pixel = (start + index) * 4
+                for channel in range(3):
+                    canvas[base + channel] = (
+                        image[pixel + channel] * alpha
+                        + canvas[base + channel] * remaining) // total
+                canvas[base + 3] = total
+    words.release()
+
+
+def layer_bounds(spr, layer: Layer) -> Optional[Tuple[int, int, int, int]]:
+    """ find where a layer is drawn, relative to the frame origin
+
+    only the size of the image is read from the spr file, so nothing is
+    rendered.
+
+    :returns: (left, top, right, bottom), or None if no image is shown
+    """
+    index = layer_image_index(spr, layer)
+    if index is None:
+        return None
+    width, height = spr.size(index)
+    left, top, right, bottom = transformed_bounds(
+        width, height, layer_transform(layer))
+    if left == right or top == bottom:
+        return None
+    x, y = layer.offset
+    return left + x, top + y, right + x, bottom + y
+
+
+def union(boxes) -> Tuple[int, int, int, int]:
+    """ the smallest box that holds every box, all 0 when there are none """
+    boxes = [box for box in boxes if box is not None and box[0] != box[2]]
+    if not boxes:
+        return (0, 0, 0, 0)
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+
+def frame_bounds(spr, frame: Frame) -> Tuple[int, int, int, int]:
+    """ find the box that holds every layer of a frame
+
+    :returns: (left, top, right, bottom) relative to the frame origin, all
+              0 for an empty frame
+    """
+    return union(layer_bounds(spr, layer) for layer in frame.layers)
+
+
+class BoundingBoxes:
+    """ the bounding boxes of every frame and animation of an act file
+
+    the boxes are computed once from the layer offsets, zoom and rotation
+    and the image sizes in the spr file, and kept in flat arrays, so they
+    can be used for culling and hit testing without rendering anything.
+    boxes are (left, top, right, bottom) relative to the frame origin.
+    """
+
+    def __init__(self, act, spr):
+        self.frames = array('i')
+        self.animations = array('i')
+        self.frame_starts = array('L', (0,))
+        for animation in act.animations:
+            boxes = [frame_bounds(spr, frame) for frame in animation.frames]
+            for box in boxes:
+                self.frames.extend(box)
+            self.animations.extend(union(boxes))
+            self.frame_starts.append(len(self.frames) // 4)
+
+    def frame(self, animation: int,
+              frame: int) -> Tuple[int, int, int, int]:
+        """ the box of a frame of an animation """
+        start = self.frame_starts[animation]
+        if not 0 <= frame < self.frame_starts[animation + 1] - start:
+            raise IndexError('frame index out of range')
+        offset = (start + frame) * 4
+        return tuple(self.frames[offset:offset + 4])
+
+    def animation(self, animation: int) -> Tuple[int, int, int, int]:
+        """ the box that holds every frame of an animation """
+        return tuple(self.animations[animation * 4:animation * 4 + 4])
+
+    def hit(self, animation: int, frame: int, x: int, y: int) -> bool:
+        """ whether a point relative to the frame origin is in its box """
+        left, top, right, bottom = self.frame(animation, frame)
+        return left <= x < right and top <= y < bottom
+
+
+class Renderer:
+    """ composites the frames of an act file using the images of a spr file
+
+    transformed layer images are cached by their spr image index and
+    transform, so repeated layers are only transformed once.
+    """
+
+    def __init__(self, act, spr, palette: Palette = None,
+                 cache_size: int = TRANSFORM_CACHE_SIZE):
+        """
+        :param act: the act file with the animations
+        :param spr: the spr file with the images
+        :param palette: the palette to use instead of the embedded palette
+        :param cache_size: how many transformed images to keep
+        """
+        self.act = act
+        self.spr = spr
+        self.palette = palette
+        self.cache_size = cache_size
+        self.transformed = OrderedDict()
+
+    def layer_image(self, layer: Layer):
+        """ get the transformed image of a layer
+
+        :returns: (image, left, top) relative to the layer position, or None
+                  if the layer shows no image
+        """
+        index = layer_image_index(self.spr, layer)
+        if index is None:
+            return None
+        key = (index, layer_transform(layer))
+        if key in self.transformed:
+            self.transformed.move_to_end(key)
+            return self.transformed[key]
+        image = self.spr.render(index, self.palette)
+        result = transform_image(image, key[1])
+        self.transformed[key] = result
+        if len(self.transformed) > self.cache_size:
+            self.transformed.popitem(last=False)
+        return result
+
+    def render_frame(self, frame: Frame) -> RenderedFrame:
+        """ composite the layers of a frame, from first to last
+
+        the image is just large enough to hold every layer.
+        """
+        placed = []
+        for layer in frame.layers:
+            result = self.layer_image(layer)
+            if result is None or not result[0].width:
+                continue
+            image, left, top = result
+            placed.append((image, layer.offset.x + left,
+                           layer.offset.y + top))
+        if not placed:
+            return RenderedFrame(RGBAImage(0, 0), Point(0, 0))
+
+        left = min(x for _, x, _ in placed)
+        top = min(y for _, _, y in placed)
+        right = max(x + image.width for image, x, _ in placed)
+        bottom = max(y + image.height for image, _, y in placed)
+        width, height = right - left, bottom - top
+        canvas = bytearray(width * height * 4)
+        for image, x, y in placed:
+            blend(canvas, width, image, x - left, y - top)
+        return RenderedFrame(RGBAImage(width, height, canvas),
+                             Point(-left, -top))
+
+    def render(self, animation: int, frame: int) -> RenderedFrame:
+        """ composite a frame of an animation in the act file """
+        return self.render_frame(
+            self.act.animations[animation].frames[frame])
+
+    def render_animation(self, animation: int) -> List[RenderedFrame]:
+        """ composite every frame of an animation in the act file """
+        return [self.render_frame(frame)
+                for frame in self.act.animations[animation].frames]
+
+
+def render_frame(act, spr, animation: int, frame: int,
+                 palette: Palette = None) -> RenderedFrame:
+    """ composite a single frame of an act file
+
+    :param act: the act file with the animations
+    :param spr: the spr file with the images
+    :param animation: the index of the animation
+    :param frame: the index of the frame in the animation
+    :param palette: the palette to use instead of the embedded palette
+    """
+    return Renderer(act, spr, palette).render(animation, frame)
+
+
+def render_animation(act, spr, animation: int,
+                     palette: Palette = None) -> List[RenderedFrame]:
+    """ composite every frame of an animation of an act file
+
+    the frames share a renderer, so each transformed image is only made
+    once for the whole animation.
+    """
+    return Renderer(act, spr, palette).render_animation(animation)
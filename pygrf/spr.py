@@ -1,40 +1,83 @@
 """ spr file parsing """
+import collections
+import re
 import struct
-from typing import Tuple, Sequence
-from itertools import chain
+import warnings
+from typing import Any, NamedTuple, Optional, Sequence, Tuple
 from .exceptions import FileParseError
-from .graphics import Image, Color
+from .graphics import Image, IndexedImage, Palette, RGBAImage, flip_rows
 from .filetypes import parse_header, Header
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-color_struct = struct.Struct('<3Bx')
+
+# how many rendered images a SPR keeps by default
+RENDER_CACHE_SIZE = 256
+
+# a run of zeros in pal image data
+_zeros = re.compile(b'\x00+')
+
+
+class ImageEntry(NamedTuple):
+    """ the location and dimensions of an image in a spr file """
+    offset: int
+    width: int
+    height: int
+
+
+class SpriteArrays(NamedTuple):
+    """ every image of a spr file decoded into numpy arrays
+
+    images are placed in the top left corner of the arrays, padded with
+    transparent pixels up to the largest image of their kind.
+    """
+    #: the (n, height, width) uint8 palette indices of the pal images
+    indices: Any
+    #: the (m, height, width, 4) uint8 RGBA pixels of the rgb images
+    rgba: Any
+    #: the (n + m, 2) (width, height) of every image
+    sizes: Any
 
 
 class SprParser:
     """ base sprite file parser class """
 
     count_struct = struct.Struct('')
+    pal_struct = struct.Struct('<2H')
+    rgb_struct = struct.Struct('<2H')
 
-    def __init__(self, header: Header, data: bytes):
-        """ create a new spr parser that parses the given data """
+    def __init__(self, header: Header, data):
+        """ create a new spr parser that parses the given data
+
+        :param header: the header of the spr file
+        :param data: a buffer holding the data of the spr file
+        """
         self.header = header
         self.data = data
         self.palette = None
+        try:
+            self.counts = self.parse_count()
+            self.images = self.parse_table()
+        except struct.error:
+            raise FileParseError('invalid image data')
 
     @property
     def count(self) -> int:
         """ the number of images contained in the file """
-        return sum(self.parse_count())
+        return len(self.images)
 
     @property
     def pal_count(self) -> int:
         """ the number of pal images """
-        return self.parse_count()[0]
+        return self.counts[0]
 
     @property
     def rgb_count(self) -> int:
         """ the number of rgb images """
-        return self.parse_count()[1]
+        return self.counts[1]
 
     @property
     def offset(self):
@@ -45,15 +88,43 @@ class SprParser:
         """ parse the counts from file """
         raise NotImplementedError
 
-    def parse_palette(self):
+    def parse_table(self) -> Tuple[ImageEntry, ...]:
+        """ find the offset and dimensions of every image in a single pass
+
+        pal images come first, followed by rgb images. the data of every
+        image must fit in the file, so truncated files fail here rather than
+        when their images are read.
+        """
+        images = []
+        offset = self.offset
+        length = len(self.data)
+        for _ in range(self.pal_count):
+            width, height = self.pal_struct.unpack_from(self.data, offset)[:2]
+            images.append(ImageEntry(offset, width, height))
+            offset += self.pal_size(offset)
+            if offset > length:
+                raise FileParseError('truncated image data')
+        for _ in range(self.rgb_count):
+            width, height = self.rgb_struct.unpack_from(self.data, offset)
+            images.append(ImageEntry(offset, width, height))
+            offset += self.rgb_size(offset)
+            if offset > length:
+                raise FileParseError('truncated image data')
+        return tuple(images)
+
+    def parse_palette(self) -> Palette:
         """ parse an embedded palette """
         raise NotImplementedError
 
-    def parse_pal(self, offset) -> Image:
-        """ parse the pal image found at the offset """
+    def parse_indices(self, offset) -> IndexedImage:
+        """ parse the palette indices of the pal image found at the offset """
         raise NotImplementedError
 
-    def parse_rgb(self, offset) -> Image:
+    def parse_pal(self, offset) -> RGBAImage:
+        """ parse the pal image found at the offset """
+        return self.parse_indices(offset).apply()
+
+    def parse_rgb(self, offset) -> RGBAImage:
         """ parse the rgb image found at the offset """
         raise NotImplementedError
 
@@ -67,43 +138,36 @@ class SprParser:
 
     def pal_offset(self, index) -> int:
         """ get the offset of a pal image """
-        offset = self.offset
-        for _ in range(index):
-            offset += self.pal_size(offset)
-        return offset
+        return self.images[index].offset
 
     def rgb_offset(self, index) -> int:
         """ get the offset of an rgb image
 
         index does *NOT* include the pal images. index 0 is the first rgb image
         """
-        offset = self.pal_offset(self.pal_count)
-        for _ in range(index):
-            offset += self.rgb_size(offset)
-        return offset
+        return self.images[self.pal_count + index].offset
 
-    def get_palette(self) -> Sequence[Color]:
+    def get_palette(self) -> Palette:
         """ get the palette for pal image parsing """
         if self.palette is None:
-            return self.parse_palette()
+            self.palette = self.parse_palette()
         return self.palette
 
-    def get_image(self, index) -> Image:
+    def get_image(self, index) -> RGBAImage:
         """ get an image """
-        pal = self.pal_count
-        if index < pal and self.get_palette() is None:
-            raise FileParseError('unable to parse pal images with no palette')
-        if index < pal:
-            return self.parse_pal(self.pal_offset(index))
-        index -= pal
-        return self.parse_rgb(self.rgb_offset(index))
+        offset = self.images[index].offset
+        if index < self.pal_count:
+            if self.get_palette() is None:
+                raise FileParseError(
+                    'unable to parse pal images with no palette')
+            return self.parse_pal(offset)
+        return self.parse_rgb(offset)
 
 
 class Spr100(SprParser):
     """ the base version of the SPR format """
 
     count_struct = struct.Struct('<H')
-    pal_struct = struct.Struct('<2H')
 
     def parse_count(self):
         count, = self.count_struct.unpack_from(self.data, self.header.size)
@@ -116,13 +180,12 @@ class Spr100(SprParser):
         width, height = self.pal_struct.unpack_from(self.data, offset)
         return (width * height) + self.pal_struct.size
 
-    def parse_pal(self, offset):
+    def parse_indices(self, offset):
         width, height = self.pal_struct.unpack_from(self.data, offset)
-        palette = self.get_palette()
         start = offset + self.pal_struct.size
         stop = start + (width * height)
-        pixels = [palette[i] for i in self.data[start:stop]]
-        return Image(width, height, pixels)
+        indices = self.data[start:stop]
+        return IndexedImage(width, height, indices, self.get_palette())
 
     def rgb_size(self, offset):
         raise FileParseError('rgb images unsupported')
@@ -135,18 +198,14 @@ class Spr101(Spr100):
     """ adds an embedded palette to the end of the file """
 
     def parse_palette(self):
-        palette = color_struct.iter_unpack(self.data[-1024:])
-        palette = [Color(*color, 255) for color in palette]
-        # make the background (index 0) transparent
-        palette[0] = palette[0]._replace(a=0)
-        return palette
+        # the background (index 0) is transparent
+        return Palette.from_pal(self.data[-1024:])
 
 
 class Spr200(Spr101):
     """ adds support for RGB images """
 
     count_struct = struct.Struct('<2H')
-    rgb_struct = struct.Struct('<2H')
 
     def parse_count(self):
         return self.count_struct.unpack_from(self.data, self.header.size)
@@ -159,18 +218,18 @@ class Spr200(Spr101):
         # get the dimensions of the image
         width, height = self.rgb_struct.unpack_from(self.data, offset)
 
-        # get the pixel data as color objects
+        # the pixels are stored as ABGR, so reverse the bytes of each pixel
         start = offset + self.rgb_struct.size
         stop = start + (width * height * 4)
-        pixels = struct.iter_unpack('<I', self.data[start:stop])
-        pixels = [Color.from_rgba32(color[0]) for color in pixels]
+        abgr = self.data[start:stop]
+        pixels = bytearray(len(abgr))
+        for channel in range(4):
+            pixels[channel::4] = abgr[3 - channel::4]
 
-        # flip the image
-        pixels = [pixels[row * width:(row * width) + width]
-                  for row in range(height)]
-        pixels = list(chain.from_iterable(reversed(pixels)))
+        # the rows are stored from the bottom up
+        pixels = flip_rows(pixels, width * 4, height)
 
-        return Image(width, height, pixels)
+        return RGBAImage(width, height, pixels)
 
 
 class Spr201(Spr200):
@@ -182,38 +241,156 @@ class Spr201(Spr200):
         _, _, size = self.pal_struct.unpack_from(self.data, offset)
         return self.pal_struct.size + size
 
-    def parse_pal(self, offset):
+    def parse_indices(self, offset):
         width, height, size = self.pal_struct.unpack_from(self.data, offset)
-        palette = self.get_palette()
 
         start = offset + self.pal_struct.size
         stop = start + size
 
-        pixels = [palette[i] for i in _unpack_rle(self.data[start:stop])]
-
-        return Image(width, height, pixels)
+        indices = unpack_rle(self.data[start:stop], width * height)
+        return IndexedImage(width, height, indices, self.get_palette())
 
 
 class SPR:
     """ a container for sprite images """
 
-    def __init__(self, data: bytes):
+    def __init__(self, data, cache_size: int = RENDER_CACHE_SIZE):
+        """ parse a spr file
+
+        the data is never copied. only the offsets and sizes of the images
+        are read up front, and the pixels of an image are read from the data
+        when the image is requested.
+
+        :param data: the data of the spr file, as bytes or any other object
+                     supporting the buffer protocol, such as a memoryview,
+                     bytearray or mmap
+        :param cache_size: how many images rendered with a palette to keep
+        """
+        data = memoryview(data).cast('B')
         self.header = parse_header(data, b'SP')
         self.parser = _get_parser(data, self.header)
+        self.indexed = {}
+        self.rendered = collections.OrderedDict()
+        self.cache_size = cache_size
 
     def __len__(self) -> int:
         return self.parser.count
 
     def __getitem__(self, index) -> Image:
+        """ get an image as an Image tuple of (width, height, pixels)
+
+        deprecated, use image instead. the pixels are read as colors only
+        when they are accessed.
+        """
+        warnings.warn('SPR[index] is deprecated, use SPR.image(index)',
+                      DeprecationWarning, stacklevel=2)
+        image = self.image(index)
+        return Image(image.width, image.height, image.pixels)
+
+    def image(self, index) -> RGBAImage:
+        """ get an image
+
+        the image is an RGBAImage, which is itself a bytes object holding
+        the pixel data.
+        """
+        return self.parser.get_image(self.check_index(index))
+
+    def check_index(self, index) -> int:
+        """ validate an image index, resolving negative indices """
         if not isinstance(index, int):
             raise IndexError
-        length = len(self)
+        length = self.parser.count
         if index < 0:
             # index is already negative, so add it instead of subtract
             index = length + index
         if index < 0 or index >= length:
             raise IndexError
-        return self.parser.get_image(index)
+        return index
+
+    def size(self, index) -> Tuple[int, int]:
+        """ the (width, height) of an image, without parsing its pixels """
+        entry = self.parser.images[self.check_index(index)]
+        return entry.width, entry.height
+
+    def get_indexed(self, index) -> IndexedImage:
+        """ get the palette indices of a pal image
+
+        the indices are decoded once and kept, so the image can be rendered
+        with any number of palettes without parsing it again.
+        """
+        index = self.check_index(index)
+        if index >= self.parser.pal_count:
+            raise ValueError('not a pal image')
+        if index not in self.indexed:
+            offset = self.parser.images[index].offset
+            self.indexed[index] = self.parser.parse_indices(offset)
+        return self.indexed[index]
+
+    def render(self, index, palette: Palette = None) -> RGBAImage:
+        """ get an image, rendering pal images with the given palette
+
+        the most recently rendered images are cached by index and palette.
+        rgb images are not affected by the palette.
+
+        :param index: the index of the image
+        :param palette: the palette to use instead of the embedded palette
+        """
+        index = self.check_index(index)
+        if index >= self.parser.pal_count:
+            return self.parser.get_image(index)
+        if palette is None:
+            palette = self.palette
+        if palette is None:
+            raise FileParseError('unable to parse pal images with no palette')
+
+        key = (index, palette)
+        if key in self.rendered:
+            self.rendered.move_to_end(key)
+            return self.rendered[key]
+        image = self.get_indexed(index).apply(palette)
+        self.rendered[key] = image
+        if len(self.rendered) > self.cache_size:
+            self.rendered.popitem(last=False)
+        return image
+
+    def to_arrays(self) -> SpriteArrays:
+        """ decode every image into numpy arrays
+
+        this requires numpy to be installed.
+        """
+        if numpy is None:
+            raise ImportError('numpy is required to decode into arrays')
+        parser = self.parser
+        pal_images = parser.images[:parser.pal_count]
+        rgb_images = parser.images[parser.pal_count:]
+
+        sizes = numpy.array(
+            [(entry.width, entry.height) for entry in parser.images],
+            dtype=numpy.int64).reshape(-1, 2)
+        indices = numpy.zeros(_stack_shape(pal_images), dtype=numpy.uint8)
+        rgba = numpy.zeros(_stack_shape(rgb_images) + (4,), dtype=numpy.uint8)
+
+        for index, entry in enumerate(pal_images):
+            plane = numpy.frombuffer(
+                parser.parse_indices(entry.offset), dtype=numpy.uint8)
+            indices[index, :entry.height, :entry.width] = plane.reshape(
+                entry.height, entry.width)
+
+        for index, entry in enumerate(rgb_images):
+            pixels = numpy.frombuffer(
+                parser.data, dtype=numpy.uint8,
+                count=entry.width * entry.height * 4,
+                offset=entry.offset + parser.rgb_struct.size)
+            pixels = pixels.reshape(entry.height, entry.width, 4)
+            # flip the rows and reverse the ABGR bytes of each pixel
+            rgba[index, :entry.height, :entry.width] = pixels[::-1, :, ::-1]
+
+        return SpriteArrays(indices, rgba, sizes)
+
+    @property
+    def palette(self) -> Palette:
+        """ the embedded palette, or None if the file has none """
+        return self.parser.get_palette()
 
     @property
     def version(self) -> int:
@@ -221,28 +398,231 @@ class SPR:
         return self.header.version
 
 
-def _get_parser(data: bytes, header: Header) -> SprParser:
+PARSERS = {
+    0x100: Spr100,
+    0x101: Spr101,
+    0x200: Spr200,
+    0x201: Spr201,
+}
+
+
+class Optimized(NamedTuple):
+    """ the data of an optimized spr file """
+    data: bytes
+    #: the new index of every image of the original file
+    remap: Tuple[int, ...]
+
+
+def build_spr(pal_images: Sequence[IndexedImage],
+              rgb_images: Sequence[RGBAImage] = (),
+              palette: Palette = None, version: int = 0x201) -> bytes:
+    """ build the data of a spr file, the reverse of parsing it
+
+    :param pal_images: the pal images
+    :param rgb_images: the rgb images, from version 0x200
+    :param palette: the palette to embed, from version 0x101
+    :param version: the version of the file
+    """
+    if version not in PARSERS:
+        raise ValueError('unsupported version')
+    parser = PARSERS[version]
+    if rgb_images and version < 0x200:
+        raise ValueError('rgb images are not supported by this version')
+    if palette is None and version >= 0x101:
+        raise ValueError('a palette is required by this version')
+
+    if version >= 0x200:
+        counts = parser.count_struct.pack(len(pal_images), len(rgb_images))
+    else:
+        counts = parser.count_struct.pack(len(pal_images))
+    parts = [b'SP', struct.pack('<H', version), counts]
+    for image in pal_images:
+        if version >= 0x201:
+            packed = pack_rle(image)
+            parts.append(parser.pal_struct.pack(
+                image.width, image.height, len(packed)))
+            parts.append(packed)
+        else:
+            parts.append(parser.pal_struct.pack(image.width, image.height))
+            parts.append(bytes(image))
+    for image in rgb_images:
+        # rgb images are stored as ABGR, from the bottom up
+        abgr = bytearray(len(image))
+        for channel in range(4):
+            abgr[3 - channel::4] = image[channel::4]
+        parts.append(parser.rgb_struct.pack(image.width, image.height))
+        parts.append(flip_rows(abgr, image.width * 4, image.height))
+    if version >= 0x101:
+        parts.append(palette.to_pal())
+    return b''.join(parts)
+
+
+def quantize(image: RGBAImage, palette: Palette) -> Optional[IndexedImage]:
+    """ convert an rgb image to a pal image, if the palette allows it
+
+    every pixel must be either fully transparent or an opaque color from the
+    palette. the background color, index 0, is only used for transparency.
+
+    :returns: the pal image, or None if the image can't be converted
+    """
+    if image[3::4].translate(None, b'\x00\xff'):
+        return None
+    # the lowest index is used when a color is in the palette more than once
+    lookup = {palette[i * 4:i * 4 + 3]: i for i in range(255, 0, -1)}
+    indices = bytearray(image.width * image.height)
+    for position, (color, alpha) in enumerate(
+            struct.iter_unpack('3sB', image)):
+        if alpha:
+            index = lookup.get(color)
+            if index is None:
+                return None
+            indices[position] = index
+    return IndexedImage(image.width, image.height, indices, palette)
+
+
+def optimize(spr: SPR, version: int = None, trim: bool = True,
+             dedup: bool = True, quantize_rgb: bool = True) -> Optimized:
+    """ rewrite a spr file to be as small as possible
+
+    images that are moved, merged or converted get new indices, which are
+    returned with the data so act files can be updated to match. indices
+    count pal images first, followed by rgb images, as SPR does.
+
+    :param spr: the spr file to optimize
+    :param version: the version to write. by default 0x201, which compresses
+                    pal images, or 0x100 for files with no palette.
+    :param trim: remove empty margins from images. the same amount is removed
+                 from opposite sides, so images stay centered.
+    :param dedup: store identical images once
+    :param quantize_rgb: convert rgb images that only use palette colors into
+                         pal images
+    """
+    palette = spr.palette
+    if version is None:
+        version = 0x100 if palette is None else 0x201
+
+    images = [spr.get_indexed(index) for index in range(spr.parser.pal_count)]
+    images += [
+        spr.image(index) for index in range(spr.parser.pal_count, len(spr))]
+
+    optimized = []
+    for image in images:
+        if quantize_rgb and palette and isinstance(image, RGBAImage):
+            image = quantize(image, palette) or image
+        if trim:
+            left, top, right, bottom = image.visible_bounds()
+            if bottom:
+                dx = min(left, image.width - right)
+                dy = min(top, image.height - bottom)
+                image = image.crop(
+                    dx, dy, image.width - dx, image.height - dy)
+        optimized.append(image)
+
+    pal_images, rgb_images = [], []
+    positions = {}
+    keys = []
+    for number, image in enumerate(optimized):
+        is_pal = isinstance(image, IndexedImage)
+        if dedup:
+            key = (is_pal, image.width, image.height, bytes(image))
+        else:
+            key = number
+        if key not in positions:
+            target = pal_images if is_pal else rgb_images
+            positions[key] = len(target)
+            target.append(image)
+        keys.append((is_pal, key))
+    remap = [
+        positions[key] if is_pal else len(pal_images) + positions[key]
+        for is_pal, key in keys
+    ]
+
+    data = build_spr(pal_images, rgb_images, palette, version)
+    return Optimized(data, tuple(remap))
+
+
+def _get_parser(data, header: Header) -> SprParser:
     """ get the appropriate parser object based on the file version """
-    parsers = {
-        0x100: Spr100,
-        0x101: Spr101,
-        0x200: Spr200,
-        0x201: Spr201,
-    }
-    if header.version not in parsers:
+    if header.version not in PARSERS:
         raise FileParseError('unsupported version')
-    return parsers[header.version](header, data)
+    return PARSERS[header.version](header, data)
+
+
+def _stack_shape(images) -> Tuple[int, int, int]:
+    """ the shape of an array that can hold every one of the images """
+    height = max((entry.height for entry in images), default=0)
+    width = max((entry.width for entry in images), default=0)
+    return (len(images), height, width)
+
+
+def apply_palette(indices, palette: Palette):
+    """ apply a palette to an array of palette indices
+
+    this requires numpy to be installed.
+
+    :param indices: a uint8 array of any shape
+    :param palette: the palette to apply
+    :returns: a uint8 array with an extra axis of RGBA values
+    """
+    if numpy is None:
+        raise ImportError('numpy is required to decode into arrays')
+    colors = numpy.frombuffer(palette, dtype=numpy.uint8).reshape(-1, 4)
+    return colors[indices]
+
+
+def unpack_rle(data, size: int = None) -> bytearray:
+    """ unpack run-length encoded data
+
+    only runs of zeros are encoded. a zero byte is followed by the length of
+    the run, and every other byte is stored as it is. the literal bytes
+    between runs are found with bytes.find and copied as whole slices.
+
+    :param data: the encoded data
+    :param size: the expected size of the unpacked data. when given, the
+                 output is allocated up front and runs of zeros are skipped
+                 instead of written.
+    """
+    data = bytes(data)
+    out = bytearray() if size is None else bytearray(size)
+    position = 0
+    start = 0
+    end = len(data)
+    while start < end:
+        zero = data.find(0, start)
+        if zero == -1:
+            zero = end
+        literal = zero - start
+        out[position:position + literal] = data[start:zero]
+        position += literal
+        if zero + 1 >= end:
+            break
+        run = data[zero + 1]
+        if size is None:
+            out += bytes(run)
+        position += run
+        start = zero + 2
+    if size is not None and position != size:
+        raise FileParseError('invalid rle data')
+    return out
 
 
-def _unpack_rle(data: bytes) -> bytes:
-    """ unpack run-length encoded data """
+def pack_rle(data) -> bytes:
+    """ run-length encode data, the reverse of unpack_rle
+
+    runs of zeros longer than 255 bytes are split into several runs.
+    """
+    data = bytes(data)
     out = []
-    index = 0
-    while index < len(data):
-        if data[index] == 0:
-            index += 1
-            out += [0] * data[index]
-        else:
-            out.append(data[index])
-        index += 1
-    return out
+    start = 0
+    while True:
+        zero = data.find(0, start)
+        if zero == -1:
+            out.append(data[start:])
+            break
+        out.append(data[start:zero])
+        start = _zeros.match(data, zero).end()
+        full, rest = divmod(start - zero, 255)
+        out.append(b'\x00\xff' * full)
+        if rest:
+            out.append(bytes((0, rest)))
+    return b''.join(out)
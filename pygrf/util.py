@@ -1,7 +1,12 @@
+import contextlib
 import struct
 from .exceptions import FileParseError
 
 
+# which encodings to try before giving up on a name
+ENCODINGS = ['euc_kr', 'johab', 'uhc', 'mskanji']
+
+
 def get_version(stream, signature, supported=None):
     """
     Get the version number of a file and verify its signature
@@ -21,3 +26,15 @@ def get_version(stream, signature, supported=None):
         raise FileParseError('unsupported version')
  
     return version
+
+
+def decode_name(name):
+    """decode a name using multiple encodings"""
+    # try with each known encoding
+    for encoding in ENCODINGS:
+        with contextlib.suppress(UnicodeDecodeError):
+            return name.decode(encoding)
+    # upon failure, replace failed characters with their hex representation
+    name = name.decode(errors='backslashreplace')
+    name = name.replace('\\x', '')
+    return name
@@ -1,8 +1,15 @@
+import io
 import pytest
 from math import isclose
 
 
 from pygrf import open_act
+from pygrf.act import (
+    ACT, NO_IMAGE, Anchor, Animation, Frame, Layer, Timeline, build_act,
+    strip_layers)
+from pygrf.exceptions import FileParseError
+from pygrf.graphics import Color, Point
+from pygrf.grf import GRF, FileHeader, GRFWriter, rewrite_acts
 
 
 @pytest.mark.parametrize('name, version', (
@@ -119,4 +126,253 @@ def test_act_layer_has_correct_angle(data_files):
     act = open_act(data_files['agav.act'])
     assert act.animations[0].frames[0].layers[0].angle == 0.0
     angle = act.animations[24].frames[3].layers[0].angle
-    assert isclose(angle, 2.8026e-45, rel_tol=0.00001)
\ No newline at end of file
+    assert isclose(angle, 2.8026e-45, rel_tol=0.00001)
+
+
+def test_act_raises_on_truncated_data(data_files):
+    with open(data_files['agav.act'], 'rb') as f:
+        data = f.read()
+    with pytest.raises(FileParseError):
+        ACT(io.BytesIO(data[:len(data) // 2]))
+
+
+@pytest.mark.parametrize('name', ('cursors.act', 'agav.act'))
+def test_lazy_act_matches_eager_act(data_files, name):
+    act = open_act(data_files[name])
+    lazy = open_act(data_files[name], lazy=True)
+    assert lazy.triggers == act.triggers
+    assert len(lazy.animations) == len(act.animations)
+    assert tuple(lazy.animations) == act.animations
+
+
+def test_lazy_act_unpacks_animations_on_access(data_files):
+    act = open_act(data_files['agav.act'])
+    lazy = open_act(data_files['agav.act'], lazy=True)
+    assert not lazy.animations.cache
+    assert lazy.animations[8] == act.animations[8]
+    assert list(lazy.animations.cache) == [8]
+    assert lazy.animations[-1] is lazy.animations[39]
+
+
+def test_lazy_act_unpacks_single_frames(data_files):
+    act = open_act(data_files['agav.act'])
+    lazy = open_act(data_files['agav.act'], lazy=True)
+    assert lazy.animations.frame_count(8) == len(act.animations[8].frames)
+    assert lazy.animations.frame(8, 7) == act.animations[8].frames[7]
+    assert not lazy.animations.cache
+    with pytest.raises(IndexError):
+        lazy.animations[40]
+
+
+def test_lazy_act_raises_on_truncated_data(data_files):
+    with open(data_files['agav.act'], 'rb') as f:
+        data = f.read()
+    with pytest.raises(FileParseError):
+        ACT(io.BytesIO(data[:len(data) // 2]), lazy=True)
+
+
+@pytest.mark.parametrize('name', ('cursors.act', 'agav.act'))
+def test_compact_act_matches_eager_act(data_files, name):
+    act = open_act(data_files[name])
+    compact = open_act(data_files[name], compact=True)
+    assert compact.triggers == act.triggers
+    assert compact.animations == act.animations
+    assert act.animations == compact.animations
+
+
+def test_compact_act_builds_layers(data_files):
+    act = open_act(data_files['cursors.act'])
+    compact = open_act(data_files['cursors.act'], compact=True)
+    animation = compact.animations[1]
+    assert animation.interval == act.animations[1].interval
+    assert len(animation.frames) == 9
+    frame = animation.frames[-1]
+    assert frame.trigger == -1
+    assert len(frame.layers) == 4
+    assert frame.layers[0] == act.animations[1].frames[8].layers[0]
+    assert compact.animations[1].frames[1].layers[0].zoom == \
+        act.animations[1].frames[1].layers[0].zoom
+
+
+def test_act_can_not_be_lazy_and_compact(data_files):
+    with pytest.raises(ValueError):
+        open_act(data_files['agav.act'], lazy=True, compact=True)
+
+
+@pytest.mark.parametrize('mode', ({}, {'lazy': True}, {'compact': True}))
+def test_timeline_frame_at(data_files, mode):
+    act = open_act(data_files['agav.act'], **mode)
+    timeline = Timeline(act)
+    assert len(timeline) == 40
+    assert timeline.frame_time(8) == act.animations[8].interval * 24
+    assert timeline.duration(8) == 11 * timeline.frame_time(8)
+    assert timeline.frame_at(8, 0) == 0
+    assert timeline.frame_at(8, 7.5 * timeline.frame_time(8)) == 7
+    assert timeline.frame_at(8, timeline.duration(8)) == 0
+    assert timeline.frame_at(8, timeline.duration(8), loop=False) == 10
+
+
+def test_timeline_does_not_unpack_lazy_act(data_files):
+    act = open_act(data_files['agav.act'], lazy=True)
+    timeline = Timeline(act, frame_delay=25)
+    assert timeline.frame_at(8, 7.5 * act.animations.intervals[8] * 25) == 7
+    assert not act.animations.cache
+    timeline.events(8)
+    assert list(act.animations.cache) == [8]
+
+
+def test_timeline_triggers(data_files):
+    act = open_act(data_files['agav.act'])
+    timeline = Timeline(act)
+    event, = timeline.events(8)
+    assert event.frame == 7
+    assert event.name == 'vanberk_move.wav'
+    assert event.time == 7 * timeline.frame_time(8)
+    assert timeline.triggers_between(8, 0, event.time) == ()
+    assert timeline.triggers_between(8, event.time, 1e9) == (event,)
+    assert timeline.events(0) == ()
+
+
+@pytest.mark.parametrize('name', ('cursors.act', 'agav.act'))
+@pytest.mark.parametrize('mode', ({}, {'lazy': True}, {'compact': True}))
+def test_build_act_round_trip(data_files, name, mode):
+    with open(data_files[name], 'rb') as f:
+        data = f.read()
+    act = ACT(io.BytesIO(data), **mode)
+    assert build_act(
+        act.animations, act.triggers, act.version, act.reserved) == data
+
+
+@pytest.mark.parametrize('version', (0x200, 0x201, 0x202, 0x203, 0x204))
+def test_build_act_versions(data_files, version):
+    act = open_act(data_files['agav.act'])
+    data = build_act(act.animations, act.triggers, version)
+    rebuilt = ACT(io.BytesIO(data))
+    assert rebuilt.version == version
+    frame = rebuilt.animations[8].frames[7]
+    assert frame.trigger == 0
+    layer = act.animations[8].frames[7].layers[0]
+    assert frame.layers[0].offset == layer.offset
+    assert frame.layers[0].width == 0
+    if version >= 0x201:
+        assert rebuilt.triggers == act.triggers
+    if version >= 0x202:
+        assert rebuilt.animations[0].interval == act.animations[0].interval
+
+
+def test_build_act_keeps_anchors():
+    frame = Frame((Layer(Point(1, 2), 3, True),), 0,
+                  (Anchor(4, 5, 6, 7),), bytes(range(32)))
+    data = build_act((Animation((frame,), 2.0),), ('hit',), 0x203)
+    act = ACT(io.BytesIO(data))
+    assert act.animations[0].frames[0] == frame
+    compact = ACT(io.BytesIO(data), compact=True)
+    assert compact.animations[0].frames[0] == frame
+
+
+@pytest.mark.parametrize('mode', ({}, {'lazy': True}, {'compact': True}))
+def test_build_act_keeps_layer_flags(mode):
+    frame = Frame((Layer(Point(0, 0), 0, 2), Layer(Point(0, 0), 1, True)))
+    data = build_act((Animation((frame,)),))
+    act = ACT(io.BytesIO(data), **mode)
+    layers = act.animations[0].frames[0].layers
+    assert [layer.flipped for layer in layers] == [2, 1]
+    assert build_act(act.animations, act.raw_triggers, act.version,
+                     act.reserved, act.interval_count) == data
+
+
+@pytest.mark.parametrize('mode', ({}, {'lazy': True}, {'compact': True}))
+def test_build_act_keeps_missing_intervals(mode):
+    animations = (Animation((), 2.0), Animation((), 3.0))
+    data = build_act(animations, interval_count=1)
+    act = ACT(io.BytesIO(data), **mode)
+    assert act.interval_count == 1
+    assert [animation.interval for animation in act.animations] == [2.0, 4.0]
+    assert build_act(act.animations, act.raw_triggers, act.version,
+                     act.reserved, act.interval_count) == data
+
+
+def test_act_decodes_triggers_with_known_encodings():
+    name = '공격'.encode('euc_kr')
+    data = build_act((), (name, b'atk'))
+    act = ACT(io.BytesIO(data))
+    assert act.triggers == ('공격', 'atk')
+    assert act.raw_triggers == (name, b'atk')
+    assert build_act((), ('공격', 'atk')) == data
+
+
+def test_build_act_rejects_invalid_data():
+    with pytest.raises(ValueError):
+        build_act((), version=0x100)
+    with pytest.raises(ValueError):
+        build_act((), ('x' * 41,))
+
+
+def make_stripped_act(triggers=('atk',), interval_count=None):
+    layers = (
+        Layer(Point(0, 0), 0, False),
+        Layer(Point(0, 0), NO_IMAGE, False),
+        Layer(Point(0, 0), 1, False, Color(255, 255, 255, 0)),
+    )
+    animations = (Animation((Frame(layers), Frame(layers[1:]))),)
+    return build_act(animations, triggers, interval_count=interval_count)
+
+
+def test_strip_layers():
+    act = ACT(io.BytesIO(make_stripped_act()))
+    animation, = strip_layers(act.animations)
+    first, second = animation.frames
+    assert [layer.index for layer in first.layers] == [0]
+    assert second.layers == ()
+
+
+def test_rewrite_acts():
+    source = io.BytesIO()
+    with GRFWriter(source) as writer:
+        writer.add('a.act', make_stripped_act())
+        writer.add('b.act', build_act(()))
+        writer.add('c.txt', b'text')
+    source.seek(0)
+    output = io.BytesIO()
+    with GRF(source) as grf:
+        assert rewrite_acts(grf, output) == 1
+    output.seek(0)
+    with GRF(output) as grf:
+        act = grf.open('a.act')
+        assert len(act.animations[0].frames) == 2
+        assert len(act.animations[0].frames[0].layers) == 1
+        assert grf.open('b.act').animations == ()
+        assert grf.open('c.txt').data == b'text'
+
+
+def test_rewrite_acts_keeps_triggers_and_intervals():
+    name = '공격'.encode('euc_kr')
+    source = io.BytesIO()
+    with GRFWriter(source) as writer:
+        writer.add('a.act', make_stripped_act((name,), interval_count=0))
+    source.seek(0)
+    output = io.BytesIO()
+    with GRF(source) as grf:
+        assert rewrite_acts(grf, output) == 1
+    output.seek(0)
+    with GRF(output) as grf:
+        act = grf.open('a.act')
+        assert len(act.animations[0].frames[0].layers) == 1
+        assert act.raw_triggers == (name,)
+        assert act.interval_count == 0
+
+
+def test_rewrite_acts_keeps_raw_names():
+    source = io.BytesIO()
+    with GRFWriter(source) as writer:
+        writer.add('a.act', make_stripped_act(), b'a.act')
+        writer.add_archived('dir', FileHeader(0, 0, 0, 0, 0), b'', b'd\xfb')
+    source.seek(0)
+    output = io.BytesIO()
+    with GRF(source) as grf:
+        assert rewrite_acts(grf, output) == 1
+        names = dict(grf.index.names)
+    output.seek(0)
+    with GRF(output) as grf:
+        assert list(grf.files()) == list(names)
+        assert grf.index.names == names
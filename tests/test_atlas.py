@@ -0,0 +1,77 @@
+import io
+import pytest
+from pygrf import FileParseError, open_spr
+from pygrf.atlas import Atlas, build_atlas, pack
+
+
+def region_pixels(atlas, index):
+    region = atlas[index]
+    page = atlas.pages[region.page]
+    return page.crop(region.x, region.y,
+                     region.x + region.width, region.y + region.height)
+
+
+@pytest.mark.parametrize('trim_images', (True, False))
+def test_atlas_contains_every_image(data_files, trim_images):
+    spr = open_spr(data_files['201.spr'])
+    atlas = build_atlas(spr, page_size=16, trim_images=trim_images)
+    assert len(atlas) == len(spr)
+    for index in range(len(spr)):
+        image = spr.image(index)
+        region = atlas[index]
+        expected = image.crop(
+            region.left, region.top,
+            region.left + region.width, region.top + region.height)
+        assert region_pixels(atlas, index) == expected
+        assert (region.original_width, region.original_height) == \
+            (image.width, image.height)
+
+
+def test_atlas_merges_identical_images(data_files):
+    spr = open_spr(data_files['201.spr'])
+    atlas = build_atlas(spr)
+    assert atlas[0][:5] == atlas[2][:5]
+    assert atlas[1][:5] == atlas[3][:5]
+    assert atlas[0][:5] != atlas[1][:5]
+
+
+def test_atlas_without_merge_keeps_separate_regions(data_files):
+    spr = open_spr(data_files['201.spr'])
+    atlas = build_atlas(spr, merge=False)
+    positions = {(region.page, region.x, region.y) for region in
+                 atlas.regions.values()}
+    assert len(positions) == 4
+
+
+def test_atlas_uv(data_files):
+    atlas = build_atlas(open_spr(data_files['201.spr']), trim_images=False,
+                        page_size=8)
+    u0, v0, u1, v1 = atlas.uv(1)
+    assert (u1 - u0, v1 - v0) == (6 / 8, 6 / 8)
+
+
+def test_atlas_save_and_load(data_files):
+    atlas = build_atlas(open_spr(data_files['201.spr']), page_size=8)
+    stream = io.BytesIO()
+    atlas.save(stream)
+    stream.seek(0)
+    loaded = Atlas.load(stream)
+    assert loaded.regions == atlas.regions
+    assert loaded.pages == atlas.pages
+    assert loaded.page_width == 8
+
+
+def test_atlas_load_fails_invalid_data():
+    with pytest.raises(FileParseError):
+        Atlas.load(io.BytesIO(b'invalid'))
+
+
+def test_pack_starts_new_pages():
+    positions = pack([(4, 4)] * 5, 8, 8, padding=0)
+    assert positions == [(0, 0, 0), (0, 4, 0), (0, 0, 4), (0, 4, 4),
+                         (1, 0, 0)]
+
+
+def test_pack_fails_oversized_rectangles():
+    with pytest.raises(ValueError):
+        pack([(9, 1)], 8, 8)
@@ -1,8 +1,10 @@
 import io
 import pytest
+import struct
 
 from pygrf import open_gat
 from pygrf import FileParseError
+from pygrf.gat import GAT, Bitmap, parse_tile, split_tiles
 
 
 @pytest.mark.parametrize('name, expected', (('a.gat', 10), ('b.gat', 100)))
@@ -31,16 +33,18 @@ def test_open_gat_raises_gat_error(data_files, name):
         open_gat(data_files[name])
 
 
-def test_gat_is_io_object(data_files):
+def test_gat_does_not_keep_file_data(data_files):
     gat = open_gat(data_files['a.gat'])
-    assert isinstance(gat, io.IOBase)
+    assert not isinstance(gat, io.IOBase)
+    assert gat.columns.types.typecode == 'B'
 
 
-@pytest.mark.parametrize('name', ('a.gat', 'b.gat'))
-def test_gat_data_matches_source_data(data_files, name):
-    source = open(data_files[name], 'rb')
-    gat = open_gat(data_files[name])
-    assert gat.read() == source.read()
+def test_gat_keeps_large_types():
+    tile = struct.pack('<ffffI', 0, 0, 0, 0, 300)
+    data = b'GRAT\x01\x02' + struct.pack('<II', 1, 1) + tile
+    gat = GAT(io.BytesIO(data))
+    assert gat.columns.types.typecode == 'H'
+    assert gat[0, 0].type == 300
 
 
 @pytest.mark.parametrize('x, y, expected', (
@@ -86,3 +90,90 @@ def test_gat_tile_raise_index_error_bad_coordinates(data_files, x, y):
     gat = open_gat(data_files['a.gat'])
     with pytest.raises(IndexError):
         gat[x, y]
+
+
+@pytest.mark.parametrize('name', ('a.gat', 'b.gat'))
+def test_gat_columns_match_parsed_tiles(data_files, name):
+    gat = open_gat(data_files[name])
+    with open(data_files[name], 'rb') as f:
+        tiles = [parse_tile(data) for data in split_tiles(f)]
+    assert len(gat.columns.types) == len(tiles)
+    assert list(gat.columns.types) == [tile.type for tile in tiles]
+    assert list(gat.columns.top_right) == [tile.top_right for tile in tiles]
+    for index, tile in enumerate(tiles):
+        assert gat[index % gat.width, index // gat.width] == tile
+
+
+def test_gat_region(data_files):
+    gat = open_gat(data_files['b.gat'])
+    region = gat[10:20, 5:8]
+    assert (region.x, region.y, region.width, region.height) == (10, 5, 10, 3)
+    assert len(region.columns.types) == 30
+    for y in range(3):
+        for x in range(10):
+            assert region[x, y] == gat[x + 10, y + 5]
+    with pytest.raises(IndexError):
+        region[10, 0]
+
+
+def test_gat_region_clamps_to_map(data_files):
+    gat = open_gat(data_files['a.gat'])
+    region = gat[-3:, :100]
+    assert (region.x, region.y, region.width, region.height) == (7, 0, 3, 10)
+    assert gat[2, 1:3].width == 1
+    assert gat[2, 1:3][0, 1] == gat[2, 2]
+    with pytest.raises(ValueError):
+        gat[::2, :]
+
+
+@pytest.mark.parametrize('x, y', (
+    (-1, slice(0, 5)),
+    (10, slice(0, 5)),
+    (slice(0, 5), -1),
+    (slice(None), 10),
+))
+def test_gat_region_raises_index_error_bad_coordinates(data_files, x, y):
+    gat = open_gat(data_files['a.gat'])
+    with pytest.raises(IndexError):
+        gat[x, y]
+
+
+def test_gat_row_and_column(data_files):
+    gat = open_gat(data_files['b.gat'])
+    row = gat.row(3)
+    assert list(row.types) == [gat[x, 3].type for x in range(gat.width)]
+    column = gat.column(7)
+    assert list(column.top_left) == [
+        gat[7, y].top_left for y in range(gat.height)]
+    with pytest.raises(IndexError):
+        gat.row(gat.height)
+    with pytest.raises(IndexError):
+        gat.column(-1)
+
+
+@pytest.mark.parametrize('name', ('a.gat', 'b.gat'))
+def test_gat_bitmaps(data_files, name):
+    gat = open_gat(data_files[name])
+    walkable = gat.walkable()
+    snipable = gat.snipable()
+    count = 0
+    for y in range(gat.height):
+        for x in range(gat.width):
+            tile_type = gat[x, y].type
+            assert walkable[x, y] == (tile_type in (0, 3))
+            assert snipable[x, y] == (tile_type in (0, 3, 4, 5))
+            count += tile_type in (0, 3)
+    assert walkable.count() == count
+    assert len(walkable.data) == -(-gat.width * gat.height // 8)
+    assert walkable.unpack() == bytes(
+        gat[i % gat.width, i // gat.width].type in (0, 3)
+        for i in range(gat.width * gat.height))
+
+
+def test_bitmap_from_flags():
+    bitmap = Bitmap.from_flags(3, 3, b'\x01\x00\x01\x00\x00\x00\x00\x00\x01')
+    assert bitmap.data == b'\x05\x01'
+    assert bitmap[2, 0] and bitmap[2, 2] and not bitmap[1, 1]
+    assert bitmap.count() == 3
+    with pytest.raises(IndexError):
+        bitmap[3, 0]
@@ -0,0 +1,109 @@
+import pickle
+import pytest
+from pygrf.graphics import Color, IndexedImage, Palette, RGBAImage
+from pygrf.graphics import expand_palette, flip_rows
+
+
+def test_rgba_image_supports_buffer_protocol():
+    image = RGBAImage(2, 1, b'\x01\x02\x03\x04\x05\x06\x07\x08')
+    view = memoryview(image)
+    assert view.nbytes == 8
+    assert bytes(image.row(0)) == bytes(range(1, 9))
+
+
+def test_rgba_image_pixels_are_colors():
+    image = RGBAImage(2, 1, b'\x01\x02\x03\x04\x05\x06\x07\x08')
+    assert list(image.pixels) == [Color(1, 2, 3, 4), Color(5, 6, 7, 8)]
+    assert image.pixels[-1] == Color(5, 6, 7, 8)
+    assert len(image.pixels) == 2
+
+
+def test_rgba_image_checks_dimensions():
+    with pytest.raises(ValueError):
+        RGBAImage(2, 2, bytes(4))
+
+
+def test_rgba_image_defaults_to_transparent():
+    assert RGBAImage(3, 2) == bytes(24)
+
+
+def test_images_compare_dimensions():
+    data = bytes(range(64))
+    assert RGBAImage(2, 8, data) == RGBAImage(2, 8, data)
+    assert RGBAImage(2, 8, data) != RGBAImage(8, 2, data)
+    assert IndexedImage(2, 8, data[:16]) != IndexedImage(8, 2, data[:16])
+    assert IndexedImage(4, 4, data[:16]) != RGBAImage(2, 2, data[:16])
+    assert len({RGBAImage(2, 8, data), RGBAImage(2, 8, data),
+                RGBAImage(8, 2, data)}) == 2
+
+
+def test_rgba_image_pickles():
+    image = RGBAImage(1, 2, bytes(range(8)))
+    copy = pickle.loads(pickle.dumps(image))
+    assert (copy.width, copy.height, copy) == (1, 2, image)
+
+
+def test_rgba_image_flipped():
+    image = RGBAImage(1, 2, bytes(range(8)))
+    flipped = image.flipped()
+    assert flipped == bytes([4, 5, 6, 7, 0, 1, 2, 3])
+    assert (flipped.width, flipped.height) == (1, 2)
+
+
+def test_flip_rows():
+    assert flip_rows(b'aabbcc', 2, 3) == b'ccbbaa'
+
+
+def test_expand_palette():
+    palette = [Color(0, 0, 0, 0), Color(10, 20, 30, 255)]
+    data = expand_palette(b'\x01\x00\x01', palette)
+    assert data == bytes([10, 20, 30, 255, 0, 0, 0, 0, 10, 20, 30, 255])
+
+
+def test_palette_from_pal_sets_alpha():
+    palette = Palette.from_pal(bytes([1, 2, 3, 0]) * 256)
+    assert palette.colors[0] == Color(1, 2, 3, 0)
+    assert palette.colors[255] == Color(1, 2, 3, 255)
+
+
+def test_palette_requires_256_colors():
+    with pytest.raises(ValueError):
+        Palette(bytes(4))
+
+
+def test_indexed_image_applies_palettes():
+    red = Palette.from_colors([Color(0, 0, 0, 0), Color(255, 0, 0, 255)])
+    blue = Palette.from_colors([Color(0, 0, 0, 0), Color(0, 0, 255, 255)])
+    image = IndexedImage(2, 1, b'\x00\x01', red)
+    assert list(image.pixels) == [Color(0, 0, 0, 0), Color(255, 0, 0, 255)]
+    assert image.apply(blue).pixels[1] == Color(0, 0, 255, 255)
+
+
+def test_indexed_image_without_palette():
+    with pytest.raises(ValueError):
+        IndexedImage(1, 1).apply()
+
+
+def test_palette_items_are_colors():
+    palette = Palette.from_colors([Color(1, 2, 3, 4), Color(5, 6, 7, 8)])
+    assert palette[0] == Color(1, 2, 3, 4)
+    assert palette[1] == Color(5, 6, 7, 8)
+    assert palette[-1] == Color(0, 0, 0, 0)
+    assert palette[0:3] == b'\x01\x02\x03'
+    with pytest.raises(IndexError):
+        palette[256]
+
+
+def test_palette_is_a_sequence_of_colors():
+    palette = Palette.from_colors([Color(1, 2, 3, 4)])
+    assert len(palette) == 256
+    assert list(palette) == [Color(1, 2, 3, 4)] + [Color(0, 0, 0, 0)] * 255
+    assert len(bytes(palette)) == 1024
+
+
+def test_rgba_image_visible_bounds():
+    pixels = bytearray(4 * 4 * 4)
+    pixels[(1 * 4 + 2) * 4 + 3] = 255
+    pixels[(2 * 4 + 1) * 4 + 3] = 255
+    assert RGBAImage(4, 4, pixels).visible_bounds() == (1, 1, 3, 3)
+    assert RGBAImage(4, 4).visible_bounds() == (0, 0, 0, 0)
@@ -1,10 +1,15 @@
 import filecmp
 import io
 import os
+import re
+import struct
+import zlib
+from random import Random
 import pytest
 from pygrf import open_grf
-from pygrf import GRFParseError
-from pygrf.grf import GRF
+from pygrf import GRFParseError, diff
+from pygrf.grf import GRF, GRFWriter, READ_CHUNK_SIZE
+from pygrf.grf import FileHeader, find_duplicates, repack
 from pygrf.gat import GAT
 
 
@@ -170,3 +175,341 @@ def test_grf_extract_raises_file_not_found_error(data_files):
     grf = open_grf(data_files['ab.grf'])
     with pytest.raises(FileNotFoundError):
         grf.extract('invalid file name')
+
+
+def build_grf(files):
+    """build the raw data of a grf archive containing the given files"""
+    body = b''
+    index = b''
+    for name, data in files.items():
+        compressed = zlib.compress(data)
+        index += b'data\\' + name.encode() + b'\x00'
+        index += struct.pack('<IIIBI', len(compressed), len(compressed),
+                             len(data), 1, len(body))
+        body += compressed
+    index = zlib.compress(index)
+    header = b'Master of Magic' + bytes(15)
+    header += struct.pack('<IIII', len(body), 0, len(files) + 7, 0x200)
+    return header + body + struct.pack('<II', len(index), 0) + index
+
+
+@pytest.fixture
+def large_grf():
+    random = Random(0)
+    words = [bytes(random.choices(b'abcdefgh', k=8)) for _ in range(64)]
+    data = b' '.join(random.choices(words, k=100000))
+    return GRF(io.BytesIO(build_grf({'large.dat': data}))), data
+
+
+def test_grf_open_stream_reads_file(large_grf):
+    grf, data = large_grf
+    stream = grf.open_stream('large.dat', interval=4096)
+    assert stream.read() == data
+
+
+@pytest.mark.parametrize('position', (0, 5000, 300000, 899999))
+def test_grf_open_stream_seeks(large_grf, position):
+    grf, data = large_grf
+    stream = grf.open_stream('large.dat', interval=4096)
+    stream.read()
+    stream.seek(position)
+    assert stream.read(1000) == data[position:position + 1000]
+
+
+def test_grf_open_stream_records_checkpoints(large_grf):
+    grf, data = large_grf
+    grf.open_stream('large.dat', interval=4096).read()
+    checkpoints = grf.checkpoints['large.dat']
+    assert len(checkpoints) > len(data) // 8192
+
+
+def test_grf_open_stream_spaces_checkpoints_by_interval(large_grf):
+    grf, data = large_grf
+    stream = grf.open_stream('large.dat', interval=100000)
+    stream.seek(len(data) - 10)
+    assert stream.read() == data[-10:]
+    outputs = [output for output, _, _ in grf.checkpoints['large.dat']]
+    assert outputs == list(range(0, len(data), 100000))
+
+
+def test_grf_open_stream_inflates_from_nearest_checkpoint(large_grf):
+    grf, data = large_grf
+    grf.open_stream('large.dat', interval=4096).read()
+    stream = grf.open_stream('large.dat')
+    stream.seek(-10, io.SEEK_END)
+    assert stream.read() == data[-10:]
+    # only the data after the last checkpoint was read again
+    last_checkpoint = grf.checkpoints['large.dat'][-1]
+    assert stream.compressed - last_checkpoint[1] <= READ_CHUNK_SIZE
+
+
+def test_grf_open_stream_raises_file_not_found_error(data_files):
+    grf = open_grf(data_files['ab.grf'])
+    with pytest.raises(FileNotFoundError):
+        grf.open_stream('invalid file name')
+
+
+def test_grf_refresh_without_changes():
+    grf = GRF(io.BytesIO(build_grf({'a.txt': b'a'})))
+    assert not grf.refresh()
+
+
+def test_grf_refresh_reloads_index():
+    stream = io.BytesIO(build_grf({'a.txt': b'a'}))
+    grf = GRF(stream)
+    stream.seek(0)
+    stream.write(build_grf({'a.txt': b'a', 'b.txt': b'bb'}))
+    assert grf.refresh()
+    assert len(grf) == 2
+    assert set(grf.files()) == {'a.txt', 'b.txt'}
+    assert grf.open('b.txt').data == b'bb'
+
+
+def test_grf_refresh_notifies_listeners():
+    stream = io.BytesIO(build_grf({'a.txt': b'a', 'b.txt': b'b'}))
+    grf = GRF(stream)
+    changes = []
+    grf.watch(changes.append)
+    stream.seek(0)
+    stream.write(build_grf({'b.txt': b'bbb', 'c.txt': b'c'}))
+    grf.refresh()
+    assert changes == [({'c.txt'}, {'a.txt'}, {'b.txt'})]
+
+
+def test_grf_refresh_detects_file_changes(data_files):
+    path = data_files['ab.grf']
+    with open_grf(path) as grf:
+        with open(path, 'wb') as f:
+            f.write(build_grf({'a.txt': b'changed'}))
+        assert grf.refresh()
+        assert grf.open('a.txt').data == b'changed'
+
+
+def test_grf_refresh_twice_reads_rewritten_file(data_files):
+    path = data_files['ab.grf']
+    with open(path, 'wb') as f:
+        f.write(build_grf({'a.txt': b'a'}))
+    with open_grf(path) as grf:
+        assert not grf.refresh()
+        # rewrite the file in place, without replacing it
+        with open(path, 'r+b') as f:
+            f.write(build_grf({'a.txt': b'aa', 'b.txt': b'bb'}))
+        assert grf.refresh()
+        assert sorted(grf.files()) == ['a.txt', 'b.txt']
+        assert grf.open('a.txt').data == b'aa'
+        assert grf.open('b.txt').data == b'bb'
+        assert not grf.refresh()
+
+
+def test_grf_refresh_reopens_replaced_file(data_files, tmpdir):
+    path = data_files['ab.grf']
+    with open(path, 'wb') as f:
+        f.write(build_grf({'a.txt': b'a'}))
+    with open_grf(path) as grf:
+        old_stream = grf.stream
+        stream = grf.open_stream('a.txt')
+        assert not grf.refresh()
+        # write a new file and rename it over the archive
+        replacement = os.path.join(tmpdir.strpath, 'new.grf')
+        with open(replacement, 'wb') as f:
+            f.write(build_grf({'a.txt': b'aa', 'b.txt': b'bb'}))
+        os.replace(replacement, path)
+        assert grf.refresh()
+        assert old_stream.closed
+        assert sorted(grf.files()) == ['a.txt', 'b.txt']
+        assert grf.open('b.txt').data == b'bb'
+        assert grf.open_stream('a.txt').read() == b'aa'
+        assert not grf.refresh()
+        # streams opened before the reload no longer match the archive
+        with pytest.raises(ValueError):
+            stream.read()
+
+
+def test_grf_unwatch_stops_notifications():
+    stream = io.BytesIO(build_grf({'a.txt': b'a'}))
+    grf = GRF(stream)
+    changes = []
+    grf.watch(changes.append)
+    grf.unwatch(changes.append)
+    stream.seek(0)
+    stream.write(build_grf({'b.txt': b'b'}))
+    grf.refresh()
+    assert changes == []
+
+
+@pytest.fixture
+def search_grf():
+    return GRF(io.BytesIO(build_grf({
+        'a.txt': b'texture.bmp and texture.bmp',
+        'b.lua': b'local texture = "texture.bmp"',
+        'c.txt': b'nothing to see',
+        'd.txt': b'',
+    })))
+
+
+def test_grf_search_finds_bytes(search_grf):
+    hits = list(search_grf.search(b'texture.bmp', workers=2))
+    assert hits == [('a.txt', 0), ('a.txt', 16), ('b.lua', 17)]
+
+
+def test_grf_search_finds_regex(search_grf):
+    hits = list(search_grf.search(re.compile(rb'\btexture\b(?!\.)')))
+    assert hits == [('b.lua', 6)]
+
+
+def test_grf_search_filters_files(search_grf):
+    hits = list(search_grf.search(b'texture', include='*.LUA'))
+    assert hits == [('b.lua', 6), ('b.lua', 17)]
+
+
+@pytest.mark.parametrize('pattern, expected', (
+    (b'aa', [0, 2]),
+    (re.compile(b'aa'), [0, 2]),
+    (b'', [0, 1, 2, 3, 4, 5]),
+    (re.compile(b''), [0, 1, 2, 3, 4, 5]),
+))
+def test_grf_search_matches_do_not_overlap(pattern, expected):
+    grf = GRF(io.BytesIO(build_grf({'a.txt': b'aaaaa'})))
+    assert [offset for _, offset in grf.search(pattern)] == expected
+
+
+def test_grf_search_rejects_str_pattern(search_grf):
+    with pytest.raises(TypeError):
+        list(search_grf.search('texture'))
+
+
+def test_grf_search_many_files():
+    files = {'{}.txt'.format(i): b'x' * i + b'needle' for i in range(50)}
+    grf = GRF(io.BytesIO(build_grf(files)))
+    hits = list(grf.search(b'needle', workers=3))
+    assert hits == [('{}.txt'.format(i), i) for i in range(50)]
+
+
+def test_diff_finds_changes():
+    old = GRF(io.BytesIO(build_grf({
+        'same.txt': b'same',
+        'removed.txt': b'removed',
+        'resized.txt': b'short',
+        'edited.txt': b'abcd',
+    })))
+    new = GRF(io.BytesIO(build_grf({
+        'edited.txt': b'abce',
+        'resized.txt': b'much longer',
+        'same.txt': b'same',
+        'added.txt': b'added',
+    })))
+    changes = list(diff(old, new, workers=2))
+    assert changes == [
+        ('removed', 'removed.txt'),
+        ('modified', 'resized.txt'),
+        ('modified', 'edited.txt'),
+        ('added', 'added.txt'),
+    ]
+
+
+def test_diff_ignores_recompressed_files():
+    data = b'some data' * 100
+    old = build_grf({'a.txt': data})
+    # the same contents stored differently, with the same sizes
+    compressed = zlib.compress(data)
+    new = old.replace(compressed, b'\x78\xda' + compressed[2:])
+    assert new != old
+    assert list(diff(GRF(io.BytesIO(old)), GRF(io.BytesIO(new)))) == []
+
+
+def test_diff_identical_archives(data_files):
+    old = open_grf(data_files['ab.grf'])
+    new = open_grf(data_files['ab.grf'])
+    assert list(diff(old, new)) == []
+
+
+def test_grf_writer_creates_readable_archive():
+    stream = io.BytesIO()
+    with GRFWriter(stream) as writer:
+        writer.add('a.txt', b'aaa')
+        writer.add(os.path.join('dir', 'b.dat'), b'bbb')
+        writer.add('empty.txt', b'')
+        writer.link('c.txt', 'a.txt')
+    grf = GRF(stream)
+    assert len(grf) == 4
+    assert not grf.allow_encryption
+    assert grf.open('a.txt').data == b'aaa'
+    assert grf.open(os.path.join('dir', 'b.dat')).data == b'bbb'
+    assert grf.open('empty.txt').data == b''
+    assert grf.open('c.txt').data == b'aaa'
+
+
+@pytest.fixture
+def duplicates_grf():
+    return GRF(io.BytesIO(build_grf({
+        'a.spr': b'sprite' * 100,
+        'b.txt': b'unique',
+        'c.spr': b'sprite' * 100,
+        'd.bmp': b'texture' * 10,
+        'e.spr': b'sprite' * 100,
+        'f.bmp': b'texture' * 10,
+    })))
+
+
+def test_find_duplicates_reports_groups(duplicates_grf):
+    groups = find_duplicates(duplicates_grf, workers=2)
+    files = [[name for _, name in group.files] for group in groups]
+    assert files == [['a.spr', 'c.spr', 'e.spr'], ['d.bmp', 'f.bmp']]
+    assert groups[0].size == 600
+    assert groups[0].wasted == 2 * len(zlib.compress(b'sprite' * 100))
+
+
+def test_find_duplicates_across_archives(duplicates_grf):
+    other = GRF(io.BytesIO(build_grf({'copy.txt': b'unique'})))
+    groups = find_duplicates(duplicates_grf, other)
+    unique = [group for group in groups if group.size == len(b'unique')]
+    assert unique[0].files == (
+        (duplicates_grf, 'b.txt'), (other, 'copy.txt'))
+
+
+def test_repack_dedup_shares_stored_data(duplicates_grf):
+    stream = io.BytesIO()
+    repack(duplicates_grf, stream)
+    grf = GRF(stream)
+    assert set(grf.files()) == set(duplicates_grf.files())
+    for filename in grf.files():
+        assert grf.open(filename) == duplicates_grf.open(filename)
+    positions = {header.position for _, header in grf.file_headers()}
+    assert len(positions) == 3
+    assert len(stream.getvalue()) < len(duplicates_grf.stream.getvalue())
+
+
+def test_repack_without_dedup_copies_archive(data_files):
+    original = open_grf(data_files['ab.grf'])
+    stream = io.BytesIO()
+    repack(original, stream, dedup=False)
+    assert list(diff(original, GRF(stream))) == []
+
+
+def read_index(data):
+    """the decompressed index of the raw data of a grf archive"""
+    offset, = struct.unpack('<I', data[30:34])
+    compressed_size, _ = struct.unpack('<II', data[offset + 46:offset + 54])
+    return zlib.decompress(data[offset + 54:offset + 54 + compressed_size])
+
+
+def test_repack_keeps_raw_names(data_files):
+    path = data_files['encoding.grf']
+    original = open_grf(path)
+    stream = io.BytesIO()
+    repack(original, stream, dedup=False)
+    with open(path, 'rb') as f:
+        assert read_index(stream.getvalue()) == read_index(f.read())
+    assert set(GRF(stream).files()) == set(original.files())
+
+
+def test_repack_keeps_root_names():
+    source = io.BytesIO()
+    with GRFWriter(source) as writer:
+        writer.add_archived(
+            'root.txt', FileHeader(0, 0, 0, 1, 0), b'', b'root.txt')
+        writer.add('a.txt', b'aaa')
+    stream = io.BytesIO()
+    repack(GRF(source), stream)
+    assert read_index(stream.getvalue()) == read_index(source.getvalue())
+    assert read_index(stream.getvalue()).startswith(b'root.txt\x00')
@@ -0,0 +1,297 @@
+import heapq
+import io
+import random
+import pytest
+from pygrf import open_gat, FileParseError
+from pygrf.gat import Bitmap
+from pygrf.path import (
+    LineOfSight, Pathfinder, Regions, find_path, path_cost
+)
+
+
+def make_bitmap(rows):
+    """ a bitmap from rows of text, where '.' is walkable """
+    flags = bytes(char == '.' for row in rows for char in row)
+    return Bitmap.from_flags(len(rows[0]), len(rows), flags)
+
+
+def dijkstra_cost(bitmap, start, goal):
+    """ the cost of the shortest path, found the slow way """
+    def walkable(x, y):
+        return 0 <= x < bitmap.width and 0 <= y < bitmap.height and \
+            bitmap[x, y]
+
+    costs = {start: 0}
+    heap = [(0, start)]
+    while heap:
+        cost, (x, y) = heapq.heappop(heap)
+        if (x, y) == goal:
+            return cost
+        if cost > costs[x, y]:
+            continue
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if (dx, dy) == (0, 0) or not walkable(x + dx, y + dy):
+                    continue
+                if dx and dy and not (walkable(x + dx, y)
+                                      and walkable(x, y + dy)):
+                    continue
+                new_cost = cost + (14 if dx and dy else 10)
+                if new_cost < costs.get((x + dx, y + dy), new_cost + 1):
+                    costs[x + dx, y + dy] = new_cost
+                    heapq.heappush(heap, (new_cost, (x + dx, y + dy)))
+    return None
+
+
+def test_find_path_straight_and_diagonal():
+    pathfinder = Pathfinder(make_bitmap(['.....'] * 5))
+    assert pathfinder.find_path((0, 0), (4, 0)) == tuple(
+        (x, 0) for x in range(5))
+    assert pathfinder.find_path((0, 0), (4, 4)) == tuple(
+        (i, i) for i in range(5))
+    assert pathfinder.find_path((2, 2), (2, 2)) == ((2, 2),)
+
+
+def test_find_path_avoids_walls():
+    bitmap = make_bitmap([
+        '.....',
+        '.###.',
+        '...#.',
+        '##.#.',
+        '.....',
+    ])
+    pathfinder = Pathfinder(bitmap)
+    path = pathfinder.find_path((0, 0), (0, 4))
+    assert path[0] == (0, 0) and path[-1] == (0, 4)
+    assert all(pathfinder.is_walkable(x, y) for x, y in path)
+    assert path_cost(path) == dijkstra_cost(bitmap, (0, 0), (0, 4)) == 80
+
+
+def test_find_path_does_not_cut_corners():
+    pathfinder = Pathfinder(make_bitmap([
+        '.#',
+        '..',
+    ]))
+    assert pathfinder.find_path((0, 0), (1, 1)) == ((0, 0), (0, 1), (1, 1))
+    blocked = Pathfinder(make_bitmap([
+        '.#',
+        '#.',
+    ]))
+    assert blocked.find_path((0, 0), (1, 1)) is None
+
+
+def test_find_path_unreachable():
+    pathfinder = Pathfinder(make_bitmap(['.#.']))
+    assert pathfinder.find_path((0, 0), (2, 0)) is None
+    assert pathfinder.find_path((0, 0), (1, 0)) is None
+    with pytest.raises(IndexError):
+        pathfinder.find_path((0, 0), (3, 0))
+
+
+def test_find_path_matches_dijkstra():
+    rng = random.Random(1)
+    rows = [''.join('#' if rng.random() < 0.3 else '.' for _ in range(30))
+            for _ in range(30)]
+    bitmap = make_bitmap(rows)
+    pathfinder = Pathfinder(bitmap)
+    tiles = [(x, y) for y in range(30) for x in range(30) if bitmap[x, y]]
+    for _ in range(50):
+        start, goal = rng.choice(tiles), rng.choice(tiles)
+        path = pathfinder.find_path(start, goal)
+        expected = dijkstra_cost(bitmap, start, goal)
+        if expected is None:
+            assert path is None
+        else:
+            assert path_cost(path) == expected
+
+
+def test_find_path_caches_paths():
+    pathfinder = Pathfinder(make_bitmap(['....'] * 4), cache_size=2)
+    first = pathfinder.find_path((0, 0), (3, 3))
+    assert pathfinder.find_path((0, 0), (3, 3)) is first
+    pathfinder.find_path((0, 0), (3, 0))
+    pathfinder.find_path((0, 0), (0, 3))
+    assert list(pathfinder.cache) == [((0, 0), (3, 0)), ((0, 0), (0, 3))]
+
+
+def test_find_paths():
+    pathfinder = Pathfinder(make_bitmap(['...', '.#.', '...']))
+    paths = pathfinder.find_paths([((0, 0), (2, 2)), ((1, 0), (1, 2)),
+                                   ((0, 0), (1, 1))])
+    assert path_cost(paths[0]) == 40
+    # the corners of the wall can't be cut
+    assert path_cost(paths[1]) == 40
+    assert paths[2] is None
+
+
+def test_find_path_on_gat(data_files):
+    gat = open_gat(data_files['b.gat'])
+    walkable = gat.walkable()
+    tiles = [(x, y) for y in range(gat.height) for x in range(gat.width)
+             if walkable[x, y]]
+    start, goal = tiles[0], tiles[-1]
+    path = find_path(gat, start, goal)
+    expected = dijkstra_cost(walkable, start, goal)
+    if expected is None:
+        assert path is None
+    else:
+        assert path_cost(path) == expected
+
+
+def test_line_of_sight():
+    sight = LineOfSight(make_bitmap([
+        '.....',
+        '.....',
+        '..#..',
+        '.....',
+    ]))
+    assert sight.visible((0, 0), (4, 0))
+    assert sight.visible((0, 0), (4, 1))
+    assert sight.visible((0, 3), (4, 3))
+    assert not sight.visible((0, 2), (4, 2))
+    assert not sight.visible((0, 0), (2, 2))
+    assert not sight.visible((1, 1), (3, 3))
+    assert sight.visible((1, 1), (1, 1))
+    with pytest.raises(IndexError):
+        sight.visible((0, 0), (5, 0))
+
+
+def test_line_of_sight_many():
+    sight = LineOfSight(make_bitmap(['...', '.#.', '...']))
+    assert sight.visible_many([
+        ((0, 0), (2, 0)), ((0, 0), (2, 2)), ((0, 1), (2, 1)),
+        ((0, 0), (0, 2)),
+    ]) == [True, False, False, True]
+
+
+def test_line_of_sight_viewpoints():
+    rng = random.Random(2)
+    rows = [''.join('#' if rng.random() < 0.2 else '.' for _ in range(12))
+            for _ in range(12)]
+    sight = LineOfSight(make_bitmap(rows))
+    source = next((x, y) for y in range(4, 8) for x in range(4, 8)
+                  if rows[y][x] == '.')
+    targets = [(x, y) for y in range(12) for x in range(12)]
+    expected = sight.visible_many((source, target) for target in targets)
+    visible = sight.add_viewpoint(source, 3)
+    assert len(visible) == 49
+    assert sight.visible_many(
+        (source, target) for target in targets) == expected
+    assert sum(visible) == sum(
+        expected[y * 12 + x]
+        for y in range(source[1] - 3, source[1] + 4)
+        for x in range(source[0] - 3, source[0] + 4)
+        if 0 <= x < 12 and 0 <= y < 12)
+
+
+def test_line_of_sight_viewpoints_check_bounds():
+    sight = LineOfSight(make_bitmap(['...'] * 3))
+    sight.add_viewpoint((0, 0), 2)
+    assert sight.visible((0, 0), (2, 2))
+    for target in ((-1, 0), (0, -2), (3, 0)):
+        with pytest.raises(IndexError):
+            sight.visible((0, 0), target)
+
+
+def test_line_of_sight_on_gat(data_files):
+    gat = open_gat(data_files['b.gat'])
+    sight = LineOfSight.from_gat(gat)
+    snipable = gat.snipable()
+    assert sight.visible((0, 0), (0, 0)) == snipable[0, 0]
+
+
+def test_regions():
+    regions = Regions.from_bitmap(make_bitmap([
+        '..#..',
+        '.##..',
+        '#....',
+        '###.#',
+        '..#..',
+    ]))
+    assert regions.count == 3
+    assert regions.label(0, 0) == regions.label(0, 1) == 1
+    assert regions.label(3, 0) == regions.label(3, 3) == 2
+    assert regions.label(0, 4) == 3
+    assert regions.label(2, 0) == 0
+    assert list(regions.sizes) == [0, 3, 11, 2]
+    assert regions.size((4, 4)) == 11
+    assert regions.size((0, 2)) == 0
+    assert regions.reachable((3, 0), (4, 4))
+    assert not regions.reachable((0, 0), (4, 4))
+    assert not regions.reachable((0, 2), (0, 2))
+    with pytest.raises(IndexError):
+        regions.reachable((0, 0), (5, 0))
+
+
+def test_regions_are_not_joined_diagonally():
+    regions = Regions.from_bitmap(make_bitmap(['.#', '#.']))
+    assert regions.count == 2
+    assert not regions.reachable((0, 0), (1, 1))
+
+
+def test_regions_match_pathfinder():
+    rng = random.Random(3)
+    rows = [''.join('#' if rng.random() < 0.4 else '.' for _ in range(25))
+            for _ in range(25)]
+    bitmap = make_bitmap(rows)
+    regions = Regions.from_bitmap(bitmap)
+    assert sum(regions.sizes) == bitmap.count()
+    tiles = [(x, y) for y in range(25) for x in range(25) if bitmap[x, y]]
+    for _ in range(50):
+        start, goal = rng.choice(tiles), rng.choice(tiles)
+        reachable = dijkstra_cost(bitmap, start, goal) is not None
+        assert regions.reachable(start, goal) == reachable
+
+
+def test_regions_nearest():
+    regions = Regions.from_bitmap(make_bitmap([
+        '.....#....',
+        '######....',
+        '##........',
+    ]))
+    assert regions.nearest((3, 0)) == (3, 0)
+    assert regions.nearest((3, 1)) == (3, 0)
+    assert regions.nearest((3, 1), regions.label(9, 2)) == (3, 2)
+    assert regions.nearest((0, 2), regions.label(9, 2)) == (2, 2)
+    assert regions.nearest((5, 0)) in ((4, 0), (6, 0))
+    assert regions.nearest((0, 0), 3) is None
+    empty = Regions.from_bitmap(make_bitmap(['##', '##']))
+    assert empty.nearest((1, 1)) is None
+
+
+def test_regions_save_and_load():
+    rng = random.Random(4)
+    rows = [''.join('#' if rng.random() < 0.4 else '.' for _ in range(20))
+            for _ in range(10)]
+    regions = Regions.from_bitmap(make_bitmap(rows))
+    stream = io.BytesIO()
+    regions.save(stream)
+    stream.write(b'map data')
+    stream.seek(0)
+    loaded = Regions.load(stream)
+    assert stream.read() == b'map data'
+    assert (loaded.width, loaded.height) == (20, 10)
+    assert loaded.labels == regions.labels
+    assert loaded.sizes == regions.sizes
+
+    with pytest.raises(FileParseError):
+        Regions.load(io.BytesIO(b'GRAT' + stream.getvalue()[4:]))
+    with pytest.raises(FileParseError):
+        Regions.load(io.BytesIO(stream.getvalue()[:10]))
+
+
+def test_pathfinder_skips_unreachable_goals(data_files):
+    gat = open_gat(data_files['b.gat'])
+    regions = Regions.from_gat(gat)
+    pathfinder = Pathfinder.from_gat(gat, regions=regions)
+    plain = Pathfinder.from_gat(gat)
+    walkable = gat.walkable()
+    tiles = [(x, y) for y in range(gat.height) for x in range(gat.width)
+             if walkable[x, y]]
+    rng = random.Random(5)
+    for _ in range(20):
+        start, goal = rng.choice(tiles), rng.choice(tiles)
+        assert pathfinder.find_path(start, goal) == \
+            plain.find_path(start, goal)
+        assert regions.reachable(start, goal) == (
+            plain.find_path(start, goal) is not None)
@@ -0,0 +1,109 @@
+import io
+import os
+import struct
+import zlib
+import pytest
+from pygrf import open_spr
+from pygrf.graphics import IndexedImage, Palette, RGBAImage
+from pygrf.grf import GRFWriter
+from pygrf.png import convert_sprites, sprite_path, write_png
+
+
+def read_png(data):
+    """ read the chunks of a png file and its decompressed image data """
+    assert data.startswith(b'\x89PNG\r\n\x1a\n')
+    position = 8
+    chunks = {}
+    idat = b''
+    while position < len(data):
+        length, = struct.unpack_from('>I', data, position)
+        chunk_type = data[position + 4:position + 8]
+        chunk = data[position + 8:position + 8 + length]
+        crc, = struct.unpack_from('>I', data, position + 8 + length)
+        assert crc == zlib.crc32(chunk_type + chunk)
+        if chunk_type == b'IDAT':
+            idat += chunk
+        else:
+            chunks[chunk_type] = chunk
+        position += 12 + length
+    return chunks, zlib.decompress(idat)
+
+
+def test_write_png_rgba():
+    image = RGBAImage(2, 2, bytes(range(16)))
+    stream = io.BytesIO()
+    write_png(stream, image)
+    chunks, data = read_png(stream.getvalue())
+    assert struct.unpack('>IIBBBBB', chunks[b'IHDR']) == (2, 2, 8, 6, 0, 0, 0)
+    assert data == b'\x00' + bytes(range(8)) + b'\x00' + bytes(range(8, 16))
+    assert b'IEND' in chunks
+
+
+def test_write_png_indexed():
+    palette = Palette.from_pal(bytes(range(4)) * 256)
+    image = IndexedImage(3, 1, b'\x00\x01\x02', palette)
+    stream = io.BytesIO()
+    write_png(stream, image)
+    chunks, data = read_png(stream.getvalue())
+    assert chunks[b'IHDR'][9] == 3
+    assert chunks[b'PLTE'] == bytes(range(3)) * 256
+    # only the transparent background needs an alpha value
+    assert chunks[b'tRNS'] == b'\x00'
+    assert data == b'\x00\x00\x01\x02'
+
+
+def test_write_png_indexed_needs_palette():
+    with pytest.raises(ValueError):
+        write_png(io.BytesIO(), IndexedImage(1, 1))
+
+
+def test_write_png_large_image_uses_several_chunks():
+    image = RGBAImage(256, 256, os.urandom(256 * 256 * 4))
+    stream = io.BytesIO()
+    write_png(stream, image)
+    _, data = read_png(stream.getvalue())
+    assert data[1:1025] == image[:1024]
+    assert stream.getvalue().count(b'IDAT') > 1
+
+
+def test_convert_sprites(data_files, tmpdir):
+    grf_path = os.path.join(tmpdir.strpath, 'sprites.grf')
+    with open(grf_path, 'wb') as f, GRFWriter(f) as writer:
+        for name in ('201.spr', '101.spr', '100.spr'):
+            with open(data_files[name], 'rb') as spr:
+                writer.add(os.path.join('sprite', name), spr.read())
+        writer.add('readme.txt', b'not a sprite')
+
+    output = os.path.join(tmpdir.strpath, 'png')
+    converted = convert_sprites(grf_path, output, workers=2)
+    # 100.spr has no palette, so its image can't be converted
+    assert converted == (6, 0)
+    spr = open_spr(data_files['201.spr'])
+    with open(os.path.join(output, 'sprite', '201_002.png'), 'rb') as f:
+        _, data = read_png(f.read())
+    rows = [data[i * 9 + 1:(i + 1) * 9] for i in range(2)]
+    assert b''.join(rows) == spr.image(2)
+    assert os.path.exists(os.path.join(output, 'sprite', '101_001.png'))
+
+
+def test_convert_sprites_skips_corrupt_sprites(data_files, tmpdir):
+    with open(data_files['201.spr'], 'rb') as f:
+        data = f.read()
+    grf_path = os.path.join(tmpdir.strpath, 'sprites.grf')
+    with open(grf_path, 'wb') as f, GRFWriter(f) as writer:
+        writer.add('truncated.spr', data[:-1100])
+        writer.add('garbage.spr', b'not a sprite')
+        writer.add('good.spr', data)
+
+    output = os.path.join(tmpdir.strpath, 'png')
+    assert convert_sprites(grf_path, output, workers=1) == (4, 2)
+    assert os.path.exists(os.path.join(output, 'good_002.png'))
+
+
+def test_sprite_path_stays_in_output_dir():
+    output = os.path.join('out', 'png')
+    assert sprite_path(output, os.path.join('..', '..', 'a.spr')) == \
+        os.path.join(output, 'a')
+    assert sprite_path(output, 'sprite\\../b.spr') == \
+        os.path.join(output, 'sprite', 'b')
+    assert sprite_path(output, '..') is None
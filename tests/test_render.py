@@ -0,0 +1,202 @@
+import random
+import struct
+from types import SimpleNamespace
+import pytest
+from pygrf.act import RGB_IMAGE, Animation, Frame, Layer
+from pygrf.graphics import Color, IndexedImage, Palette, Point, Vector2
+from pygrf.graphics import RGBAImage
+from pygrf.render import (
+    BoundingBoxes, Renderer, Transform, angle_degrees, blend, frame_bounds,
+    render_animation, render_frame, transform_image, transformed_bounds)
+from pygrf.spr import SPR, build_spr
+
+
+RED = Color(255, 0, 0, 255)
+BLUE = Color(0, 0, 255, 255)
+
+
+def make_spr():
+    """ a spr file with a 2x1 pal image and a 1x1 rgb image """
+    palette = Palette.from_colors([Color(0, 0, 0, 0), RED, BLUE])
+    pal = IndexedImage(2, 1, b'\x01\x02')
+    rgb = RGBAImage(1, 1, bytes((0, 255, 0, 255)))
+    return SPR(build_spr([pal], [rgb], palette))
+
+
+def float_angle(degrees):
+    """ the float an act file is parsed as for a rotation in degrees """
+    return struct.unpack('<f', struct.pack('<i', degrees))[0]
+
+
+def test_angle_degrees():
+    assert angle_degrees(0.0) == 0
+    assert angle_degrees(2.8026e-45) == 2
+    assert angle_degrees(float_angle(90)) == 90
+
+
+def test_transformed_bounds():
+    assert transformed_bounds(4, 2, Transform()) == (-2, -1, 2, 1)
+    assert transformed_bounds(4, 2, Transform(zoom_x=2.0)) == (-4, -1, 4, 1)
+    assert transformed_bounds(4, 2, Transform(angle=90)) == (-1, -2, 1, 2)
+
+
+def test_transform_image_flips_and_scales():
+    image = RGBAImage(2, 1, bytes((1, 1, 1, 255, 2, 2, 2, 255)))
+    flipped, left, top = transform_image(image, Transform(flipped=True))
+    assert bytes(flipped) == bytes((2, 2, 2, 255, 1, 1, 1, 255))
+    assert (left, top) == (-1, 0)
+
+    scaled, left, top = transform_image(image, Transform(zoom_x=2.0))
+    assert (scaled.width, scaled.height) == (4, 1)
+    assert scaled.pixels[1] == (1, 1, 1, 255)
+    assert scaled.pixels[2] == (2, 2, 2, 255)
+
+    mirrored, _, _ = transform_image(image, Transform(zoom_x=-1.0))
+    assert bytes(mirrored) == bytes(flipped)
+
+
+def test_transform_image_rotates():
+    image = RGBAImage(2, 1, bytes((1, 1, 1, 255, 2, 2, 2, 255)))
+    rotated, left, top = transform_image(image, Transform(angle=90))
+    assert (rotated.width, rotated.height) == (1, 2)
+    # clockwise, so the left pixel ends up on top
+    assert rotated.pixels[0] == (1, 1, 1, 255)
+    assert rotated.pixels[1] == (2, 2, 2, 255)
+
+
+def test_transform_image_tints():
+    image = RGBAImage(1, 1, bytes((200, 100, 50, 255)))
+    tinted, _, _ = transform_image(
+        image, Transform(color=Color(255, 128, 0, 128)))
+    assert tinted.pixels[0] == (200, 50, 0, 128)
+
+
+def test_blend():
+    canvas = bytearray((0, 0, 255, 255, 0, 0, 0, 0))
+    image = RGBAImage(2, 1, bytes((255, 0, 0, 128, 255, 0, 0, 128)))
+    blend(canvas, 2, image, 0, 0)
+    assert canvas[:4] == bytes((128, 0, 127, 255))
+    assert canvas[4:] == bytes((255, 0, 0, 128))
+
+
+def blend_pixels(canvas, canvas_width, image, x, y):
+    """ blend one pixel at a time, the slow way """
+    for row in range(image.height):
+        for column in range(image.width):
+            pixel = (row * image.width + column) * 4
+            base = ((y + row) * canvas_width + x + column) * 4
+            alpha, below = image[pixel + 3], canvas[base + 3]
+            if alpha == 0:
+                continue
+            if alpha == 255 or below == 0:
+                canvas[base:base + 4] = image[pixel:pixel + 4]
+                continue
+            remaining = below * (255 - alpha) // 255
+            total = alpha + remaining
+            for channel in range(3):
+                canvas[base + channel] = (
+                    image[pixel + channel] * alpha
+                    + canvas[base + channel] * remaining) // total
+            canvas[base + 3] = total
+
+
+def test_blend_matches_pixel_by_pixel():
+    rng = random.Random(0)
+    alphas = (0, 0, 255, 255, 255, 1, 128, 254)
+    canvas = bytearray(12 * 10 * 4)
+    # leave some rows of the canvas empty
+    for index in range(0, 12 * 6):
+        canvas[index * 4:index * 4 + 4] = bytes(
+            (rng.randrange(256), rng.randrange(256), rng.randrange(256),
+             rng.choice(alphas)))
+    data = bytearray()
+    for _ in range(8 * 8):
+        data += bytes((rng.randrange(256), rng.randrange(256),
+                       rng.randrange(256), rng.choice(alphas)))
+    image = RGBAImage(8, 8, data)
+    expected = bytearray(canvas)
+    blend_pixels(expected, 12, image, 3, 1)
+    blend(canvas, 12, image, 3, 1)
+    assert canvas == expected
+
+
+def test_render_frame_places_layers():
+    spr = make_spr()
+    frame = Frame((
+        Layer(Point(0, 0), 0, False),
+        Layer(Point(3, 1), 0, False, image_type=RGB_IMAGE),
+    ))
+    act = SimpleNamespace(animations=(Animation((frame,)),))
+    rendered = render_frame(act, spr, 0, 0)
+    assert (rendered.image.width, rendered.image.height) == (5, 2)
+    assert rendered.origin == (1, 0)
+    pixels = rendered.image.pixels
+    assert pixels[0] == RED
+    assert pixels[1] == BLUE
+    assert pixels[5 + 4] == (0, 255, 0, 255)
+    assert pixels[5] == (0, 0, 0, 0)
+
+
+def test_render_frame_skips_missing_images():
+    spr = make_spr()
+    frame = Frame((Layer(Point(0, 0), 0xFFFFFFFF, False),
+                   Layer(Point(0, 0), 9, False)))
+    rendered = Renderer(None, spr).render_frame(frame)
+    assert (rendered.image.width, rendered.image.height) == (0, 0)
+
+
+def test_renderer_caches_transformed_images():
+    spr = make_spr()
+    layer = Layer(Point(0, 0), 0, True, zoom=Vector2(2.0, 2.0))
+    frames = (Frame((layer,)), Frame((layer._replace(offset=Point(1, 1)),)))
+    act = SimpleNamespace(animations=(Animation(frames),))
+    renderer = Renderer(act, spr, cache_size=1)
+    first, second = renderer.render_animation(0)
+    assert len(renderer.transformed) == 1
+    assert bytes(first.image) == bytes(second.image)
+    assert first.image.pixels[0] == BLUE
+    assert render_animation(act, spr, 0)[1].origin == (1, 0)
+
+
+@pytest.mark.parametrize('angle', (0, 45, 90, 180, 270))
+def test_rendered_size_matches_bounds(angle):
+    image = RGBAImage(3, 2, bytes(range(24)))
+    transform = Transform(angle=angle, zoom_x=1.5)
+    left, top, right, bottom = transformed_bounds(3, 2, transform)
+    result, x, y = transform_image(image, transform)
+    assert (x, y) == (left, top)
+    assert (result.width, result.height) == (right - left, bottom - top)
+
+
+def test_frame_bounds_match_rendered_frame():
+    spr = make_spr()
+    frame = Frame((
+        Layer(Point(0, 0), 0, False, zoom=Vector2(2.0, 1.0)),
+        Layer(Point(3, 1), 0, False, image_type=RGB_IMAGE),
+        Layer(Point(9, 9), 0xFFFFFFFF, False),
+    ))
+    rendered = Renderer(None, spr).render_frame(frame)
+    left, top, right, bottom = frame_bounds(spr, frame)
+    assert (-left, -top) == rendered.origin
+    assert (right - left, bottom - top) == (
+        rendered.image.width, rendered.image.height)
+    assert frame_bounds(spr, Frame(())) == (0, 0, 0, 0)
+
+
+def test_bounding_boxes():
+    spr = make_spr()
+    frames = (
+        Frame((Layer(Point(0, 0), 0, False),)),
+        Frame((Layer(Point(5, 0), 0, False, angle=float_angle(90)),)),
+        Frame(()),
+    )
+    act = SimpleNamespace(animations=(Animation(frames),))
+    boxes = BoundingBoxes(act, spr)
+    assert boxes.frame(0, 0) == (-1, 0, 1, 1)
+    assert boxes.frame(0, 1) == (4, -1, 5, 1)
+    assert boxes.frame(0, 2) == (0, 0, 0, 0)
+    assert boxes.animation(0) == (-1, -1, 5, 1)
+    assert boxes.hit(0, 0, 0, 0)
+    assert not boxes.hit(0, 0, 1, 0)
+    with pytest.raises(IndexError):
+        boxes.frame(0, 3)
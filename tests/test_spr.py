@@ -1,7 +1,15 @@
+import io
+import mmap
 import pytest
 import struct
 from pygrf import FileParseError # TODO: rename to simply ParseError
-from pygrf import open_spr
+from pygrf import open_pal, open_spr
+import pygrf.spr
+from pygrf.filetypes import parse
+from pygrf.grf import GRF, GRFFile, GRFWriter
+from pygrf.graphics import Color, IndexedImage, Palette, RGBAImage
+from pygrf.spr import SPR, apply_palette, pack_rle, unpack_rle
+from pygrf.spr import build_spr, optimize, quantize
 
 
 @pytest.mark.parametrize('filename', (
@@ -41,19 +49,19 @@ def test_spr_has_correct_image_count(data_files, filename, count):
 def test_spr_fail_with_bad_index(data_files, index):
     spr = open_spr(data_files['201.spr'])
     with pytest.raises(IndexError):
-        spr[index]
+        spr.image(index)
 
 
 def test_spr_allows_negative_index(data_files):
     spr = open_spr(data_files['201.spr'])
-    spr[-3]
+    spr.image(-3)
 
 
 def test_spr_fail_no_palette(data_files):
     # v 1.0 does not have an embedded palette, so getting images should fail
     spr = open_spr(data_files['100.spr'])
     with pytest.raises(FileParseError):
-        spr[0] # attempt to get the first image
+        spr.image(0) # attempt to get the first image
 
 
 @pytest.mark.parametrize('filename, index, w, h', (
@@ -69,10 +77,21 @@ def test_spr_fail_no_palette(data_files):
 ))
 def test_spr_image_has_correct_dimensions(data_files, filename, index, w, h):
     spr = open_spr(data_files[filename])
-    img = spr[index]
+    img = spr.image(index)
     assert img.width == w
     assert img.height == h
 
+
+def test_spr_index_unpacks_into_deprecated_image_tuple(data_files):
+    spr = open_spr(data_files['201.spr'])
+    with pytest.deprecated_call():
+        width, height, pixels = spr[1]
+    assert (width, height) == (6, 6)
+    assert list(pixels) == list(spr.image(1).pixels)
+    with pytest.deprecated_call():
+        assert spr[-1][0] == 6
+
+
 # TODO: test for validity in v1.0
 # TODO: palette parsing...
 
@@ -90,9 +109,280 @@ def test_spr_image_has_correct_dimensions(data_files, filename, index, w, h):
 ))
 def test_spr_image_has_correct_pixels(data_files, spr, index, img):
     spr = open_spr(data_files[spr])
-    image = spr[index]
+    image = spr.image(index)
     pixels = [pixel.to_rgba32() for pixel in image.pixels]
     with open(data_files[img], 'rb') as img_file:
         expected = struct.iter_unpack('<I', img_file.read())
         expected = [p[0] for p in expected]
     assert pixels == expected
+
+
+@pytest.mark.parametrize('filename, index, w, h', (
+    ('100.spr', 0, 2, 2),
+    ('201.spr', 1, 6, 6),
+    ('201.spr', -1, 6, 6),
+))
+def test_spr_size_has_correct_dimensions(data_files, filename, index, w, h):
+    spr = open_spr(data_files[filename])
+    assert spr.size(index) == (w, h)
+
+
+@pytest.mark.parametrize('index', (4, -5))
+def test_spr_size_fails_with_bad_index(data_files, index):
+    spr = open_spr(data_files['201.spr'])
+    with pytest.raises(IndexError):
+        spr.size(index)
+
+
+def test_spr_fails_truncated_images(data_files):
+    with open(data_files['201.spr'], 'rb') as f:
+        data = f.read()
+    with pytest.raises(FileParseError):
+        SPR(data[:20])
+
+
+@pytest.mark.parametrize('filename, cut', (
+    ('100.spr', 1),
+    ('101.spr', 1025),
+    ('200.spr', 1025),
+    ('201.spr', 1025),
+))
+def test_spr_fails_truncated_pixel_data(data_files, filename, cut):
+    # cut into the pixels of the last image, after any palette is removed
+    with open(data_files[filename], 'rb') as f:
+        data = f.read()
+    with pytest.raises(FileParseError):
+        SPR(data[:-cut])
+
+
+@pytest.mark.parametrize('index', (0, 2))
+def test_spr_image_is_packed_rgba(data_files, index):
+    spr = open_spr(data_files['201.spr'])
+    image = spr.image(index)
+    assert memoryview(image).nbytes == image.width * image.height * 4
+
+
+@pytest.mark.parametrize('data, packed', (
+    (b'', b''),
+    (b'\x01\x02', b'\x01\x02'),
+    (b'\x00\x00\x00\x05', b'\x00\x03\x05'),
+    (b'\x05' + bytes(300) + b'\x06', b'\x05\x00\xff\x00\x2d\x06'),
+    (bytes(255), b'\x00\xff'),
+))
+def test_rle_round_trip(data, packed):
+    assert pack_rle(data) == packed
+    assert unpack_rle(packed) == data
+    assert unpack_rle(packed, len(data)) == data
+
+
+def test_rle_fails_with_wrong_size():
+    with pytest.raises(FileParseError):
+        unpack_rle(b'\x01\x00\x05', 3)
+
+
+def test_spr_embedded_palette_is_parsed_once(data_files):
+    spr = open_spr(data_files['101.spr'])
+    assert spr.palette is spr.palette
+    assert spr.palette.colors[0].a == 0
+    assert spr.palette.colors[1].a == 255
+
+
+def test_spr_without_palette_has_no_palette(data_files):
+    spr = open_spr(data_files['100.spr'])
+    assert spr.palette is None
+
+
+def test_spr_get_indexed_keeps_indices(data_files):
+    spr = open_spr(data_files['201.spr'])
+    indexed = spr.get_indexed(1)
+    assert (indexed.width, indexed.height) == (6, 6)
+    assert indexed is spr.get_indexed(1)
+    assert indexed.apply() == spr.image(1)
+
+
+def test_spr_get_indexed_fails_for_rgb_images(data_files):
+    spr = open_spr(data_files['201.spr'])
+    with pytest.raises(ValueError):
+        spr.get_indexed(2)
+
+
+def test_spr_render_with_external_palette(data_files):
+    palette = open_pal(data_files['pal.pal'])
+    spr = open_spr(data_files['101.spr'])
+    image = spr.render(1, palette)
+    expected = [palette.colors[i] for i in spr.get_indexed(1)]
+    assert list(image.pixels) == expected
+    assert spr.render(1, palette) is image
+
+
+def test_spr_render_without_palette(data_files):
+    palette = open_pal(data_files['pal.pal'])
+    spr = open_spr(data_files['100.spr'])
+    with pytest.raises(FileParseError):
+        spr.render(0)
+    assert spr.render(0, palette).width == 2
+
+
+def test_spr_render_cache_is_limited(data_files):
+    palette = open_pal(data_files['pal.pal'])
+    spr = SPR(open(data_files['201.spr'], 'rb').read(), cache_size=1)
+    first = spr.render(0, palette)
+    spr.render(1, palette)
+    assert spr.render(0, palette) is not first
+    assert len(spr.rendered) == 1
+
+
+def test_spr_to_arrays_matches_images(data_files):
+    numpy = pytest.importorskip('numpy')
+    spr = open_spr(data_files['201.spr'])
+    arrays = spr.to_arrays()
+    assert arrays.indices.shape == (2, 6, 6)
+    assert arrays.rgba.shape == (2, 6, 6, 4)
+    assert arrays.sizes.tolist() == [[2, 2], [6, 6], [2, 2], [6, 6]]
+    rendered = apply_palette(arrays.indices, spr.palette)
+    for index in range(len(spr)):
+        width, height = spr.size(index)
+        if index < 2:
+            pixels = rendered[index, :height, :width]
+        else:
+            pixels = arrays.rgba[index - 2, :height, :width]
+        assert numpy.ascontiguousarray(pixels).tobytes() == spr.image(index)
+
+
+def test_spr_to_arrays_without_rgb_images(data_files):
+    pytest.importorskip('numpy')
+    arrays = open_spr(data_files['101.spr']).to_arrays()
+    assert arrays.indices.shape == (2, 6, 6)
+    assert arrays.rgba.shape == (0, 0, 0, 4)
+
+
+def test_spr_to_arrays_requires_numpy(data_files, monkeypatch):
+    monkeypatch.setattr(pygrf.spr, 'numpy', None)
+    spr = open_spr(data_files['201.spr'])
+    with pytest.raises(ImportError):
+        spr.to_arrays()
+    # the pure python path keeps working
+    assert spr.image(0).width == 2
+
+
+@pytest.mark.parametrize('version', (0x101, 0x200, 0x201))
+def test_build_spr_round_trip(data_files, version):
+    spr = open_spr(data_files['201.spr'])
+    pal_images = [spr.get_indexed(0), spr.get_indexed(1)]
+    rgb_images = [spr.image(2), spr.image(3)] if version >= 0x200 else []
+    data = build_spr(pal_images, rgb_images, spr.palette, version)
+    built = SPR(data)
+    assert built.version == version
+    assert len(built) == 2 + len(rgb_images)
+    for index in range(len(built)):
+        assert built.image(index) == spr.image(index)
+
+
+def test_build_spr_version_100(data_files):
+    spr = open_spr(data_files['100.spr'])
+    data = build_spr([spr.get_indexed(0)], version=0x100)
+    with open(data_files['100.spr'], 'rb') as f:
+        assert data == f.read()
+
+
+@pytest.mark.parametrize('version, rgb, palette', (
+    (0x100, True, False),
+    (0x101, False, False),
+    (0x300, False, True),
+))
+def test_build_spr_fails_unsupported_content(data_files, version, rgb,
+                                             palette):
+    spr = open_spr(data_files['201.spr'])
+    with pytest.raises(ValueError):
+        build_spr([spr.get_indexed(0)], [spr.image(2)] if rgb else [],
+                  spr.palette if palette else None, version)
+
+
+def test_optimize_merges_and_quantizes(data_files):
+    spr = open_spr(data_files['201.spr'])
+    optimized = optimize(spr, trim=False)
+    result = SPR(optimized.data)
+    assert optimized.remap == (0, 1, 0, 1)
+    assert len(result) == 2
+    for index, new_index in enumerate(optimized.remap):
+        assert result.image(new_index) == spr.image(index)
+
+
+def test_optimize_without_dedup_keeps_images(data_files):
+    spr = open_spr(data_files['201.spr'])
+    optimized = optimize(spr, dedup=False, quantize_rgb=False, trim=False)
+    result = SPR(optimized.data)
+    assert optimized.remap == (0, 1, 2, 3)
+    for index in range(len(spr)):
+        assert result.image(index) == spr.image(index)
+
+
+def test_optimize_trims_margins_evenly():
+    palette = Palette.from_colors([Color(0, 0, 0, 0), Color(1, 2, 3, 255)])
+    indices = bytearray(5 * 4)
+    indices[1 * 5 + 1] = 1  # the only visible pixel is at (1, 1)
+    indices[2 * 5 + 2] = 1  # and (2, 2)
+    data = build_spr([IndexedImage(5, 4, indices)], palette=palette)
+    optimized = SPR(optimize(SPR(data)).data)
+    # one column is removed from each side, and one row from each end
+    assert optimized.size(0) == (3, 2)
+    assert optimized.get_indexed(0) == b'\x01\x00\x00\x00\x01\x00'
+
+
+def test_optimize_trims_sprite(data_files):
+    spr = open_spr(data_files['201.spr'])
+    result = SPR(optimize(spr).data)
+    assert result.size(1) == (2, 2)
+    assert result.image(1) == spr.image(1).crop(2, 2, 4, 4)
+
+
+def test_quantize_fails_for_unknown_colors():
+    palette = Palette.from_colors([Color(0, 0, 0, 0), Color(1, 2, 3, 255)])
+    assert quantize(RGBAImage(1, 1, b'\x01\x02\x03\xff'), palette) == b'\x01'
+    assert quantize(RGBAImage(1, 1, b'\x01\x02\x04\xff'), palette) is None
+    assert quantize(RGBAImage(1, 1, b'\x01\x02\x03\x80'), palette) is None
+
+
+@pytest.mark.parametrize('wrap', (bytes, bytearray, memoryview))
+def test_spr_accepts_buffers(data_files, wrap):
+    with open(data_files['201.spr'], 'rb') as f:
+        data = f.read()
+    spr = SPR(wrap(data))
+    assert len(spr) == 4
+    assert spr.image(3) == open_spr(data_files['201.spr']).image(3)
+
+
+def test_spr_accepts_memory_maps(data_files):
+    with open(data_files['201.spr'], 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    spr = SPR(mapped)
+    assert spr.image(1).width == 6
+
+
+def test_spr_does_not_copy_data(data_files):
+    with open(data_files['201.spr'], 'rb') as f:
+        data = bytearray(f.read())
+    spr = SPR(data)
+    # changes to the source are seen by the sprite
+    data[-1024:] = bytes(1024)
+    assert spr.palette == Palette.from_pal(bytes(1024))
+
+
+def test_spr_from_grf_shares_file_data(data_files):
+    stream = io.BytesIO()
+    with GRFWriter(stream) as writer, open(data_files['201.spr'], 'rb') as f:
+        writer.add('201.spr', f.read())
+    spr = GRF(stream).open('201.spr')
+    assert isinstance(spr.parser.data, memoryview)
+    assert spr.image(2) == open_spr(data_files['201.spr']).image(2)
+
+
+def test_spr_parse_shares_grf_file_data(data_files):
+    stream = io.BytesIO()
+    with GRFWriter(stream) as writer, open(data_files['201.spr'], 'rb') as f:
+        writer.add('201.spr', f.read())
+    grf = GRF(stream)
+    grf_file = GRFFile('201.spr', grf.index['201.spr'], grf.stream)
+    spr = parse(grf_file)
+    # the sprite reads the decompressed data itself, not a copy of it
+    assert spr.parser.data.obj is grf_file.data